@@ -0,0 +1,255 @@
+# This is the non-blocking front end of the system controller
+
+import threading
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+
+try:
+    from SystemController import SystemController
+except ImportError:
+    from components.SystemController import SystemController
+
+print("AsyncSystemController imported")
+
+
+# ------------------------------------------------------------------------------------------------------------------------------------------
+class AsyncSystemController:
+    """
+    Future-returning variant of SystemController
+
+    Every command returns a concurrent.futures.Future that resolves to the
+    same error codes SystemController returns. Instrument work runs on a
+    single instrument thread (the ADL bridge takes one command at a time),
+    uploads, sign in and sign out in order on their own thread and health
+    checks on a small server pool, so a scan can run while the
+    previous sample uploads and the server is being checked.
+
+    Futures can be cancelled with cancel() / cancel_all(). A command that has
+    not started yet is dropped; a runLabMachine whose scan already started
+    skips its upload, and if it is streaming the scan is also aborted (a
+    bridge that cannot abort finishes it and the CSV stays on disk).
+    """
+
+    SERVER_WORKERS = 2
+
+    # ------------------------------------------------------------------------------------------------------------------------------------------
+    def __init__(self, PROJECT_ROOT=None, system_controller=None, **kwargs):
+        print(
+            "[AsyncSystemController][RECEIVED] __init__ "
+            f"system_controller={type(system_controller).__name__}"
+        )
+        if system_controller is None:
+            system_controller = SystemController(PROJECT_ROOT, **kwargs)
+        self.system = system_controller
+        self.debug = bool(getattr(system_controller, "debug", False))
+
+        self._instrument = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="instrument"
+        )
+        self._upload = ThreadPoolExecutor(max_workers=1, thread_name_prefix="upload")
+        self._server = ThreadPoolExecutor(
+            max_workers=self.SERVER_WORKERS, thread_name_prefix="server"
+        )
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+        print("[AsyncSystemController][EXECUTED] __init__ executors started")
+
+    def _print_received(self, command: str, payload=None) -> None:
+        print(f"[AsyncSystemController][RECEIVED] {command} payload={payload}")
+
+    def _print_executed(self, command: str, result=None) -> None:
+        print(f"[AsyncSystemController][EXECUTED] {command} result={result}")
+
+    def _debug(self, message: str) -> None:
+        if self.debug:
+            print(f"[AsyncSystemController] {message}")
+
+    def _track(self, future: Future) -> Future:
+        with self._pending_lock:
+            self._pending.add(future)
+
+        def _untrack(done):
+            with self._pending_lock:
+                self._pending.discard(done)
+
+        future.add_done_callback(_untrack)
+        return future
+
+    @staticmethod
+    def _settle(future: Future, result=None, exc=None) -> None:
+        # the caller may have cancelled the outer future in the meantime
+        try:
+            if exc is not None:
+                future.set_exception(exc)
+            else:
+                future.set_result(result)
+        except InvalidStateError:
+            pass
+
+    def _chain(self, first: Future, outer: Future, then) -> None:
+        """Resolves outer with then(result of first), or with first's failure."""
+
+        def _done(done):
+            if outer.cancelled():
+                return
+            if done.cancelled():
+                outer.cancel()
+                return
+            exc = done.exception()
+            if exc is not None:
+                self._settle(outer, exc=exc)
+                return
+            try:
+                then(done.result())
+            except Exception as err:
+                self._settle(outer, exc=err)
+
+        first.add_done_callback(_done)
+
+    # ------------------------------------------------------------------------------------------------------------------------------------------
+    def startUp(self) -> Future:
+        """Starts the ADL bridge and checks ICN at the same time."""
+        self._print_received("startUp")
+        outer = Future()
+        inst = self._instrument.submit(self.system.InstController.setup)
+        serv = self._server.submit(self.system._server_ready)
+        outer.add_done_callback(lambda f: f.cancelled() and serv.cancel())
+
+        def _instrument_done(InstConn):
+            if not InstConn:
+                self._settle(outer, 100)
+                return
+            self._chain(
+                serv,
+                outer,
+                lambda ServConn: self._settle(outer, 000 if ServConn else 110),
+            )
+
+        self._chain(inst, outer, _instrument_done)
+        return self._track(outer)
+
+    def signIn(self, username) -> Future:
+        self._print_received("signIn", {"username": username})
+        # same thread as signOut and uploads, so a sign in cannot overtake
+        # the sign out (and uploads) of the user before
+        return self._track(self._upload.submit(self.system.signIn, username))
+
+    def signOut(self) -> Future:
+        self._print_received("signOut")
+        # goes through the upload thread so it flushes after any upload in flight
+        return self._track(self._upload.submit(self.system.signOut))
+
+    def checkServer(self) -> Future:
+        """Server health check, runs alongside scans and uploads."""
+        return self._track(self._server.submit(self.system._server_ready))
+
+    def checkInstrument(self) -> Future:
+        return self._track(self._instrument.submit(self.system._instrument_ready))
+
+    # ------------------------------------------------------------------------------------------------------------------------------------------
+    def runLabMachine(self, progress=None) -> Future:
+        """
+        Scans on the instrument thread, then stages and uploads on the upload
+        thread, so the next runLabMachine can start scanning straight away.
+
+        Args:
+            progress (callable): called on the instrument thread with each
+                chunk of points while the scan runs
+
+        Returns:
+            Future: resolves to (error code, Sample)
+        """
+        self._print_received("runLabMachine")
+        outer = Future()
+        token = object()
+        capture = self._instrument.submit(self.system._capture_sample, progress, token)
+
+        def _abort_capture(f):
+            if not f.cancelled() or capture.cancel():
+                return
+            # only this run's scan, the instrument may have moved on to the next one
+            if capture.running() and not capture.done():
+                self.system.abortScan(token)
+
+        outer.add_done_callback(_abort_capture)
+
+        def _captured(result):
+            code, sample, owner = result
+            if code != 000:
+                self._settle(outer, (code, sample))
+                return
+            upload = self._upload.submit(
+                self._upload_unless_cancelled, outer, sample, owner
+            )
+            self._chain(upload, outer, lambda code: self._settle(outer, (code, sample)))
+
+        self._chain(capture, outer, _captured)
+        outer.add_done_callback(
+            lambda f: f.cancelled()
+            or f.exception()
+            or self._print_executed("runLabMachine", f.result())
+        )
+        return self._track(outer)
+
+    def _upload_unless_cancelled(self, outer: Future, sample, owner):
+        if outer.cancelled():
+            self._debug(f"runLabMachine() cancelled, not uploading {sample}")
+            return None
+        return self.system._upload_sample(sample, owner)
+
+    def takeBlank(self, filename=None) -> Future:
+        self._print_received("takeBlank", {"filename": filename})
+        return self._track(self._instrument.submit(self.system.takeBlank, filename))
+
+    def setBlank(self, data) -> Future:
+        self._print_received("setBlank", {"data": data})
+        return self._track(self._instrument.submit(self.system.setBlank, data))
+
+    def takeSample(self) -> Future:
+        self._print_received("takeSample")
+        return self._track(self._instrument.submit(self.system.takeSample))
+
+    # ------------------------------------------------------------------------------------------------------------------------------------------
+    def cancel(self, future: Future) -> bool:
+        """
+        Cancels one command returned by this controller
+
+        Returns:
+            bool: True if the command will not (fully) run
+        """
+        cancelled = future.cancel()
+        self._debug(f"cancel() -> {cancelled}")
+        return cancelled
+
+    def cancel_all(self) -> int:
+        """
+        Cancels every command still pending
+
+        Returns:
+            int: the number of commands cancelled
+        """
+        self._print_received("cancel_all")
+        with self._pending_lock:
+            pending = list(self._pending)
+        cancelled = sum(1 for future in pending if future.cancel())
+        self._print_executed("cancel_all", cancelled)
+        return cancelled
+
+    def _stop_after_uploads(self):
+        # let the upload in flight finish before the server session is closed
+        self._upload.submit(lambda: None).result()
+        return self.system.stopProgram()
+
+    def stopProgram(self, cancel_pending: bool = True) -> Future:
+        """Shuts the instrument down after the commands already queued (unless cancelled)."""
+        self._print_received("stopProgram")
+        if cancel_pending:
+            self.cancel_all()
+        stop = self._instrument.submit(self._stop_after_uploads)
+
+        def _shutdown(_):
+            self._upload.shutdown(wait=False)
+            self._server.shutdown(wait=False)
+            self._instrument.shutdown(wait=False)
+
+        stop.add_done_callback(_shutdown)
+        return stop
@@ -0,0 +1,20 @@
+# This is the cache of parsed blank spectra
+
+try:
+    from Spectrum import SpectrumCache
+except ImportError:
+    from components.Spectrum import SpectrumCache
+
+print("BlankCache module loaded")
+
+
+class BlankCache(SpectrumCache):
+    """
+    LRU cache of validated blanks
+
+    Keyed by path, mtime and size like every SpectrumCache, and big enough to
+    hold the few standard blanks used during a lab period, so switching
+    between them with set_blank only costs a stat() call.
+    """
+
+    MAX_ENTRIES = 8
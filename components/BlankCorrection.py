@@ -0,0 +1,61 @@
+# This is the blank correction used on every scan
+
+import numpy as np
+
+print("BlankCorrection module loaded")
+
+NEAREST = "nearest"
+LINEAR = "linear"
+METHODS = (NEAREST, LINEAR)
+
+
+def align_blank(blank_waves, blank_abs, waves, method: str = NEAREST) -> np.ndarray:
+    """
+    Looks up the blank absorbance at each sample wavelength
+
+    Args:
+        blank_waves (array): blank wavelengths, any order
+        blank_abs (array): blank absorbance, same length
+        waves (array): wavelengths of the sample
+        method (str): "nearest" takes the closest blank point, "linear"
+            interpolates between the two around it; both hold the end values
+            outside the blank range
+
+    Returns:
+        np.ndarray: blank absorbance aligned to waves
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown blank alignment {method!r}, use one of {METHODS}")
+    blank_waves = np.asarray(blank_waves, dtype=np.float64)
+    blank_abs = np.asarray(blank_abs, dtype=np.float64)
+    waves = np.asarray(waves, dtype=np.float64)
+
+    # scans run from long to short wavelengths, the lookups want ascending order
+    order = np.argsort(blank_waves, kind="stable")
+    blank_waves = blank_waves[order]
+    blank_abs = blank_abs[order]
+
+    if method == LINEAR:
+        return np.interp(waves, blank_waves, blank_abs)
+
+    right = np.clip(np.searchsorted(blank_waves, waves), 0, len(blank_waves) - 1)
+    left = np.clip(right - 1, 0, len(blank_waves) - 1)
+    # on a tie take the longer wavelength, as the old row-by-row search did
+    take_right = np.abs(blank_waves[right] - waves) <= np.abs(waves - blank_waves[left])
+    return blank_abs[np.where(take_right, right, left)]
+
+
+def subtract_blank(
+    sample: np.ndarray, blank: np.ndarray, method: str = NEAREST
+) -> np.ndarray:
+    """
+    Args:
+        sample (np.ndarray): (n, 2) wavelength/absorbance rows of the scan
+        blank (np.ndarray): (m, 2) wavelength/absorbance rows of the blank
+
+    Returns:
+        np.ndarray: a new (n, 2) array with the blank subtracted from the absorbance
+    """
+    corrected = np.array(sample, dtype=np.float64, copy=True)
+    corrected[:, 1] -= align_blank(blank[:, 0], blank[:, 1], sample[:, 0], method)
+    return corrected
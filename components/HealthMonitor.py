@@ -0,0 +1,175 @@
+# This is the health monitor for the instrument and ICN connections
+
+import threading
+import time
+
+print("HealthMonitor module loaded")
+
+
+class HealthMonitor:
+    """
+    Caches whether the instrument bridge and ICN are reachable
+
+    Each target has a probe (e.g. an ADL PING or an ICN connection-check) and
+    a time to live. A fresh status is returned straight from the cache. A
+    stale "up" status is still returned immediately and refreshed in the
+    background; a "down" or unknown status is probed on the spot, so a
+    reconnect is noticed on the very next command. Nothing is probed unless
+    a caller asks, so an idle app does not keep pinging the bridge mailbox.
+
+    Callers that learn a target's state from real traffic (a scan came back,
+    an upload went through) report it with mark(), which saves a probe.
+    """
+
+    def __init__(self, debug: bool = False):
+        self.debug = bool(debug)
+
+        self._targets = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def _debug(self, message: str) -> None:
+        if self.debug:
+            print(f"[HealthMonitor] {message}")
+
+    def _print_executed(self, command: str, result=None) -> None:
+        print(f"[HealthMonitor][EXECUTED] {command} result={result}")
+
+    def add_target(self, name: str, probe, ttl_s: float) -> None:
+        """
+        Registers something to watch
+
+        Args:
+            name (str): the target name, e.g. "instrument"
+            probe (callable): returns True if the target is reachable
+            ttl_s (float): how long a probe result stays fresh
+        """
+        with self._lock:
+            self._targets[name] = {
+                "probe": probe,
+                "ttl_s": ttl_s,
+                "ok": None,
+                "checked_at": 0.0,
+                # a caller got a stale status, the refresher should probe it
+                "requested": False,
+                "probe_lock": threading.Lock(),
+            }
+
+    def _age(self, target: dict) -> float:
+        return time.monotonic() - target["checked_at"]
+
+    def _probe(self, name: str) -> bool:
+        target = self._targets[name]
+        checked_before = target["checked_at"]
+        with target["probe_lock"]:
+            # another thread probed while we waited, use its answer
+            if target["checked_at"] != checked_before:
+                return bool(target["ok"])
+            try:
+                ok = bool(target["probe"]())
+            except Exception as exc:
+                self._debug(f"_probe() {name} raised {exc}")
+                ok = False
+        self.mark(name, ok)
+        self._print_executed(f"probe {name}", ok)
+        return ok
+
+    def is_ready(self, name: str) -> bool:
+        """
+        Returns:
+            bool: the cached status of the target, probing only if it is down or unknown
+        """
+        target = self._targets[name]
+        ok = target["ok"]
+        if ok and self._age(target) < target["ttl_s"]:
+            return True
+        if ok and self.running():
+            self._debug(f"is_ready() {name} stale, refreshing in background")
+            with self._lock:
+                target["requested"] = True
+            self._wake.set()
+            return True
+        return self._probe(name)
+
+    def status(self) -> dict:
+        """
+        Returns:
+            dict: name -> {"ok": bool or None, "age_s": seconds since last check}
+        """
+        return {
+            name: {
+                "ok": target["ok"],
+                "age_s": self._age(target) if target["checked_at"] else None,
+            }
+            for name, target in self._targets.items()
+        }
+
+    def mark(self, name: str, ok: bool) -> None:
+        """Records the status of a target learnt from a real command."""
+        target = self._targets[name]
+        with self._lock:
+            target["ok"] = bool(ok)
+            target["checked_at"] = time.monotonic()
+
+    def invalidate(self, name: str) -> None:
+        """Forgets the cached status so the next is_ready() probes again."""
+        target = self._targets[name]
+        with self._lock:
+            target["ok"] = None
+            target["checked_at"] = 0.0
+
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        """Starts the thread that refreshes stale targets callers have asked about."""
+        if self.running():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="HealthMonitor", daemon=True
+        )
+        self._thread.start()
+        self._debug("start() background refresh running")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def refresh(self, force: bool = False) -> dict:
+        """
+        Probes every target whose status has gone stale
+
+        Returns:
+            dict: name -> status of every target probed
+        """
+        results = {}
+        for name, target in list(self._targets.items()):
+            if force or self._age(target) >= target["ttl_s"]:
+                results[name] = self._probe(name)
+        return results
+
+    def _requested(self) -> list:
+        with self._lock:
+            names = [
+                name for name, target in self._targets.items() if target["requested"]
+            ]
+            for name in names:
+                self._targets[name]["requested"] = False
+        return names
+
+    def _run(self) -> None:
+        # sleeps until is_ready() hands over a stale target, never on a timer
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            if self._stopping.is_set():
+                break
+            for name in self._requested():
+                if self._age(self._targets[name]) >= self._targets[name]["ttl_s"]:
+                    self._probe(name)
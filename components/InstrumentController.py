@@ -7,17 +7,54 @@
 # from datetime import datetime
 # import json
 
+import functools
+import itertools
+import queue
 import shutil
+import threading
 import time
 import uuid
-import winreg
 import subprocess
 
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from pathlib import Path
 
+try:
+    import winreg
+except ImportError:  # not on Windows, the mailbox has to be swapped for a stand-in
+    winreg = None
+
+try:
+    from Mailbox import WinregMailbox
+    from OutputWatcher import OutputWatcher
+    from LatencyModel import LatencyModel
+    from BlankCache import BlankCache
+    from Spectrum import RECENT, SpectrumFormatError, load_spectrum, write_spectrum
+    import BlankCorrection
+except ImportError:
+    from components.Mailbox import WinregMailbox
+    from components.OutputWatcher import OutputWatcher
+    from components.LatencyModel import LatencyModel
+    from components.BlankCache import BlankCache
+    from components.Spectrum import RECENT, SpectrumFormatError, load_spectrum, write_spectrum
+    from components import BlankCorrection
+
+import numpy as np
+
 print("InstrumentController module loaded")
 
 
+def _exclusive(method):
+    """Runs an instrument command with the registry mailbox to itself."""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._mailbox_lock:
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
 class InstrumentController:
     """
     Communicates with the instrument
@@ -31,6 +68,10 @@ class InstrumentController:
     # constants for sub-regirstries
     REG_Q_COMMAND = "Command"
     REG_Q_COMMAND_ID = "CommandId"
+    # set by the controller to stop the running SCAN early, cleared by the bridge
+    REG_Q_ABORT = "Abort"
+    # epoch seconds by which the controller gives up on the command
+    REG_Q_DEADLINE = "Deadline"
     REG_P_FILENAME = "Filename"
     REG_P_WAVE_START = "WavelengthStart"
     REG_P_WAVE_STOP = "WavelengthStop"
@@ -41,22 +82,56 @@ class InstrumentController:
     REG_S_ERROR = "Error"
     REG_S_STATUS = "Status"
     REG_S_FILE_COUNTER = "FileCounter"
+    # what the bridge last applied, written by it after each SETUP as Name=value|Name=value
+    REG_S_APPLIED_PARAMS = "AppliedParams"
+    # counter the bridge bumps about once a second while its loop runs
+    REG_S_HEARTBEAT = "Heartbeat"
+    # the Deadline of the command being run, copied by the bridge as it goes BUSY
+    REG_S_BUSY_UNTIL = "BusyUntil"
+    # "1" from a bridge that streams its scans and honours Queue\Abort
+    REG_S_STREAMING = "Streaming"
+    APPLIED_SEPARATOR = "|"
 
     ADL_FILE = r".\components\MailboxCheck.adl"
+    # runtime state under PROJECT_ROOT, shared with the staged samples
+    STATE_DIR = "scans"
     SCAN_FOLDER = (
         "C:\\Users\\Agilent Cary 60\\Documents\\SoftwareDev - dont delete\\COS-397-Black-2025\\Scans\\"
     )
     POLL_INTERVAL_S = 0.1
+    POLL_MIN_S = 0.01
+    NOTIFY_WAIT_MAX_S = 1.0
     TIMEOUT_S = 10.0
     TIMEOUT_MULTIPLIER = 1.25
     TIMEOUT_CONTANT = 5
+    OUTPUT_WAIT_S = 8.0
+    SETUP_TIMEOUT_S = 30.0
+    SHUTDOWN_TIMEOUT_S = 5.0
+    # a bridge whose heartbeat does not move for this long is taken for dead
+    HEARTBEAT_STALE_S = 3.0
+    # rows acquired so far are appended to the result path plus this suffix
+    PARTIAL_SUFFIX = ".partial"
+    STREAM_POLL_S = 0.1
+    # commands whose durations are learned for timeouts and estimates;
+    # LAUNCH is the SETUP that waits for a newly started bridge
+    LEARNED_COMMANDS = ("SCAN", "BLANK", "SETUP", "LAUNCH")
+
+    # transport shared with the ADL bridge, the registry unless replaced
+    MAILBOX = None
 
     WAVE_MIN = 190
     WAVE_MAX = 1100
     SAT_MIN = 0.0125
     SAT_MAX = 1000
 
-    def __init__(self, PROJECT_ROOT, debug: bool = False):
+    def __init__(self, PROJECT_ROOT, debug: bool = False, state_dir=None):
+        """
+        Args:
+            PROJECT_ROOT (String): the project folder
+            debug (bool): print debug tracing
+            state_dir (String): where the learned command durations are kept,
+                the project's scans folder (next to the staged samples) by default
+        """
         self.PROJECT_ROOT = PROJECT_ROOT
         if debug:
             print(
@@ -68,16 +143,28 @@ class InstrumentController:
         self.blank_start = 0
         self.blank_end = 0
         self.blank_data = []
+        # how blank points are matched to scan points, "nearest" or "linear"
+        self.blank_method = BlankCorrection.NEAREST
+        # parsed blanks, so switching between a few of them skips the file reads
+        self.blank_cache = BlankCache(debug=self.debug)
         self._adl_process = None
-
-
-        self.instrumentParams = {
-            self.REG_P_FILENAME: self.SCAN_FOLDER,
-            self.REG_P_WAVE_START: 900,
-            self.REG_P_WAVE_STOP: 300,
-            self.REG_P_SATURATION: 0.1,
-            self.REG_P_BANDWIDTH: 2,
-        }
+        # one command at a time through the mailbox, health checks run on other threads
+        self._mailbox_lock = threading.Lock()
+        # pipelined command queue, started on first use
+        self._commands = queue.Queue()
+        self._queue_thread = None
+        self._queue_lock = threading.Lock()
+        self._results = None
+        self._batch_ids = itertools.count(1)
+        # the SCAN stream_sample is following, for abort_scan
+        self._streaming = None
+        # index of the files the bridge writes, started on the first scan
+        self._output_watcher = None
+        # how long commands really took, for timeouts and the capture estimate
+        self.state_dir = state_dir or str(Path(PROJECT_ROOT) / self.STATE_DIR)
+        self.latency = LatencyModel(self.state_dir, debug=self.debug)
+
+        self.instrumentParams = self._default_params()
 
         if debug:
             print("[InstrumentController][EXECUTED] __init__ result=initialized")
@@ -98,63 +185,82 @@ class InstrumentController:
             f"command={command}, payload={payload}"
         )
 
-    @staticmethod
-    def _ensure_key(subkey: str) -> None:
-        winreg.CreateKey(winreg.HKEY_CURRENT_USER, subkey)
+    def is_busy(self) -> bool:
+        """
+        Returns:
+            bool: True while a command is using the mailbox
+        """
+        return self._mailbox_lock.locked()
+
+    @classmethod
+    def _mailbox(cls):
+        if cls.MAILBOX is None:
+            cls.MAILBOX = WinregMailbox()
+        return cls.MAILBOX
+
+    @classmethod
+    def _ensure_key(cls, subkey: str) -> None:
+        cls._mailbox().ensure_key(subkey)
 
     @classmethod
     def _reg_set(cls, subkey: str, name: str, value: str) -> None:
-        cls._ensure_key(subkey)
-        with winreg.OpenKey(
-            winreg.HKEY_CURRENT_USER, subkey, 0, winreg.KEY_SET_VALUE
-        ) as key:
-            winreg.SetValueEx(key, name, 0, winreg.REG_SZ, value)
+        cls._mailbox().set(subkey, name, value)
 
-    @staticmethod
-    def _reg_get(subkey: str, name: str, default: str = "") -> str:
-        try:
-            with winreg.OpenKey(
-                winreg.HKEY_CURRENT_USER, subkey, 0, winreg.KEY_QUERY_VALUE
-            ) as key:
-                value, _ = winreg.QueryValueEx(key, name)
-                return str(value)
-        except FileNotFoundError:
-            return default
-        except OSError:
-            return default
+    @classmethod
+    def _reg_get(cls, subkey: str, name: str, default: str = "") -> str:
+        return cls._mailbox().get(subkey, name, default)
 
     @classmethod
-    def _clear_mailbox(cls, reset_file_counter: bool = False) -> None:
-        cls._ensure_key(cls.QUEUE_KEY)
-        cls._ensure_key(cls.PARAM_KEY)
-        cls._ensure_key(cls.STATE_KEY)
+    def _reg_set_many(cls, subkey: str, values: dict) -> None:
+        cls._mailbox().write_batch(subkey, values)
 
+    @classmethod
+    def _clear_mailbox(cls, reset_file_counter: bool = False) -> None:
         status = cls._reg_get(cls.STATE_KEY, "Status", "")
         if status.upper() == "BUSY":
             print("WARNING: ADL bridge reports Status=BUSY. Clearing mailbox anyway.")
 
-        cls._reg_set(cls.QUEUE_KEY, cls.REG_Q_COMMAND, "")
-        cls._reg_set(cls.QUEUE_KEY, cls.REG_Q_COMMAND_ID, "")
-        cls._reg_set(cls.PARAM_KEY, cls.REG_P_FILENAME, "")
-        cls._reg_set(cls.PARAM_KEY, cls.REG_P_WAVE_START, "")
-        cls._reg_set(cls.PARAM_KEY, cls.REG_P_WAVE_STOP, "")
-        cls._reg_set(cls.PARAM_KEY, cls.REG_P_SATURATION, "")
-        cls._reg_set(cls.PARAM_KEY, cls.REG_P_BANDWIDTH, "")
-        cls._reg_set(cls.STATE_KEY, cls.REG_S_REPLY_ID, "")
-        cls._reg_set(cls.STATE_KEY, cls.REG_S_RESULT_PATH, "")
-        cls._reg_set(cls.STATE_KEY, cls.REG_S_ERROR, "")
-        cls._reg_set(cls.STATE_KEY, cls.REG_S_STATUS, "IDLE")
-
+        # one key open per subkey
+        cls._reg_set_many(
+            cls.QUEUE_KEY, {cls.REG_Q_COMMAND: "", cls.REG_Q_COMMAND_ID: ""}
+        )
+        cls._reg_set_many(
+            cls.PARAM_KEY,
+            {
+                cls.REG_P_FILENAME: "",
+                cls.REG_P_WAVE_START: "",
+                cls.REG_P_WAVE_STOP: "",
+                cls.REG_P_SATURATION: "",
+                cls.REG_P_BANDWIDTH: "",
+            },
+        )
+        state = {
+            cls.REG_S_REPLY_ID: "",
+            cls.REG_S_RESULT_PATH: "",
+            cls.REG_S_ERROR: "",
+            cls.REG_S_STATUS: "IDLE",
+        }
         if reset_file_counter:
-            cls._reg_set(cls.STATE_KEY, cls.REG_S_FILE_COUNTER, "0")
+            state[cls.REG_S_FILE_COUNTER] = "0"
+        cls._reg_set_many(cls.STATE_KEY, state)
 
     @classmethod
-    def _send_command(cls, command: str, params: dict = {}) -> str:
+    def _send_command(cls, command: str, params: dict = {}, timeout_s: float = None) -> str:
         cmd_id = str(uuid.uuid4())
-        for reg in params:
-            cls._reg_set(cls.PARAM_KEY, reg, str(params.get(reg, "")))
-        cls._reg_set(cls.QUEUE_KEY, cls.REG_Q_COMMAND_ID, cmd_id)
-        cls._reg_set(cls.QUEUE_KEY, cls.REG_Q_COMMAND, command)
+        deadline = time.time() + (cls.TIMEOUT_S if timeout_s is None else timeout_s)
+        if params:
+            cls._reg_set_many(
+                cls.PARAM_KEY, {reg: str(value) for reg, value in params.items()}
+            )
+        # the bridge acts as soon as it sees a Command, so its id goes in first
+        cls._reg_set_many(
+            cls.QUEUE_KEY,
+            {
+                cls.REG_Q_COMMAND_ID: cmd_id,
+                cls.REG_Q_DEADLINE: f"{deadline:.3f}",
+                cls.REG_Q_COMMAND: command,
+            },
+        )
         print(
             "[InstrumentController][TX] destination=ADL_Bridge_Registry, "
             f"command={command}, payload={{'cmd_id': '{cmd_id}', 'params': {params}}}"
@@ -166,19 +272,36 @@ class InstrumentController:
         if timeout_s is None:
             timeout_s = cls.TIMEOUT_S
 
+        mailbox = cls._mailbox()
+        # wake on writes to the State key when the transport supports it,
+        # otherwise poll, quickly at first and backing off for long scans
+        notified = mailbox.watch(cls.STATE_KEY)
+        interval = cls.POLL_MIN_S
         deadline = time.time() + timeout_s
-        while time.time() < deadline:
-            reply_id = cls._reg_get(cls.STATE_KEY, cls.REG_S_REPLY_ID, "")
-            if reply_id == cmd_id:
-                return {
-                    "reply_id": reply_id,
-                    "status": cls._reg_get(cls.STATE_KEY, cls.REG_S_STATUS, ""),
-                    "result_path": cls._reg_get(
-                        cls.STATE_KEY, cls.REG_S_RESULT_PATH, ""
-                    ),
-                    "error": cls._reg_get(cls.STATE_KEY, cls.REG_S_ERROR, ""),
-                }
-            time.sleep(cls.POLL_INTERVAL_S)
+        try:
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                reply_id = cls._reg_get(cls.STATE_KEY, cls.REG_S_REPLY_ID, "")
+                if reply_id == cmd_id:
+                    return {
+                        "reply_id": reply_id,
+                        "status": cls._reg_get(cls.STATE_KEY, cls.REG_S_STATUS, ""),
+                        "result_path": cls._reg_get(
+                            cls.STATE_KEY, cls.REG_S_RESULT_PATH, ""
+                        ),
+                        "error": cls._reg_get(cls.STATE_KEY, cls.REG_S_ERROR, ""),
+                    }
+                if notified:
+                    mailbox.wait_for_change(
+                        cls.STATE_KEY, min(remaining, cls.NOTIFY_WAIT_MAX_S)
+                    )
+                else:
+                    time.sleep(min(interval, remaining))
+                    interval = min(interval * 2, cls.POLL_INTERVAL_S)
+        finally:
+            mailbox.unwatch(cls.STATE_KEY)
 
         return {
             "reply_id": "",
@@ -190,11 +313,16 @@ class InstrumentController:
     @staticmethod
     def _is_success(reply: dict) -> bool:
         status = str(reply.get("status", "")).upper()
-        return status not in {"", "TIMEOUT", "ERROR", "FAILED", "OFFLINE"}
+        return status not in {"", "TIMEOUT", "ERROR", "FAILED", "OFFLINE", "ABORTED"}
 
     def _send_and_wait(
-        self, command: str, params: dict = {}, timeout_s: float = None
+        self, command: str, params: dict = {}, timeout_s: float = None, learn_as: str = None
     ) -> dict:
+        """
+        Args:
+            learn_as (str): the history the duration goes to, if not the
+                command's own, e.g. "LAUNCH" for the SETUP of a new bridge
+        """
         self._print_received(
             "_send_and_wait",
             {
@@ -208,8 +336,23 @@ class InstrumentController:
         )
         self._print_tx("ADL_Bridge_Registry", command, params)
 
-        cmd_id = self._send_command(command, params)
+        started = time.monotonic()
+        cmd_id = self._send_command(command, params, timeout_s)
         reply = self._wait_for_reply(cmd_id, timeout_s=timeout_s)
+        learned = learn_as or command
+        elapsed = time.monotonic() - started
+        timed_out = reply.get("status") == "TIMEOUT"
+        if timed_out:
+            # it would have taken at least as long as we waited
+            elapsed = max(elapsed, timeout_s or self.TIMEOUT_S)
+        if learned in self.LEARNED_COMMANDS and (timed_out or self._is_success(reply)):
+            self.latency.record(
+                learned,
+                self._latency_params(learned),
+                elapsed,
+                self._nominal_time(learned),
+                censored=timed_out,
+            )
 
         self._debug(f"RX reply={reply}")
         self._print_executed("_send_and_wait", {"cmd_id": cmd_id, "reply": reply})
@@ -219,124 +362,97 @@ class InstrumentController:
     def _get_result_path(self) -> str:
         return self._reg_get(self.STATE_KEY, self.REG_S_RESULT_PATH, "")
 
+    def _scan_folder(self) -> Path:
+        return Path(self.instrumentParams.get(self.REG_P_FILENAME) or self.SCAN_FOLDER)
+
+    def _watcher(self, since: float = None) -> OutputWatcher:
+        """
+        The output watcher for the current scan folder, started if needed
+
+        Args:
+            since (float): when the command being resolved was sent, so a
+                watcher started after it still sees that command's output
+        """
+        folder = str(self._scan_folder())
+        watcher = self._output_watcher
+        if watcher is None or watcher.folder != folder:
+            if watcher is not None:
+                watcher.stop()
+            watcher = self._output_watcher = OutputWatcher(folder, debug=self.debug)
+        return watcher.start(since)
+
     def _resolve_existing_output_path(
         self,
         requested_path: Path,
         reply_path: str,
         started_at: float,
-        wait_s: float = 8.0,
+        wait_s: float = None,
     ) -> str:
-        deadline = time.time() + wait_s
-
-        while time.time() < deadline:
-            candidates = []
+        """
+        Finds the file a SCAN or BLANK wrote, waiting for it if the bridge
+        reported it before it is visible (e.g. on the network share)
 
-            if reply_path:
-                rp = Path(reply_path)
-                candidates.append(rp)
-                if not rp.is_absolute():
-                    candidates.append(Path(self.PROJECT_ROOT) / rp)
-                    candidates.append(Path(self.SCAN_FOLDER) / rp.name)
+        Args:
+            requested_path (Path): the file name that was asked for, or None
+            reply_path (str): the ResultPath the bridge wrote
+            started_at (float): time.time() when the command was sent, or None
+                to not fall back to the newest file in the scan folder
+            wait_s (float): how long to wait, OUTPUT_WAIT_S by default
 
+        Returns:
+            str: the path of the output, or "" if it never appeared
+        """
+        candidates = []
+        if reply_path:
+            rp = Path(reply_path)
+            candidates.append(rp)
+            if not rp.is_absolute():
+                candidates.append(Path(self.PROJECT_ROOT) / rp)
+                candidates.append(self._scan_folder() / rp.name)
+        if requested_path is not None:
             candidates.append(requested_path)
-            candidates.append(Path(self.SCAN_FOLDER) / requested_path.name)
-
-            seen = set()
-            for candidate in candidates:
-                c = str(candidate)
-                if c in seen:
-                    continue
-                seen.add(c)
-                if candidate.exists():
-                    return str(candidate)
-
-            scan_dir = Path(self.SCAN_FOLDER)
-            if scan_dir.exists():
-                recent_csv = [
-                    p
-                    for p in scan_dir.glob("*.csv")
-                    if p.is_file() and p.stat().st_mtime >= (started_at - 2.0)
-                ]
-                if recent_csv:
-                    newest = max(recent_csv, key=lambda p: p.stat().st_mtime)
-                    return str(newest)
-
-            time.sleep(0.2)
-
-        return ""
+            candidates.append(self._scan_folder() / requested_path.name)
+
+        unique = list(dict.fromkeys(str(c) for c in candidates))
+        # the usual case, the file is already there and the watcher is not needed
+        existing = next((c for c in unique if Path(c).is_file()), "")
+        return existing or self._watcher(started_at).resolve(
+            unique,
+            since=started_at,
+            timeout_s=self.OUTPUT_WAIT_S if wait_s is None else wait_s,
+        )
+
+    def _load_spectrum(self, filename, cache=RECENT):
+        return load_spectrum(
+            filename,
+            wave_limits=(self.WAVE_MIN, self.WAVE_MAX),
+            sat_limits=(self.SAT_MIN, self.SAT_MAX),
+            cache=cache,
+        )
 
     def _read_blank(self, filename):
-        if not self.validate_scan(filename):
-            return
-        blankList = []
-        waveStart = 0
-        waveEnd = 0
         try:
-            with open(filename) as blankFile:
-                # skip the fist two lines
-                settings = blankFile.readline().split("-")
-                waveStart = float(settings[1])
-                waveEnd = float(settings[2])
-                next(blankFile)
-                for line in blankFile:
-                    if line != "\n":
-                        values = [float(i) for i in line.strip().split(",")[:2]]
-                        blankList.append(values)
-            self.blank_file = filename
-            self.blank_start = waveStart
-            self.blank_end = waveEnd
-            self.blank_data = blankList
+            blank = self._load_spectrum(filename, cache=self.blank_cache)
+        except (SpectrumFormatError, FileNotFoundError):
+            print("Not a valid blank file:", filename)
             return
-        except ValueError:
-            print("ValueError while reading blank file:", filename)
-            return
-        except FileNotFoundError:
-            return  # should neven get here because of validate_scan
+        self.blank_file = filename
+        self.blank_start = blank.wave_start
+        self.blank_end = blank.wave_stop
+        self.blank_data = blank.data
 
     def _compare_to_blank(self, filename):
         if self.blank_file == "":
             return  # nothing to compare to
-        if not self.validate_scan(filename):
-            return
-        fileData = []
         try:
-            with open(filename) as scanFile:
-                # skip the fist two lines
-                fileData.append(scanFile.readline())
-                fileData.append(scanFile.readline())
-                for line in scanFile:
-                    if line != "\n":
-                        values = [float(i) for i in line.strip().split(",")[:2]]
-                        aproxIndex = int(self.blank_start - values[0])
-
-                        waveNeg = self.blank_data[aproxIndex - 1][0]
-                        waveZero = self.blank_data[aproxIndex][0]
-
-                        try:
-                            wavePos = self.blank_data[aproxIndex + 1][0]
-                        except IndexError:
-                            wavePos = 0
-
-                        minDif = abs(waveNeg - values[0])
-                        waveIndex = aproxIndex - 1
-                        if abs(waveZero - values[0]) < minDif:
-                            minDif = abs(waveZero - values[0])
-                            waveIndex = aproxIndex
-                        if abs(wavePos - values[0]) < minDif:
-                            waveIndex = aproxIndex + 1
-
-                        fileData.append(str(values[0]) + "," + str(values[1] - self.blank_data[waveIndex][1]) + ",\n")
-
-            with open(filename, "w") as scanFile:
-                for line in fileData:
-                    scanFile.write(line)
-
-            return
-        except ValueError:
-            print("ValueError while reading scan file:", filename)
+            scan = self._load_spectrum(filename)
+        except (SpectrumFormatError, FileNotFoundError):
+            print("Not a valid scan file:", filename)
             return
-        except FileNotFoundError:
-            return  # should neven get here because of validate_scan
+        corrected = BlankCorrection.subtract_blank(
+            scan.data, self.blank_data, self.blank_method
+        )
+        write_spectrum(scan.with_data(corrected))
 
     def validate_scan(self, filename):
         """
@@ -349,42 +465,84 @@ class InstrumentController:
             boolean: True if valid, false if invalid
         """
         try:
-            with open(filename) as blankFile:
-                settings = blankFile.readline().split("-")
-                if len(settings) < 4:
-                    return False
+            self._load_spectrum(filename)
+            return True
+        except (SpectrumFormatError, FileNotFoundError):
+            return False
 
-                name = settings[0].split("_")
-                satSettings = settings[3].split(",")
-                if len(satSettings) < 3 or len(name) < 1 or name[0] != "UVVis":
-                    return False
+    def _default_params(self) -> dict:
+        return {
+            self.REG_P_FILENAME: self.SCAN_FOLDER,
+            self.REG_P_WAVE_START: 900,
+            self.REG_P_WAVE_STOP: 300,
+            self.REG_P_SATURATION: 0.1,
+            self.REG_P_BANDWIDTH: 2,
+        }
 
-                fields = blankFile.readline().split(",")
-                if len(fields) < 2 or fields[0] != "Wavelength (nm)" or fields[1] != "Abs":
-                    return False
+    @classmethod
+    def _applied_params(cls) -> dict:
+        """
+        Returns:
+            dict: the settings the bridge reports as in effect, empty if unknown
+        """
+        raw = cls._reg_get(cls.STATE_KEY, cls.REG_S_APPLIED_PARAMS, "")
+        applied = {}
+        for item in raw.split(cls.APPLIED_SEPARATOR):
+            name, sep, value = item.partition("=")
+            if sep:
+                applied[name] = value
+        return applied
 
-                waveStart = float(settings[1])
-                waveEnd = float(settings[2])
-                saturation = float(satSettings[0])
-                if waveStart > self.WAVE_MAX or waveEnd < self.WAVE_MIN or waveStart <= waveEnd:
-                    return False
-                if saturation < self.SAT_MIN or saturation > self.SAT_MAX:
-                    return False
+    @staticmethod
+    def _same_setting(applied, wanted) -> bool:
+        if applied is None:
+            return False
+        try:
+            # the bridge writes 900 for 900.0 and the dialogs may pass strings
+            return float(applied) == float(wanted)
+        except (TypeError, ValueError):
+            return str(applied) == str(wanted)
 
-                prevWave = waveStart + 1
-                for line in blankFile:
-                    if line != "\n":
-                        values = [float(i) for i in line.strip().split(",")[:2]]
-                        waveDif = prevWave - values[0]
-                        if waveDif > 1.5 or waveDif < 0.5:
-                            return False
-                        prevWave = values[0]
+    def _settings_diff(self, params: dict, force: bool = False) -> dict:
+        """
+        Returns:
+            dict: the params that are not in effect on the bridge yet, all of them if forced
+        """
+        if force:
+            return dict(params)
+        applied = self._applied_params()
+        return {
+            name: value
+            for name, value in params.items()
+            if not self._same_setting(applied.get(name), value)
+        }
 
-                return True
-        except ValueError:
-            return False
-        except FileNotFoundError:
-            return False
+    def _apply_settings(self, force: bool = False, learn_as: str = "SETUP") -> bool:
+        """
+        Sends a SETUP with only the instrumentParams that changed, or nothing
+        if they are all in effect already; the bridge keeps the settings it is
+        not sent
+
+        Args:
+            force (bool): send every parameter, e.g. if the instrument was
+                reconfigured outside the app
+            learn_as (str): "LAUNCH" for the first SETUP of a new bridge, which
+                waits for the ADL application to start and is timed apart
+
+        Returns:
+            Boolean: True if the settings are in effect
+        """
+        changed = self._settings_diff(self.instrumentParams, force)
+        if not changed:
+            self._debug("_apply_settings() skipped SETUP, settings already in effect")
+            return True
+        reply = self._send_and_wait(
+            "SETUP", changed, timeout_s=self._command_timeout(learn_as), learn_as=learn_as
+        )
+        result = self._is_success(reply)
+
+        self._clear_mailbox()
+        return result
 
     def getScanTime(self):
         """
@@ -407,27 +565,144 @@ class InstrumentController:
         estimate = (self.WAVE_MAX - self.WAVE_MIN) * self.instrumentParams[self.REG_P_SATURATION]
         return estimate
 
-    def setup(self):
+    def _latency_params(self, command: str) -> dict:
+        """The settings that decide how long a command runs."""
+        params = self.instrumentParams
+        if command == "SCAN":
+            names = (self.REG_P_WAVE_START, self.REG_P_WAVE_STOP, self.REG_P_SATURATION, self.REG_P_BANDWIDTH)
+        elif command == "BLANK":
+            names = (self.REG_P_SATURATION, self.REG_P_BANDWIDTH)
+        else:
+            names = ()
+        return {name: params.get(name) for name in names}
+
+    def _nominal_time(self, command: str):
+        if command == "SCAN":
+            return self.getScanTime()
+        if command == "BLANK":
+            return self.getBlankTime()
+        return None
+
+    def _command_timeout(self, command: str) -> float:
         """
-        Sets up the instrument
+        Seconds to wait for a command: just above the p99 of its past
+        durations with the current settings, or the nominal formula until
+        there is enough history
+        """
+        nominal = self._nominal_time(command)
+        if nominal is None:
+            fallback = self.SETUP_TIMEOUT_S
+        else:
+            fallback = nominal * self.TIMEOUT_MULTIPLIER + self.TIMEOUT_CONTANT
+        timeout = self.latency.timeout(command, self._latency_params(command), fallback, nominal)
+        if command == "LAUNCH":
+            # a cold start after a reboot can take far longer than the last few
+            return max(timeout, self.SETUP_TIMEOUT_S)
+        return timeout
+
+    def estimateTime(self, command: str = "SCAN"):
+        """
+        Estimates how long a SCAN or BLANK will take with the current settings,
+        from past durations when there are enough of them
+
+        Returns:
+            float: estimated time in seconds
+        """
+        return self.latency.estimate(
+            command, self._latency_params(command), self._nominal_time(command)
+        )
+
+    def _bridge_alive(self, wait_s: float = None) -> bool:
+        """
+        Checks for a running bridge by waiting for its heartbeat to move
+
+        A bridge in the middle of a scan does not beat, so BUSY also counts
+        as alive until the deadline of its command (BusyUntil) has passed.
+        After that, or without a deadline, the heartbeat has to move.
+
+        Returns:
+            bool: True if the heartbeat changed within wait_s, HEARTBEAT_STALE_S by default
         """
-        self._print_received("setup")
+        first = self._reg_get(self.STATE_KEY, self.REG_S_HEARTBEAT, "")
+        status = self._reg_get(self.STATE_KEY, self.REG_S_STATUS, "").upper()
+        if not first or status == "STOPPED":
+            return False
+        if status == "BUSY":
+            busy_until = self._reg_get(self.STATE_KEY, self.REG_S_BUSY_UNTIL, "")
+            try:
+                if time.time() < float(busy_until) + self.HEARTBEAT_STALE_S:
+                    return True
+            except ValueError:
+                pass
+
+        mailbox = self._mailbox()
+        notified = mailbox.watch(self.STATE_KEY)
+        deadline = time.time() + (self.HEARTBEAT_STALE_S if wait_s is None else wait_s)
         try:
-            self._debug("setup() starting mailbox clear + PING")
-            # Clears the windows registry
-            self._clear_mailbox(reset_file_counter=False)
+            while True:
+                if self._reg_get(self.STATE_KEY, self.REG_S_HEARTBEAT, "") != first:
+                    return True
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                if notified:
+                    mailbox.wait_for_change(self.STATE_KEY, min(remaining, self.NOTIFY_WAIT_MAX_S))
+                else:
+                    time.sleep(min(remaining, self.POLL_INTERVAL_S))
+        finally:
+            mailbox.unwatch(self.STATE_KEY)
+
+    def _launch_bridge(self) -> bool:
+        """Starts a new ADL bridge and sends it every setting."""
+        # a hung bridge left running would go on taking commands next to the new one
+        proc = self._adl_process
+        owned = proc is not None and proc.poll() is None
+        if owned or self._reg_get(self.STATE_KEY, self.REG_S_HEARTBEAT, ""):
+            self._debug("_launch_bridge() stopping the previous bridge")
+            if not self._stop_bridge(proc if owned else None):
+                self._debug("_launch_bridge() previous bridge did not stop")
+        self._adl_process = None
 
-            # Launches the ADL file that communicates with the instrument
-            self._adl_process = subprocess.Popen(self.ADL_FILE, shell=True)
+        # Clears the windows registry
+        self._clear_mailbox(reset_file_counter=False)
 
-            params = self.instrumentParams
-            reply = self._send_and_wait("SETUP", params, timeout_s=30.0)
-            self._debug(f"setup() -> {reply}")
+        # a new bridge starts from its own defaults, forget what the last one applied
+        self._reg_set_many(
+            self.STATE_KEY,
+            {self.REG_S_APPLIED_PARAMS: "", self.REG_S_HEARTBEAT: "", self.REG_S_STREAMING: ""},
+        )
 
-            result = self._is_success(reply)
-            self._print_executed("setup", result)
+        # Launches the ADL file that communicates with the instrument
+        self._adl_process = subprocess.Popen(self.ADL_FILE, shell=True)
 
-            self._clear_mailbox()
+        return self._apply_settings(force=True, learn_as="LAUNCH")
+
+    @_exclusive
+    def setup(self, force: bool = False, reuse_bridge: bool = True):
+        """
+        Sets up the instrument
+
+        A bridge left running by an earlier session (e.g. after a crash) is
+        reattached to instead of launching another one, and only the settings
+        it does not already have are sent.
+
+        Args:
+            force (bool): send every setting even if the bridge reports it in effect
+            reuse_bridge (bool): False always launches a new bridge
+        """
+        self._print_received("setup", {"force": force, "reuse_bridge": reuse_bridge})
+        try:
+            if reuse_bridge and self._bridge_alive():
+                self._debug("setup() reattaching to the running bridge")
+                # not ours to kill, shutdown() asks it to stop instead
+                self._adl_process = None
+                self._clear_mailbox(reset_file_counter=False)
+                result = self._apply_settings(force=force)
+            else:
+                self._debug("setup() launching the bridge")
+                result = self._launch_bridge()
+            self._debug(f"setup() -> {result}")
+            self._print_executed("setup", result)
             return result
         except OSError as exc:
             self._debug(f"setup() registry error: {exc}")
@@ -435,6 +710,28 @@ class InstrumentController:
             self._clear_mailbox()
             return False
 
+    @_exclusive
+    def ensure_bridge(self) -> bool:
+        """
+        Relaunches the bridge if its heartbeat has gone stale
+
+        Returns:
+            Boolean: True if a bridge is running, already or after the relaunch
+        """
+        self._print_received("ensure_bridge")
+        try:
+            if self._bridge_alive():
+                self._print_executed("ensure_bridge", True)
+                return True
+            self._debug("ensure_bridge() heartbeat stale, relaunching the bridge")
+            result = self._launch_bridge()
+        except OSError as exc:
+            self._debug(f"ensure_bridge() registry error: {exc}")
+            result = False
+        self._print_executed("ensure_bridge", result)
+        return result
+
+    @_exclusive
     def ping(self) -> bool:
         """
         Lightweight connectivity check against the instrument bridge.
@@ -449,6 +746,7 @@ class InstrumentController:
         self._clear_mailbox()
         return result
 
+    @_exclusive
     def take_blank(self, filename):
         """
         Sends a command to the instrument to take a blank sample and saves it to a file
@@ -466,8 +764,8 @@ class InstrumentController:
         out_target.parent.mkdir(parents=True, exist_ok=True)
 
         params = {self.REG_P_FILENAME: Path(filename).name}
-        reply = self._send_and_wait("BLANK", params,
-                                    timeout_s=self.getBlankTime() * self.TIMEOUT_MULTIPLIER + self.TIMEOUT_CONTANT)
+        started_at = time.time()
+        reply = self._send_and_wait("BLANK", params, timeout_s=self._command_timeout("BLANK"))
 
         if not self._is_success(reply):
             self._debug(f"take_blank() failed reply={reply}")
@@ -476,9 +774,16 @@ class InstrumentController:
             self._clear_mailbox()
             return False
 
-        blank = self._get_result_path()
+        blank = self._resolve_existing_output_path(
+            out_target, self._get_result_path(), started_at
+        )
+        if not blank:
+            self._debug("take_blank() the bridge reported DONE but no blank file appeared")
+            self._print_executed("take_blank", {"success": False, "reply": reply})
+            self._clear_mailbox()
+            return False
 
-        if blank and out_target != Path(blank):
+        if out_target != Path(blank):
             shutil.copy2(blank, out_target)
             blank = str(out_target)
 
@@ -522,6 +827,7 @@ class InstrumentController:
         self._debug("clear_blank() blank reference removed")
         self._print_executed("clear_blank", True)
 
+    @_exclusive
     def take_sample(self, filename):
         """
         Sends a command to the instrument to take a sample and converts the sample to a Sample object
@@ -534,12 +840,12 @@ class InstrumentController:
         """
         self._print_received("take_sample", {"blank_file": self.blank_file or None})
 
-        params = {"filename": filename}
+        params = {self.REG_P_FILENAME: filename}
 
         self._debug(f"take_sample() params={params}")
 
-        reply = self._send_and_wait("SCAN", params,
-                                    timeout_s=self.getScanTime() * self.TIMEOUT_MULTIPLIER + self.TIMEOUT_CONTANT)
+        started_at = time.time()
+        reply = self._send_and_wait("SCAN", params, timeout_s=self._command_timeout("SCAN"))
 
         if not self._is_success(reply):
             self._debug(f"take_sample() failed reply={reply}")
@@ -547,14 +853,28 @@ class InstrumentController:
 
             return None
 
-        sample = self._get_result_path()
+        sample = self._resolve_existing_output_path(
+            Path(filename), self._get_result_path(), started_at
+        )
+        if not sample:
+            self._debug("take_sample() the bridge reported DONE but no scan file appeared")
+            self._print_executed("take_sample", None)
+            self._clear_mailbox()
+            return None
         self._compare_to_blank(sample)
 
         self._clear_mailbox()
         return sample
 
-    def changeSettings(self, waveStart="", waveStop="", saturation="", bandwidth=""):
+    @_exclusive
+    def changeSettings(self, waveStart="", waveStop="", saturation="", bandwidth="", force=False):
+        """
+        Changes the scan settings, sending a SETUP only for the ones that are
+        not already in effect on the bridge
 
+        Returns:
+            Boolean: True if the settings are in effect
+        """
         self.instrumentParams[self.REG_P_WAVE_START] = (
             waveStart or self.instrumentParams[self.REG_P_WAVE_START]
         )
@@ -568,11 +888,7 @@ class InstrumentController:
             bandwidth or self.instrumentParams[self.REG_P_BANDWIDTH]
         )
 
-        reply = self._send_and_wait("SETUP", self.instrumentParams)
-        result = self._is_success(reply)
-
-        self._clear_mailbox()
-        return result
+        return self._apply_settings(force=force)
 
     def getSettings(self):
         """
@@ -584,6 +900,7 @@ class InstrumentController:
 
         return self.instrumentParams
 
+    @_exclusive
     def reset(self):
         params = {}
         reply = self._send_and_wait("RESET", params)
@@ -591,19 +908,313 @@ class InstrumentController:
         self._clear_mailbox()
         return result
 
-    def resetSettings(self):
-        self.instrumentParams = {
-            "waveStart": 900,
-            "waveStop": 300,
-            "saturation": 0.1,
-            "bandwidth": 2,
-        }
-        params = self.instrumentParams
-        reply = self._send_and_wait("SETUP", params)
-        result = self._is_success(reply)
+    @_exclusive
+    def resetSettings(self, force=False):
+        """
+        Puts the scan settings back to the defaults, keeping the scan folder
 
-        self._clear_mailbox()
-        return result
+        Returns:
+            Boolean: True if the settings are in effect
+        """
+        defaults = self._default_params()
+        defaults[self.REG_P_FILENAME] = self.instrumentParams.get(
+            self.REG_P_FILENAME, self.SCAN_FOLDER
+        )
+        self.instrumentParams = defaults
+        return self._apply_settings(force=force)
+
+    # ------------------------------------------------------------------------------------------------------------------------------------------
+    # pipelined command queue
+    #
+    # The bridge runs one command at a time and wipes Param when it finishes,
+    # so the next command can only be staged once the previous reply is in.
+    # The queue does exactly that: as soon as a reply arrives the next command
+    # is written, without clearing the mailbox in between (the bridge already
+    # resets Param and State itself), and reply post-processing such as blank
+    # subtraction runs on a separate thread so it does not hold up the bridge.
+
+    def _start_queue(self) -> None:
+        with self._queue_lock:
+            if self._queue_thread is not None and self._queue_thread.is_alive():
+                return
+            self._results = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="instrument-results"
+            )
+            self._queue_thread = threading.Thread(
+                target=self._run_queue, name="InstrumentQueue", daemon=True
+            )
+            self._queue_thread.start()
+
+    def _run_queue(self) -> None:
+        while True:
+            item = self._commands.get()
+            if item is None:
+                break
+            future = item["future"]
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                with self._mailbox_lock:
+                    params = item["params"]
+                    if item["prepare"] is not None:
+                        # worked out now, after the commands queued before it ran
+                        params = item["prepare"]()
+                        if params is None:
+                            self._results.submit(self._resolve, future, None, True)
+                            continue
+                    reply = self._send_and_wait(
+                        item["command"], params, timeout_s=item["timeout_s"]
+                    )
+                    if self._commands.empty():
+                        self._clear_mailbox()
+            except Exception as exc:
+                future.set_exception(exc)
+                self._cancel_batch(item["batch"])
+                continue
+
+            if not self._is_success(reply):
+                self._cancel_batch(item["batch"])
+            self._results.submit(self._resolve, future, item["then"], reply)
+
+    @staticmethod
+    def _resolve(future: Future, then, reply: dict) -> None:
+        try:
+            future.set_result(then(reply) if then else reply)
+        except Exception as exc:
+            future.set_exception(exc)
+
+    def _cancel_batch(self, batch) -> None:
+        """Drops the queued commands that came after a failed one in the same batch."""
+        if batch is None:
+            return
+        with self._commands.mutex:
+            queued = [item for item in self._commands.queue if item is not None]
+        for item in queued:
+            if item["batch"] == batch:
+                item["future"].cancel()
+
+    def _enqueue(self, command, params=None, timeout_s=None, then=None, batch=None, prepare=None) -> Future:
+        """
+        Args:
+            prepare (callable): if given, called on the queue thread just before
+                the command is sent and returns its params, or None to skip the
+                command (the Future then resolves to True)
+        """
+        self._start_queue()
+        future = Future()
+        self._commands.put(
+            {
+                "future": future,
+                "command": command,
+                "params": dict(params or {}),
+                "timeout_s": timeout_s,
+                "then": then,
+                "batch": batch,
+                "prepare": prepare,
+            }
+        )
+        self._debug(f"_enqueue() {command} queued, {self._commands.qsize()} waiting")
+        return future
+
+    def submit(self, command: str, params: dict = None, timeout_s: float = None) -> Future:
+        """
+        Queues a raw bridge command
+
+        Returns:
+            Future: resolves to the reply dict of the command
+        """
+        return self._enqueue(command, params, timeout_s)
+
+    def submit_many(self, commands) -> list:
+        """
+        Queues several commands back to back, e.g. a SETUP followed by SCANs.
+        If one of them fails the rest of the batch is cancelled.
+
+        Args:
+            commands (list): (command, params) pairs
+
+        Returns:
+            list: a Future per command, resolving to its reply dict
+        """
+        batch = next(self._batch_ids)
+        return [
+            self._enqueue(command, params, batch=batch) for command, params in commands
+        ]
+
+    def queue_setup(self, batch=None, force: bool = False) -> Future:
+        """
+        Queues a SETUP with the instrumentParams that are not in effect yet,
+        the non-blocking changeSettings; nothing is sent if they all are
+
+        Returns:
+            Future: resolves to True if the settings are in effect
+        """
+        return self._enqueue(
+            "SETUP",
+            timeout_s=self._command_timeout("SETUP"),
+            then=self._is_success,
+            batch=batch,
+            prepare=lambda: self._settings_diff(self.instrumentParams, force) or None,
+        )
+
+    def queue_scan(self, filename, batch=None) -> Future:
+        """
+        Queues a SCAN, the non-blocking take_sample
+
+        Returns:
+            Future: resolves to the sample path, or None if the scan failed
+        """
+        return self._enqueue(
+            "SCAN",
+            {self.REG_P_FILENAME: filename},
+            timeout_s=self._command_timeout("SCAN"),
+            then=self._scan_result,
+            batch=batch,
+        )
+
+    def queue_scans(self, filenames, setup: bool = False) -> list:
+        """
+        Queues a series of scans, optionally after a SETUP, as one batch
+
+        Returns:
+            list: the Futures of the SETUP (if any) and of each scan
+        """
+        batch = next(self._batch_ids)
+        futures = [self.queue_setup(batch)] if setup else []
+        return futures + [self.queue_scan(name, batch) for name in filenames]
+
+    def _scan_result(self, reply: dict):
+        if not self._is_success(reply):
+            self._debug(f"_scan_result() failed reply={reply}")
+            return None
+        # the reply has no file name to fall back on, only wait for its own path
+        sample = self._resolve_existing_output_path(None, reply["result_path"], None)
+        if not sample:
+            self._debug(f"_scan_result() no file at {reply['result_path']}")
+            return None
+        self._compare_to_blank(sample)
+        return sample
+
+    # ------------------------------------------------------------------------------------------------------------------------------------------
+    # streaming scans
+    #
+    # While it acquires, a bridge that supports it appends each row to the
+    # result path plus PARTIAL_SUFFIX and removes that file when the scan is
+    # written, and it stops early with Status ABORTED if Queue\Abort is set.
+    # Such a bridge sets State\Streaming. MailboxCheck.adl cannot do either
+    # while Collect runs and clears it, so with it the stream only ends with
+    # the finished scan and can_abort() is False.
+
+    def _read_partial(self, partial: Path, offset: int, pending: str):
+        """
+        Reads the rows appended to the partial file since offset
+
+        The file is opened for each read, not held, so the bridge can still
+        remove it on Windows.
+
+        Returns:
+            tuple: ((k, 2) array of the new complete rows, new offset, text of an unfinished row)
+        """
+        try:
+            with open(partial, "r") as f:
+                f.seek(offset)
+                text = pending + f.read()
+                offset = f.tell()
+        except OSError:
+            return np.empty((0, 2)), offset, pending
+        lines = text.split("\n")
+        rows = []
+        for line in lines[:-1]:
+            fields = line.split(",")
+            try:
+                rows.append((float(fields[0]), float(fields[1])))
+            except (ValueError, IndexError):
+                continue  # header lines
+        points = np.array(rows, dtype=np.float64).reshape(-1, 2)
+        if len(points) and self.blank_file:
+            # same correction the finished scan gets, so the curve does not jump at the end
+            points = BlankCorrection.subtract_blank(points, self.blank_data, self.blank_method)
+        return points, offset, lines[-1]
+
+    def stream_sample(self, filename, poll_s: float = None):
+        """
+        Takes a sample like take_sample, yielding the points as the bridge acquires them
+
+        Closing the generator before it finishes aborts the scan.
+
+        Args:
+            filename (String): the name of the file that the sample will be saved to
+            poll_s (float): how often to look for new rows
+
+        Yields:
+            np.ndarray: (k, 2) wavelength/absorbance rows acquired since the last
+            yield, blank corrected if a blank is set
+
+        Returns:
+            str: the sample path (the generator's return value), or None if the
+            scan failed or was aborted
+        """
+        self._print_received("stream_sample", {"filename": filename})
+        partial = self._scan_folder() / (Path(filename).name + self.PARTIAL_SUFFIX)
+        poll_s = self.STREAM_POLL_S if poll_s is None else poll_s
+        future = self._streaming = self.queue_scan(filename)
+        offset, pending = 0, ""
+        try:
+            while True:
+                finished = future.done()
+                points, offset, pending = self._read_partial(partial, offset, pending)
+                if len(points):
+                    yield points
+                if finished:
+                    break
+                wait([future], timeout=poll_s)
+        except GeneratorExit:
+            self.abort_scan()
+            raise
+        finally:
+            self._streaming = None
+
+        sample = None if future.cancelled() or future.exception() else future.result()
+        self._print_executed("stream_sample", sample)
+        return sample
+
+    def can_abort(self) -> bool:
+        """
+        Whether the bridge can stop a running scan part way
+
+        Returns:
+            bool: True if the bridge reports State\\Streaming
+        """
+        try:
+            return self._reg_get(self.STATE_KEY, self.REG_S_STREAMING, "") == "1"
+        except OSError:
+            return False
+
+    def abort_scan(self) -> bool:
+        """
+        Stops the scan stream_sample is following: a queued scan is dropped,
+        a running one is asked to stop early
+
+        Returns:
+            bool: True if there was a scan to abort
+        """
+        future = self._streaming
+        if future is None or future.done():
+            return False
+        self._print_received("abort_scan")
+        if not future.cancel():
+            self._reg_set(self.QUEUE_KEY, self.REG_Q_ABORT, "1")
+        self._print_executed("abort_scan", True)
+        return True
+
+    def stop_queue(self, timeout: float = 5.0) -> None:
+        """Stops the command queue after the commands already queued."""
+        if self._queue_thread is None:
+            return
+        self._commands.put(None)
+        self._queue_thread.join(timeout)
+        self._queue_thread = None
+        self._results.shutdown(wait=True)
 
     def shutdown(self):
         """
@@ -613,8 +1224,46 @@ class InstrumentController:
             Boolean: True if successful
         """
         self._print_received("shutdown")
+        self.stop_queue()
+        if self._output_watcher is not None:
+            self._output_watcher.stop()
         proc = getattr(self, "_adl_process", None)
-        if proc and proc.poll() is None:
+        owned = proc is not None and proc.poll() is None
+        try:
+            running = owned or bool(self._reg_get(self.STATE_KEY, self.REG_S_HEARTBEAT, ""))
+        except OSError:
+            running = True
+        if not running:
+            self._print_executed("shutdown", True)
+            return True
+
+        # ask the bridge to quit, also when it was reattached rather than launched
+        with self._mailbox_lock:
+            stopped = self._stop_bridge(proc if owned else None)
+
+        self._print_executed("shutdown", stopped)
+        return stopped
+
+    def _stop_bridge(self, proc=None) -> bool:
+        """
+        Sends SHUTDOWN to the bridge and kills proc if it does not answer
+
+        The caller holds the mailbox lock.
+
+        Args:
+            proc (subprocess.Popen): the bridge process when it is ours to kill
+
+        Returns:
+            bool: True if the bridge acknowledged SHUTDOWN or was killed
+        """
+        stopped = False
+        try:
+            reply = self._send_and_wait("SHUTDOWN", {}, timeout_s=self.SHUTDOWN_TIMEOUT_S)
+            stopped = self._is_success(reply)
+        except OSError as exc:
+            self._debug(f"_stop_bridge() registry error: {exc}")
+
+        if not stopped and proc is not None and proc.poll() is None:
             self._print_tx("OS", "taskkill", {"pid": proc.pid, "tree": True})
             try:
                 subprocess.run(
@@ -623,12 +1272,7 @@ class InstrumentController:
                     capture_output=True,
                     text=True,
                 )
-                self._print_executed("shutdown", True)
-                return True
+                stopped = True
             except Exception as exc:
-                self._debug(f"shutdown() taskkill failed: {exc}")
-                self._print_executed("shutdown", False)
-                return False
-
-        self._print_executed("shutdown", True)
-        return True
+                self._debug(f"_stop_bridge() taskkill failed: {exc}")
+        return stopped
@@ -0,0 +1,194 @@
+# This is the record of how long instrument commands really take
+
+import math
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+print("LatencyModel module loaded")
+
+
+class LatencyModel:
+    """
+    SQLite history of SCAN, BLANK and SETUP durations per parameter set
+
+    Every successful command adds its duration under a key made of the
+    command and the settings that decide how long it runs (wavelength range,
+    saturation, bandwidth). Estimates are the median of the recent durations
+    for the key and timeouts sit just above their p99, so a hung bridge is
+    noticed soon after a real command would have finished. Until a key has
+    MIN_SAMPLES durations the caller's nominal figures are used, scaled by
+    how far off the nominal figures have been for that command so far.
+
+    A command that timed out is recorded as censored: it ran for at least
+    the time waited, so it counts as CENSORED_BACKOFF times that. A timeout
+    learned too tight therefore loosens after the first miss instead of
+    failing every command from then on.
+    """
+
+    LATENCY_FILE = "instrument_latency.sqlite3"
+    HISTORY = 50
+    MIN_SAMPLES = 3
+    QUANTILE = 0.99
+    TIMEOUT_MARGIN = 1.2
+    TIMEOUT_SLACK_S = 3.0
+    CENSORED_BACKOFF = 2.0
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS durations (
+            command TEXT NOT NULL,
+            params TEXT NOT NULL,
+            seconds REAL NOT NULL,
+            nominal REAL,
+            recorded_at REAL NOT NULL,
+            censored INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS durations_key ON durations (command, params, recorded_at);
+    """
+
+    def __init__(self, directory, debug: bool = False):
+        self.debug = bool(debug)
+        self.path = Path(directory) / self.LATENCY_FILE
+
+        self._lock = threading.Lock()
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = self._open(str(self.path))
+        except (OSError, sqlite3.Error) as exc:
+            # keep learning for this session even if the history cannot be stored
+            self._debug(f"__init__() cannot open {self.path}: {exc}, not persisting")
+            self._db = self._open(":memory:")
+
+    def _open(self, path: str) -> sqlite3.Connection:
+        db = sqlite3.connect(path, check_same_thread=False)
+        with db:
+            db.executescript(self._SCHEMA)
+            columns = [row[1] for row in db.execute("PRAGMA table_info(durations)")]
+            if "censored" not in columns:
+                # history written before timeouts were recorded
+                db.execute(
+                    "ALTER TABLE durations ADD COLUMN censored INTEGER NOT NULL DEFAULT 0"
+                )
+        return db
+
+    def _debug(self, message: str) -> None:
+        if self.debug:
+            print(f"[LatencyModel] {message}")
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    @staticmethod
+    def key(params: dict) -> str:
+        """The parameter part of a history key, stable for equal settings."""
+        return ",".join(f"{name}={params[name]}" for name in sorted(params or {}))
+
+    # ------------------------------------------------------------------------------------------------------------------------------------------
+    def record(
+        self,
+        command: str,
+        params: dict,
+        seconds: float,
+        nominal_s: float = None,
+        censored: bool = False,
+    ) -> None:
+        """
+        Adds the duration of a command, dropping the oldest beyond HISTORY
+
+        Args:
+            command (str): "SCAN", "BLANK", "SETUP" or "LAUNCH"
+            params (dict): the settings the command ran with
+            seconds (float): how long it took, or how long was waited if it timed out
+            nominal_s (float): what the nominal formula predicted, if there is one
+            censored (bool): the command timed out, it would have taken longer
+        """
+        key = self.key(params)
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO durations (command, params, seconds, nominal, recorded_at, censored) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    command,
+                    key,
+                    float(seconds),
+                    nominal_s,
+                    time.time(),
+                    int(bool(censored)),
+                ),
+            )
+            self._db.execute(
+                "DELETE FROM durations WHERE command = ? AND params = ? AND rowid NOT IN ("
+                "SELECT rowid FROM durations WHERE command = ? AND params = ? "
+                "ORDER BY recorded_at DESC LIMIT ?)",
+                (command, key, command, key, self.HISTORY),
+            )
+        self._debug(
+            f"record() {command} {key} {seconds:.2f} s{' (timed out)' if censored else ''}"
+        )
+
+    # a timed out command counts as CENSORED_BACKOFF times the time waited
+    _SECONDS = "CASE WHEN censored THEN seconds * ? ELSE seconds END"
+
+    def _durations(self, command: str, params: dict) -> list:
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {self._SECONDS} FROM durations WHERE command = ? AND params = ? "
+                "ORDER BY recorded_at DESC LIMIT ?",
+                (self.CENSORED_BACKOFF, command, self.key(params), self.HISTORY),
+            ).fetchall()
+        return sorted(row[0] for row in rows)
+
+    def _nominal_ratio(self, command: str):
+        """Median of actual / nominal over the command's recent history, or None."""
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {self._SECONDS} / nominal FROM durations "
+                "WHERE command = ? AND nominal > 0 ORDER BY recorded_at DESC LIMIT ?",
+                (self.CENSORED_BACKOFF, command, self.HISTORY),
+            ).fetchall()
+        if len(rows) < self.MIN_SAMPLES:
+            return None
+        return self._quantile(sorted(row[0] for row in rows), 0.5)
+
+    @staticmethod
+    def _quantile(values: list, q: float) -> float:
+        # nearest rank, with 50 samples the p99 is the slowest one
+        index = min(len(values) - 1, max(0, math.ceil(q * len(values)) - 1))
+        return values[index]
+
+    # ------------------------------------------------------------------------------------------------------------------------------------------
+    def estimate(self, command: str, params: dict, nominal_s: float = None):
+        """
+        Returns:
+            float: the expected duration in seconds, or nominal_s (scaled by
+            the learned ratio if there is one) while the key has too little history
+        """
+        durations = self._durations(command, params)
+        if len(durations) >= self.MIN_SAMPLES:
+            return self._quantile(durations, 0.5)
+        if nominal_s is None:
+            return durations[-1] if durations else None
+        ratio = self._nominal_ratio(command)
+        return nominal_s * ratio if ratio is not None else nominal_s
+
+    def timeout(
+        self, command: str, params: dict, fallback_s: float, nominal_s: float = None
+    ) -> float:
+        """
+        Args:
+            fallback_s (float): the timeout to use while there is too little history
+
+        Returns:
+            float: seconds to wait for the command before giving up
+        """
+        durations = self._durations(command, params)
+        if len(durations) >= self.MIN_SAMPLES:
+            expected = self._quantile(durations, self.QUANTILE)
+        else:
+            ratio = self._nominal_ratio(command) if nominal_s else None
+            if ratio is None:
+                return fallback_s
+            expected = nominal_s * ratio
+        return expected * self.TIMEOUT_MARGIN + self.TIMEOUT_SLACK_S
@@ -0,0 +1,424 @@
+# This is the mailbox the Instrument Controller and the ADL bridge talk through
+
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import winreg
+except ImportError:  # not on Windows, only the stand-in mailboxes can be used
+    winreg = None
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+print("Mailbox module loaded")
+
+
+class MailboxTransport(ABC):
+    """
+    Key/value store shared with the ADL bridge
+
+    Values are strings grouped under subkeys (the Queue, Param and State keys
+    of InstrumentController). A transport that can tell when a subkey changes
+    returns True from watch(); wait_for_change() then blocks until something
+    under that subkey is written. Transports that cannot do that are polled.
+    """
+
+    @abstractmethod
+    def ensure_key(self, subkey: str) -> None:
+        """Creates the subkey if it does not exist yet."""
+
+    @abstractmethod
+    def set(self, subkey: str, name: str, value: str) -> None:
+        """Writes one string value."""
+
+    @abstractmethod
+    def get(self, subkey: str, name: str, default: str = "") -> str:
+        """Reads one string value, or default if the key or value is missing."""
+
+    def write_batch(self, subkey: str, values: dict) -> None:
+        """
+        Writes several values of one subkey, in order, creating the subkey if needed
+
+        Backends override this to open the subkey once for the whole batch.
+        """
+        self.ensure_key(subkey)
+        for name, value in values.items():
+            self.set(subkey, name, value)
+
+    def watch(self, subkey: str) -> bool:
+        """
+        Starts tracking writes to a subkey
+
+        Returns:
+            bool: True if wait_for_change() can be used, False if the caller has to poll
+        """
+        return False
+
+    def wait_for_change(self, subkey: str, timeout_s: float) -> bool:
+        """
+        Blocks until the watched subkey is written or the timeout passes
+
+        Returns:
+            bool: True if the subkey changed since watch() or the last wait
+        """
+        return False
+
+    def unwatch(self, subkey: str) -> None:
+        """Stops tracking a subkey."""
+
+    def close(self) -> None:
+        pass
+
+
+class WinregMailbox(MailboxTransport):
+    """
+    Mailbox in HKEY_CURRENT_USER, the one the ADL bridge on the lab PC uses
+
+    Changes are picked up with RegNotifyChangeKeyValue, so a reply is seen as
+    soon as the bridge writes it instead of on the next poll.
+    """
+
+    REG_NOTIFY_CHANGE_LAST_SET = 0x00000004
+    WAIT_OBJECT_0 = 0
+
+    def __init__(self):
+        if winreg is None:
+            raise OSError("The registry mailbox is only available on Windows")
+        self._watches = {}
+        self._native = None
+
+    def ensure_key(self, subkey: str) -> None:
+        winreg.CreateKey(winreg.HKEY_CURRENT_USER, subkey)
+
+    def set(self, subkey: str, name: str, value: str) -> None:
+        self.ensure_key(subkey)
+        with winreg.OpenKey(
+            winreg.HKEY_CURRENT_USER, subkey, 0, winreg.KEY_SET_VALUE
+        ) as key:
+            winreg.SetValueEx(key, name, 0, winreg.REG_SZ, value)
+
+    def write_batch(self, subkey: str, values: dict) -> None:
+        # CreateKeyEx creates or opens the key, one handle for the whole batch
+        with winreg.CreateKeyEx(
+            winreg.HKEY_CURRENT_USER, subkey, 0, winreg.KEY_SET_VALUE
+        ) as key:
+            for name, value in values.items():
+                winreg.SetValueEx(key, name, 0, winreg.REG_SZ, str(value))
+
+    def get(self, subkey: str, name: str, default: str = "") -> str:
+        try:
+            with winreg.OpenKey(
+                winreg.HKEY_CURRENT_USER, subkey, 0, winreg.KEY_QUERY_VALUE
+            ) as key:
+                value, _ = winreg.QueryValueEx(key, name)
+                return str(value)
+        except FileNotFoundError:
+            return default
+        except OSError:
+            return default
+
+    def _load_native(self):
+        if self._native is None:
+            import ctypes
+            from ctypes import wintypes
+
+            advapi32 = ctypes.WinDLL("advapi32")
+            kernel32 = ctypes.WinDLL("kernel32")
+            advapi32.RegNotifyChangeKeyValue.argtypes = [
+                wintypes.HANDLE,
+                wintypes.BOOL,
+                wintypes.DWORD,
+                wintypes.HANDLE,
+                wintypes.BOOL,
+            ]
+            advapi32.RegNotifyChangeKeyValue.restype = wintypes.LONG
+            kernel32.CreateEventW.argtypes = [
+                wintypes.LPVOID,
+                wintypes.BOOL,
+                wintypes.BOOL,
+                wintypes.LPCWSTR,
+            ]
+            kernel32.CreateEventW.restype = wintypes.HANDLE
+            kernel32.WaitForSingleObject.argtypes = [wintypes.HANDLE, wintypes.DWORD]
+            kernel32.WaitForSingleObject.restype = wintypes.DWORD
+            kernel32.CloseHandle.argtypes = [wintypes.HANDLE]
+            self._native = (advapi32, kernel32)
+        return self._native
+
+    def _arm(self, subkey: str) -> bool:
+        advapi32, _ = self._native
+        key, event = self._watches[subkey]
+        # asynchronous: returns at once and signals the event on the next write
+        result = advapi32.RegNotifyChangeKeyValue(
+            key.handle, False, self.REG_NOTIFY_CHANGE_LAST_SET, event, True
+        )
+        return result == 0
+
+    def watch(self, subkey: str) -> bool:
+        self.unwatch(subkey)
+        try:
+            _, kernel32 = self._load_native()
+            self.ensure_key(subkey)
+            key = winreg.OpenKey(winreg.HKEY_CURRENT_USER, subkey, 0, winreg.KEY_NOTIFY)
+        except (OSError, AttributeError):
+            return False
+        event = kernel32.CreateEventW(None, False, False, None)
+        if not event:
+            key.Close()
+            return False
+        self._watches[subkey] = (key, event)
+        if not self._arm(subkey):
+            self.unwatch(subkey)
+            return False
+        return True
+
+    def wait_for_change(self, subkey: str, timeout_s: float) -> bool:
+        if subkey not in self._watches:
+            return False
+        _, kernel32 = self._native
+        _, event = self._watches[subkey]
+        waited = kernel32.WaitForSingleObject(event, max(int(timeout_s * 1000), 0))
+        if waited != self.WAIT_OBJECT_0:
+            return False
+        # notifications fire once, re-arm before the caller reads the new values
+        self._arm(subkey)
+        return True
+
+    def unwatch(self, subkey: str) -> None:
+        watch = self._watches.pop(subkey, None)
+        if watch is None:
+            return
+        key, event = watch
+        key.Close()
+        self._native[1].CloseHandle(event)
+
+    def close(self) -> None:
+        for subkey in list(self._watches):
+            self.unwatch(subkey)
+
+
+class InMemoryMailbox(MailboxTransport):
+    """
+    In-process stand-in for the registry, for tests and for profiling the
+    command protocol off the lab PC
+
+    Args:
+        notify (bool): support watch()/wait_for_change(); False makes callers poll
+    """
+
+    def __init__(self, notify: bool = True):
+        self.notify = bool(notify)
+        self._keys = {}
+        self._versions = {}
+        self._seen = {}
+        self._changed = threading.Condition()
+
+    def ensure_key(self, subkey: str) -> None:
+        with self._changed:
+            self._keys.setdefault(subkey, {})
+
+    def set(self, subkey: str, name: str, value: str) -> None:
+        with self._changed:
+            self._keys.setdefault(subkey, {})[name] = str(value)
+            self._versions[subkey] = self._versions.get(subkey, 0) + 1
+            self._changed.notify_all()
+
+    def write_batch(self, subkey: str, values: dict) -> None:
+        with self._changed:
+            keys = self._keys.setdefault(subkey, {})
+            for name, value in values.items():
+                keys[name] = str(value)
+            self._versions[subkey] = self._versions.get(subkey, 0) + 1
+            self._changed.notify_all()
+
+    def get(self, subkey: str, name: str, default: str = "") -> str:
+        with self._changed:
+            return self._keys.get(subkey, {}).get(name, default)
+
+    def watch(self, subkey: str) -> bool:
+        if not self.notify:
+            return False
+        with self._changed:
+            self._seen[subkey] = self._versions.get(subkey, 0)
+        return True
+
+    def wait_for_change(self, subkey: str, timeout_s: float) -> bool:
+        if subkey not in self._seen:
+            return False
+        with self._changed:
+            changed = self._changed.wait_for(
+                lambda: self._versions.get(subkey, 0) != self._seen[subkey],
+                max(timeout_s, 0),
+            )
+            self._seen[subkey] = self._versions.get(subkey, 0)
+        return changed
+
+    def unwatch(self, subkey: str) -> None:
+        with self._changed:
+            self._seen.pop(subkey, None)
+
+    def snapshot(self) -> dict:
+        """
+        Returns:
+            dict: a copy of every subkey and its values
+        """
+        with self._changed:
+            return {subkey: dict(values) for subkey, values in self._keys.items()}
+
+
+class MappedFileMailbox(MailboxTransport):
+    """
+    Mailbox in a memory-mapped file, shareable between processes
+
+    The file holds a small header (magic, write sequence, payload length)
+    followed by the JSON of every subkey. Writers take an OS file lock and
+    bump the sequence to an odd number while they rewrite the payload, so
+    readers in any process retry instead of reading a half-written mailbox.
+    Waiting for a change only watches the sequence number in the header.
+
+    Args:
+        path (str): the mailbox file, created if missing
+        size (int): bytes to map; the JSON of all values has to fit
+    """
+
+    SIZE = 64 * 1024
+    WAIT_POLL_S = 0.001
+    # a read waiting out a writer backs off up to READ_BACKOFF_MAX_S, and gives
+    # up after READ_TIMEOUT_S in case the writer died halfway through
+    READ_BACKOFF_MAX_S = 0.01
+    READ_TIMEOUT_S = 2.0
+    _MAGIC = b"ICMB"
+    _HEADER = struct.Struct("<4sQI")
+
+    def __init__(self, path, size: int = None):
+        self.path = Path(path)
+        self.size = size or self.SIZE
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._file = open(self.path, "a+b")
+        if os.path.getsize(self.path) < self.size:
+            self._file.truncate(self.size)
+        self._map = mmap.mmap(self._file.fileno(), self.size)
+        self._lock = threading.Lock()
+        self._seen = {}
+
+        with self._locked():
+            magic, _, _ = self._HEADER.unpack_from(self._map, 0)
+            if magic != self._MAGIC:
+                self._store({"keys": {}, "versions": {}}, 0)
+
+    @contextmanager
+    def _locked(self):
+        # the thread lock covers this process, the file lock other processes
+        with self._lock:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+                else:
+                    self._file.seek(0)
+                    msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _sequence(self) -> int:
+        return self._HEADER.unpack_from(self._map, 0)[1]
+
+    def _load(self) -> dict:
+        deadline = None
+        pause = 0.0
+        while True:
+            _, before, length = self._HEADER.unpack_from(self._map, 0)
+            if before % 2 == 0:
+                start = self._HEADER.size
+                payload = self._map[start : start + length]
+                if self._sequence() == before:
+                    return json.loads(payload.decode("utf-8"))
+            # a writer is halfway through, give it the CPU instead of spinning
+            if deadline is None:
+                deadline = time.monotonic() + self.READ_TIMEOUT_S
+            elif time.monotonic() > deadline:
+                raise OSError(
+                    f"Mailbox {self.path} stayed mid-write for {self.READ_TIMEOUT_S} s"
+                )
+            time.sleep(pause)
+            pause = min(max(pause * 2, self.WAIT_POLL_S / 10), self.READ_BACKOFF_MAX_S)
+
+    def _store(self, state: dict, sequence: int) -> None:
+        payload = json.dumps(state, separators=(",", ":")).encode("utf-8")
+        if self._HEADER.size + len(payload) > self.size:
+            raise OSError(f"Mailbox {self.path} is full ({self.size} bytes)")
+        self._HEADER.pack_into(self._map, 0, self._MAGIC, sequence + 1, len(payload))
+        self._map[self._HEADER.size : self._HEADER.size + len(payload)] = payload
+        self._HEADER.pack_into(self._map, 0, self._MAGIC, sequence + 2, len(payload))
+
+    def _update(self, subkey: str, values: dict) -> None:
+        with self._locked():
+            sequence = self._sequence()
+            state = self._load()
+            stored = state["keys"].setdefault(subkey, {})
+            for name, value in values.items():
+                stored[name] = str(value)
+            state["versions"][subkey] = state["versions"].get(subkey, 0) + 1
+            self._store(state, sequence)
+
+    def ensure_key(self, subkey: str) -> None:
+        if subkey not in self._load()["keys"]:
+            self._update(subkey, {})
+
+    def set(self, subkey: str, name: str, value: str) -> None:
+        self._update(subkey, {name: value})
+
+    def write_batch(self, subkey: str, values: dict) -> None:
+        self._update(subkey, values)
+
+    def get(self, subkey: str, name: str, default: str = "") -> str:
+        return self._load()["keys"].get(subkey, {}).get(name, default)
+
+    def _version(self, subkey: str) -> int:
+        return self._load()["versions"].get(subkey, 0)
+
+    def watch(self, subkey: str) -> bool:
+        self._seen[subkey] = (self._sequence(), self._version(subkey))
+        return True
+
+    def wait_for_change(self, subkey: str, timeout_s: float) -> bool:
+        if subkey not in self._seen:
+            return False
+        sequence, version = self._seen[subkey]
+        deadline = time.monotonic() + timeout_s
+        while True:
+            current = self._sequence()
+            # only parse the payload when something was written
+            if current != sequence and current % 2 == 0:
+                sequence = current
+                latest = self._version(subkey)
+                if latest != version:
+                    self._seen[subkey] = (sequence, latest)
+                    return True
+                self._seen[subkey] = (sequence, version)
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(self.WAIT_POLL_S)
+
+    def unwatch(self, subkey: str) -> None:
+        self._seen.pop(subkey, None)
+
+    def close(self) -> None:
+        self._map.close()
+        self._file.close()
@@ -0,0 +1,254 @@
+# This is the watcher for files the ADL bridge writes into the scans folder
+
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+print("OutputWatcher module loaded")
+
+
+class OutputWatcher:
+    """
+    Keeps an index of the scan files recently written to a folder
+
+    On Windows the folder is watched with FindFirstChangeNotification, so a
+    file is indexed as soon as the bridge creates it; elsewhere, or if the
+    notification cannot be set up, the folder's own mtime is polled and the
+    folder is only listed when it changes. Either way the folder is listed
+    once per change instead of once per lookup, which matters because the
+    shared Scans folder keeps every scan ever taken.
+
+    Args:
+        folder (str): the folder the bridge writes to
+        suffixes (tuple): file types to index
+    """
+
+    POLL_INTERVAL_S = 0.05
+    WAIT_SLICE_S = 0.5
+    # while polling, list the folder anyway this often, for shares whose mtime lags
+    RESCAN_INTERVAL_S = 2.0
+    MAX_RECENT = 64
+    # how far a file's mtime may be before the command started and still count as its output
+    CLOCK_SLACK_S = 2.0
+
+    # FindFirstChangeNotification filter
+    FILE_NOTIFY_CHANGE_FILE_NAME = 0x1
+    FILE_NOTIFY_CHANGE_LAST_WRITE = 0x10
+    WAIT_OBJECT_0 = 0
+
+    def __init__(self, folder, suffixes=(".csv",), debug: bool = False):
+        self.folder = str(folder)
+        self.suffixes = tuple(s.lower() for s in suffixes)
+        self.debug = bool(debug)
+        self.native = False
+
+        self._known = {}
+        self._recent = OrderedDict()
+        self._changed = threading.Condition()
+        self._stopping = threading.Event()
+        self._ready = threading.Event()
+        self._thread = None
+        self._folder_mtime = None
+        self._last_scan = 0.0
+        self._since = None
+
+    def _debug(self, message: str) -> None:
+        if self.debug:
+            print(f"[OutputWatcher] {message}")
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, since: float = None) -> "OutputWatcher":
+        """
+        Args:
+            since (float): time.time() of a command already sent; files it may
+                have written before the watcher started are indexed too
+        """
+        if self.running:
+            return self
+        self._since = since
+        self._stopping.clear()
+        self._ready.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="OutputWatcher", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 2.0) -> None:
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+        with self._changed:
+            self._changed.notify_all()
+
+    # ------------------------------------------------------------------------------------------------------------------------------------------
+    def _open_native(self):
+        """
+        Returns:
+            tuple: (kernel32, handle), or None if change notifications are not available
+        """
+        if sys.platform != "win32":
+            return None
+        try:
+            import ctypes
+            from ctypes import wintypes
+
+            kernel32 = ctypes.WinDLL("kernel32")
+            kernel32.FindFirstChangeNotificationW.argtypes = [
+                wintypes.LPCWSTR,
+                wintypes.BOOL,
+                wintypes.DWORD,
+            ]
+            kernel32.FindFirstChangeNotificationW.restype = wintypes.HANDLE
+            kernel32.FindNextChangeNotification.argtypes = [wintypes.HANDLE]
+            kernel32.FindNextChangeNotification.restype = wintypes.BOOL
+            kernel32.FindCloseChangeNotification.argtypes = [wintypes.HANDLE]
+            kernel32.WaitForSingleObject.argtypes = [wintypes.HANDLE, wintypes.DWORD]
+            kernel32.WaitForSingleObject.restype = wintypes.DWORD
+        except (OSError, AttributeError):
+            return None
+        handle = kernel32.FindFirstChangeNotificationW(
+            self.folder,
+            False,
+            self.FILE_NOTIFY_CHANGE_FILE_NAME | self.FILE_NOTIFY_CHANGE_LAST_WRITE,
+        )
+        # INVALID_HANDLE_VALUE comes back as all bits set
+        if not handle or handle == ctypes.c_void_p(-1).value:
+            return None
+        return kernel32, handle
+
+    def _run(self) -> None:
+        native = self._open_native()
+        self.native = native is not None
+        self._debug(
+            f"watching {self.folder} with {'notifications' if self.native else 'polling'}"
+        )
+        try:
+            self._scan()
+            self._ready.set()
+            while not self._stopping.is_set():
+                if native is not None:
+                    kernel32, handle = native
+                    waited = kernel32.WaitForSingleObject(
+                        handle, int(self.WAIT_SLICE_S * 1000)
+                    )
+                    if waited != self.WAIT_OBJECT_0:
+                        continue
+                    # re-arm before listing, so a write during the scan is not missed
+                    kernel32.FindNextChangeNotification(handle)
+                    self._scan()
+                else:
+                    self._stopping.wait(self.POLL_INTERVAL_S)
+                    if self._folder_changed() or (
+                        time.monotonic() - self._last_scan >= self.RESCAN_INTERVAL_S
+                    ):
+                        self._scan()
+        finally:
+            self._ready.set()
+            if native is not None:
+                native[0].FindCloseChangeNotification(native[1])
+
+    def _folder_changed(self) -> bool:
+        try:
+            mtime = os.stat(self.folder).st_mtime_ns
+        except OSError:
+            return False
+        return mtime != self._folder_mtime
+
+    def _scan(self) -> None:
+        """Lists the folder once and indexes the files that are new or rewritten."""
+        self._last_scan = time.monotonic()
+        try:
+            self._folder_mtime = os.stat(self.folder).st_mtime_ns
+            entries = list(os.scandir(self.folder))
+        except OSError:
+            return
+        baseline = not self._ready.is_set()
+        fresh = None if self._since is None else self._since - self.CLOCK_SLACK_S
+        found = []
+        for entry in entries:
+            if not entry.name.lower().endswith(self.suffixes):
+                continue
+            try:
+                if not entry.is_file():
+                    continue
+                mtime = entry.stat().st_mtime
+            except OSError:
+                continue
+            if self._known.get(entry.name) != mtime:
+                self._known[entry.name] = mtime
+                if not baseline or (fresh is not None and mtime >= fresh):
+                    found.append((entry.name, entry.path, mtime))
+        if not found:
+            return
+        with self._changed:
+            for name, path, mtime in found:
+                self._recent.pop(name, None)
+                self._recent[name] = (path, mtime)
+            while len(self._recent) > self.MAX_RECENT:
+                self._recent.popitem(last=False)
+            self._changed.notify_all()
+        self._debug(f"_scan() indexed {[name for name, _, _ in found]}")
+
+    # ------------------------------------------------------------------------------------------------------------------------------------------
+    def recent(self) -> list:
+        """
+        Returns:
+            list: paths of the files written since the watcher started (or
+            since the time given to start()), oldest first
+        """
+        with self._changed:
+            return [path for path, _ in self._recent.values()]
+
+    def _match(self, names, since):
+        for name in names:
+            if name in self._recent:
+                return self._recent[name][0]
+        if since is None:
+            return ""
+        newest = None
+        for path, mtime in self._recent.values():
+            if mtime >= since - self.CLOCK_SLACK_S and (
+                newest is None or mtime >= newest[1]
+            ):
+                newest = (path, mtime)
+        return newest[0] if newest else ""
+
+    def resolve(self, candidates, since: float = None, timeout_s: float = 8.0) -> str:
+        """
+        Waits for the output of a command to appear
+
+        Args:
+            candidates (list): paths the file may have, checked in order
+            since (float): time.time() when the command was sent; if given, the
+                newest file written after it is taken when no candidate shows up
+            timeout_s (float): how long to wait
+
+        Returns:
+            str: the path found, or "" if nothing appeared in time
+        """
+        candidates = [Path(c) for c in candidates]
+        names = [c.name for c in candidates]
+        deadline = time.monotonic() + timeout_s
+        with self._changed:
+            while True:
+                for candidate in candidates:
+                    if candidate.is_file():
+                        return str(candidate)
+                found = self._match(names, since)
+                if found:
+                    return found
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return ""
+                # candidates outside the folder are not indexed, look at them
+                # again every slice; without the watcher thread nothing notifies
+                slice_s = self.WAIT_SLICE_S if self.running else self.POLL_INTERVAL_S
+                self._changed.wait(min(remaining, slice_s))
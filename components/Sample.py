@@ -1,36 +1,197 @@
 # This is the sample class file
 
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+try:
+    from Spectrum import load_spectrum
+    from SpectrumArchive import ARCHIVE_SUFFIX, read_archive
+    from StagedSample import read_sidecar, staged_rows
+except ImportError:
+    from components.Spectrum import load_spectrum
+    from components.SpectrumArchive import ARCHIVE_SUFFIX, read_archive
+    from components.StagedSample import read_sidecar, staged_rows
+
+UV_VIS = "uv-vis"
+INFRARED = "ir"
+
+
+def instrument_type(token: str):
+    """
+    Maps the method token at the start of a scan header ("UVVis", "IR", ...)
+    to the instrument type ICN expects
+
+    Returns:
+        str: "uv-vis" or "ir", or None if the token is not a known scan type
+    """
+    normalized = token.strip().replace("_", "-").lower()
+    if normalized in ("uv-vis", "uvvis"):
+        return UV_VIS
+    if normalized == "ir":
+        return INFRARED
+    return None
+
+
+def _frozen(values) -> np.ndarray:
+    if isinstance(values, np.ndarray) and not values.flags.writeable:
+        # already read-only, e.g. a column of a cached spectrum, no copy needed
+        return np.asarray(values, dtype=np.float64).reshape(-1)
+    data = np.array(values, dtype=np.float64).reshape(-1)
+    data.setflags(write=False)
+    return data
+
 
 class Sample:
     """
     Represents a sample generated from the instrument
+
+    The wavelengths (x) and absorbance (y) are float64 NumPy arrays. A sample
+    made from a file only keeps the path until x or y is first read, then
+    loads the CSV (through the spectrum cache, so a scan the controller just
+    wrote is not parsed again), a binary archive (mapped, not parsed) or the
+    staged JSON. One Sample can be passed from the instrument to staging and
+    to the plot, and os.fspath(sample) is its file, so code written for
+    paths keeps working.
     """
 
-    name = ""
-    type = ""
-    data = []
-    interval = 0
+    __slots__ = ("name", "type", "interval", "path", "header", "_x", "_y")
 
-    def __init__(self, name, type, data, interval):
+    def __init__(
+        self, name="", type="", data=None, interval=0, path=None, x=None, y=None
+    ):
         """
         Creates a new Sample object
 
         Args:
             name (String): The name of the sample
-            type (String): the type of data the sample took ("infrared" or "uv-vis")
-            data (Float[]): The data points
+            type (String): the type of data the sample took ("ir" or "uv-vis")
+            data (Float[]): The absorbance points, same as y
             interval (Float): The interval between each data point
+            path (String): the CSV, archive or staged JSON the points are loaded from
+            x (Float[]): the wavelengths, computed from interval if only data is given
+            y (Float[]): the absorbance points
         """
         self.name = name
         self.type = type
-        self.data = data
         self.interval = interval
+        self.path = os.fspath(path) if path is not None else None
+        self.header = []
+        if y is None:
+            y = data
+        self._y = _frozen(y) if y is not None else None
+        if x is None and self._y is not None:
+            x = np.arange(len(self._y)) * float(interval or 1)
+        self._x = _frozen(x) if x is not None else None
+
+    # ------------------------------------------------------------------------------------------------------------------------------------------
+    @classmethod
+    def from_file(cls, path, name=None) -> "Sample":
+        """
+        Returns:
+            Sample: a sample for a scan CSV, archive or staged JSON, nothing is read yet
+        """
+        return cls(name=name or Path(path).name, path=path)
+
+    @classmethod
+    def from_arrays(cls, x, y, name="", type="", path=None) -> "Sample":
+        return cls(name=name, type=type, path=path, x=x, y=y)
+
+    @property
+    def loaded(self) -> bool:
+        return self._y is not None
+
+    @property
+    def x(self) -> np.ndarray:
+        if self._x is None:
+            self._load()
+        return self._x
+
+    @property
+    def y(self) -> np.ndarray:
+        if self._y is None:
+            self._load()
+        return self._y
+
+    @property
+    def data(self) -> np.ndarray:
+        return self.y
+
+    @property
+    def header_row(self) -> list:
+        """The first header line split into fields, like csv.reader gives it."""
+        if self.path is not None and not self.loaded:
+            self._load()
+        return self.header[0].rstrip("\n").split(",") if self.header else []
+
+    # ------------------------------------------------------------------------------------------------------------------------------------------
+    def _load(self) -> None:
+        if self.path is None:
+            raise ValueError(
+                f"Sample {self.name!r} has no data and no file to load it from"
+            )
+        suffix = Path(self.path).suffix.lower()
+        if suffix == ".json":
+            x, y = self._load_staged()
+        elif suffix == ARCHIVE_SUFFIX:
+            x, y = self._load_spectrum(read_archive(self.path))
+        else:
+            x, y = self._load_spectrum(load_spectrum(self.path, validate=False))
+        self._x, self._y = _frozen(x), _frozen(y)
+        if self.interval == 0 and len(self._x) > 1:
+            self.interval = abs(float(self._x[1] - self._x[0]))
+
+    def _load_spectrum(self, spectrum):
+        self.header = spectrum.header
+        if spectrum.header and not self.type:
+            self.type = instrument_type(spectrum.header[0].split("-", 1)[0]) or ""
+        return spectrum.waves, spectrum.absorbance
+
+    def _load_staged(self):
+        # the packed sidecar is much quicker than the per-row JSON, when there is one
+        columns = read_sidecar(self.path)
+        if columns is not None:
+            instrument, x, y = columns
+            self.type = self.type or instrument
+            return np.frombuffer(x, dtype=np.float64), np.frombuffer(
+                y, dtype=np.float64
+            )
+
+        with open(self.path, "r") as f:
+            try:
+                rows = json.load(f)
+            except ValueError:
+                # staged by older versions, one object per line without commas
+                f.seek(0)
+                rows = list(staged_rows(f))
+        x, y = [], []
+        for row in rows:
+            if "instrument-type" in row:
+                self.type = self.type or row["instrument-type"]
+            elif "nm" in row and "abs" in row:
+                x.append(row["nm"])
+                y.append(row["abs"])
+        return x, y
+
+    # ------------------------------------------------------------------------------------------------------------------------------------------
+    def __fspath__(self) -> str:
+        if self.path is None:
+            raise TypeError(f"Sample {self.name!r} has no file")
+        return self.path
+
+    def __len__(self) -> int:
+        return len(self.y)
+
+    def __bool__(self) -> bool:
+        return True
 
     def __str__(self):
         """
         Generates a string representation of the sample that will be used to create the sample file
         """
-        point_count = len(self.data) if self.data is not None else 0
+        point_count = len(self._y) if self._y is not None else "?"
         return (
             f"Sample(name={self.name}, type={self.type}, "
             f"points={point_count}, interval={self.interval})"
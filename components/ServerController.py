@@ -1,11 +1,27 @@
 # This is the server controller
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 import os
+import gzip
 import json
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+
+try:
+    from StagingIndex import StagingIndex
+    from Sample import Sample, instrument_type as _instrument_type
+    from StagedSample import read_sidecar, sidecar_path, staged_rows, write_sidecar
+except ImportError:
+    from components.StagingIndex import StagingIndex
+    from components.Sample import Sample, instrument_type as _instrument_type
+    from components.StagedSample import read_sidecar, sidecar_path, staged_rows, write_sidecar
 
 print("ServerController module loaded")
 
@@ -15,7 +31,51 @@ class ServerController:
     Communicates with the Inter Chem Net Server
     """
 
-    def __init__(self, PROJECT_ROOT, file_dir=None, debug: bool = False):
+    # HTTP connection pool settings for the shared session
+    POOL_SIZE = 4
+    MAX_RETRIES = 2
+    RETRY_BACKOFF_S = 0.3
+    RETRY_STATUS_CODES = (502, 503, 504)
+    REQUEST_TIMEOUT_S = 10
+
+    # concurrent uploads used when draining a backlog (e.g. on sign out)
+    UPLOAD_WORKERS = 4
+
+    # cached sessions are renewed this long before ICN expires them
+    SESSION_REFRESH_MARGIN_S = 60
+
+    # multi-sample upload route and the size cap of one batched request
+    BATCH_LINK_END = "instrument-data-upload-batch"
+    BATCH_MAX_BYTES = 2 * 1024 * 1024
+    BATCH_MAX_SAMPLES = 50
+    BATCH_UNSUPPORTED_STATUS = (404, 405, 501)
+
+    # staged samples: buffered JSON writer, see StagedSample for the sidecar
+    STAGING_WRITE_BUFFER = 64 * 1024
+
+    # uploaded files are moved here, out of the staging folder
+    SENT_DIR = "sent"
+
+    # upload bodies at least this large are gzipped on the wire, and sent
+    # columnar, when those modes are on
+    COMPRESS_THRESHOLD_BYTES = 8 * 1024
+    COMPRESS_LEVEL = 6
+    # rough size of one {"nm":..,"abs":..} row, to size a payload before building it
+    ROW_JSON_BYTES = 32
+    # replies to a gzipped body that mean the server may not take gzip
+    COMPRESS_REFUSED_STATUS = frozenset({400, 415})
+
+    def __init__(
+        self,
+        PROJECT_ROOT,
+        file_dir=None,
+        debug: bool = False,
+        pool_size: int = None,
+        max_retries: int = None,
+        compress_uploads: bool = False,
+        columnar_uploads: bool = False,
+        compress_threshold_bytes: int = None,
+    ):
         print(
             f"[ServerController][RECEIVED] __init__ payload={{'file_dir': {file_dir}, 'debug': {debug}}}"
         )
@@ -38,10 +98,152 @@ class ServerController:
         self.UUID = 0
         self.UUID_expiry = 0
 
+        # username -> {"uuid", "expiresOn", "expiry"}, shared by all upload paths
+        self._sessions = {}
+        # guards _sessions and _login_locks only, never held across a request
+        self._session_lock = threading.Lock()
+        # username -> lock held while that user logs in, so one slow login
+        # does not hold up uploads for other owners
+        self._login_locks = {}
+
         self.file_dir = PROJECT_ROOT + r"\scans"
         print("[ServerController][DEBUG] Set file_dir to: " + self.file_dir)
+
+        self.pool_size = pool_size or self.POOL_SIZE
+        self.max_retries = self.MAX_RETRIES if max_retries is None else max_retries
+        self.session = self._build_session()
+        self.last_upload_timings = []
+        # staging index for file_dir, opened on first use
+        self._index = None
+        self._index_lock = threading.Lock()
+
+        # None until the batch route has been tried, then True/False
+        self.batch_supported = None
+
+        # both need server support and are off unless asked for. Then bodies
+        # of compress_threshold_bytes or more are gzipped, and columnar sends
+        # nm/abs as two arrays ("dataColumns") instead of one object per
+        # point ("dataArray")
+        self.compress_uploads = bool(compress_uploads)
+        self.columnar_uploads = bool(columnar_uploads)
+        self.compress_threshold_bytes = (
+            self.COMPRESS_THRESHOLD_BYTES
+            if compress_threshold_bytes is None
+            else compress_threshold_bytes
+        )
+        self._transfer_lock = threading.Lock()
+        self.transfer_stats = {
+            "requests": 0,
+            "compressed": 0,
+            "raw_bytes": 0,
+            "wire_bytes": 0,
+        }
         print("[ServerController][EXECUTED] __init__ result=initialized")
 
+    def _build_session(self) -> requests.Session:
+        """
+        Builds the pooled keep-alive session shared by every request this
+        controller makes. One session is safe to share across worker threads;
+        the adapter hands each thread its own pooled connection.
+
+        Returns:
+            requests.Session: session with retry adapters mounted for http/https
+        """
+        retry = Retry(
+            total=self.max_retries,
+            connect=self.max_retries,
+            read=self.max_retries,
+            backoff_factor=self.RETRY_BACKOFF_S,
+            status_forcelist=self.RETRY_STATUS_CODES,
+            # POST is not idempotent on ICN (uploads/logins), only retry reads
+            allowed_methods=frozenset({"GET", "HEAD"}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_size,
+            pool_maxsize=self.pool_size,
+            max_retries=retry,
+        )
+        session = requests.Session()
+        session.headers.update({"Connection": "keep-alive"})
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        self._debug(
+            f"_build_session() pool_size={self.pool_size}, max_retries={self.max_retries}"
+        )
+        return session
+
+    def close(self) -> None:
+        """Closes the pooled HTTP session and drops any kept-alive connections."""
+        self._print_received("close")
+        session = getattr(self, "session", None)
+        if session is not None:
+            session.close()
+        if getattr(self, "_index", None) is not None:
+            self._index.close()
+            self._index = None
+        self._print_executed("close", True)
+
+    def _post_json(self, url_input, json_input):
+        """
+        POSTs a JSON body through the pooled session, gzipping it when it is at
+        least compress_threshold_bytes and compression is enabled. Bytes before
+        and after compression are added to `transfer_stats`.
+
+        A gzipped body the server rejects (COMPRESS_REFUSED_STATUS or 5xx) is
+        sent again uncompressed and compression is switched off.
+
+        Returns:
+            requests.Response: the server response
+        """
+        body = json.dumps(json_input, separators=(",", ":")).encode("utf-8")
+        compress = self.compress_uploads and len(body) >= self.compress_threshold_bytes
+        response = self._post_body(url_input, body, compress)
+        if compress and (
+            response.status_code in self.COMPRESS_REFUSED_STATUS
+            or response.status_code >= 500
+        ):
+            self._debug(
+                f"_post_json() gzip refused with {response.status_code}, sending uncompressed"
+            )
+            self.compress_uploads = False
+            response = self._post_body(url_input, body, False)
+        return response
+
+    def _post_body(self, url_input, body: bytes, compress: bool):
+        headers = {"Content-Type": "application/json"}
+        wire = body
+        if compress:
+            wire = gzip.compress(body, compresslevel=self.COMPRESS_LEVEL)
+            headers["Content-Encoding"] = "gzip"
+
+        with self._transfer_lock:
+            self.transfer_stats["requests"] += 1
+            self.transfer_stats["compressed"] += int(wire is not body)
+            self.transfer_stats["raw_bytes"] += len(body)
+            self.transfer_stats["wire_bytes"] += len(wire)
+        self._debug(
+            f"_post_json() raw_bytes={len(body)}, wire_bytes={len(wire)}, "
+            f"encoding={headers.get('Content-Encoding', 'identity')}"
+        )
+
+        return self.session.post(
+            url_input, data=wire, headers=headers, timeout=self.REQUEST_TIMEOUT_S
+        )
+
+    def transfer_metrics(self) -> dict:
+        """
+        Bytes-on-wire metrics for uploads made by this controller
+
+        Returns:
+            dict: transfer_stats plus the overall wire/raw "ratio"
+        """
+        with self._transfer_lock:
+            metrics = dict(self.transfer_stats)
+        raw = metrics["raw_bytes"]
+        metrics["ratio"] = (metrics["wire_bytes"] / raw) if raw else 1.0
+        return metrics
+
     def _debug(self, message: str) -> None:
         if self.debug:
             print(f"[ServerController] {message}")
@@ -89,7 +291,7 @@ class ServerController:
             self._print_executed("ping", False)
             return False
 
-        response = requests.get(url_input, timeout=10)
+        response = self.session.get(url_input, timeout=self.REQUEST_TIMEOUT_S)
         payload = response.json()
         self._debug(f"RX status_code={response.status_code}, payload={payload}")
 
@@ -103,24 +305,34 @@ class ServerController:
             self._print_executed("ping", "exception")
             raise Exception("Unexpected response from server: " + response.text)
 
-    def login(self, username):
+    @staticmethod
+    def _parse_expiry(expires_on):
         """
-        Attempts to login the user with that username
+        Parses the ISO expiresOn string returned by ICN
 
-        If it passes, generates a session UUID and stores it
+        Returns:
+            datetime: timezone-aware expiry, or None if it cannot be parsed
+        """
+        if not expires_on:
+            return None
+        try:
+            exp = datetime.fromisoformat(str(expires_on).replace("Z", "+00:00"))
+        except ValueError:
+            return None
+        if exp.tzinfo is None:
+            exp = exp.replace(tzinfo=timezone.utc)
+        return exp
+
+    def _request_session(self, username):
+        """
+        Asks ICN for a new session for username and stores it in the session cache
 
         Args:
-            username (String): the username of the user currently accessing ICN
+            username (String): the ICN username
 
         Returns:
-            Boolean: True if successful
+            dict: the cached session {"uuid", "expiresOn", "expiry"}, or None on failure
         """
-        self._print_received("login", {"username": username})
-        # Reset info
-        self.UUID = 0
-        self.UUID_expiry = 0
-        self.user = None
-
         url_input = self.api_url.format(link_end="user-session", api_key=self.api_key)
 
         json_input = {"studentUserName": username}
@@ -128,16 +340,112 @@ class ServerController:
         self._debug(f"TX POST {url_input} payload={json_input}")
         self._print_tx("POST", url_input, json_input)
 
-        response = requests.post(url_input, json=json_input, timeout=10)
+        response = self.session.post(
+            url_input, json=json_input, timeout=self.REQUEST_TIMEOUT_S
+        )
         payload = response.json()
         self._debug(
             f"RX status_code={response.status_code}, success={payload.get('success')}, user={username}"
         )
 
-        if payload.get("success"):
-            # server returns ISO datetime string for expiresOn
-            self.UUID = payload.get("sessionUUID")
-            self.UUID_expiry = payload.get("expiresOn")
+        if not payload.get("success"):
+            with self._session_lock:
+                self._sessions.pop(username, None)
+            return None
+
+        # server returns ISO datetime string for expiresOn
+        cached = {
+            "uuid": payload.get("sessionUUID"),
+            "expiresOn": payload.get("expiresOn"),
+            "expiry": self._parse_expiry(payload.get("expiresOn")),
+        }
+        with self._session_lock:
+            self._sessions[username] = cached
+        return cached
+
+    def _cached_session(self, username):
+        """
+        Returns the cached session for username if it is not within
+        SESSION_REFRESH_MARGIN_S of expiring, otherwise None
+        """
+        with self._session_lock:
+            cached = self._sessions.get(username)
+        if not cached or not cached["uuid"] or cached["expiry"] is None:
+            return None
+        margin = timedelta(seconds=self.SESSION_REFRESH_MARGIN_S)
+        if datetime.now(timezone.utc) + margin >= cached["expiry"]:
+            return None
+        return cached
+
+    def _login_lock(self, username):
+        with self._session_lock:
+            return self._login_locks.setdefault(username, threading.Lock())
+
+    def _fresh_session(self, username):
+        """
+        The cached session for username, logging in first if there is none
+        or it is about to expire. Concurrent callers for the same user wait
+        for one login; callers for other users are not blocked by it.
+
+        Returns:
+            dict: the cached session {"uuid", "expiresOn", "expiry"}, or None on failure
+        """
+        cached = self._cached_session(username)
+        if cached is not None:
+            return cached
+        with self._login_lock(username):
+            # another thread may have logged this user in while we waited
+            cached = self._cached_session(username)
+            if cached is None:
+                self._debug(f"_fresh_session() refreshing session for {username}")
+                cached = self._request_session(username)
+        return cached
+
+    def _session_for(self, username):
+        """
+        Gets a session UUID for username, logging in only when there is no
+        cached session or the cached one is about to expire. Does not change
+        the active user, so uploads for other owners leave the signed in user alone.
+
+        Args:
+            username (String): the owner of the data being uploaded
+
+        Returns:
+            String: the session UUID, or None if the login failed
+        """
+        cached = self._fresh_session(username)
+        if cached is None:
+            return None
+        if username == self.user:
+            # keep the active session in step with a proactive refresh
+            self.UUID = cached["uuid"]
+            self.UUID_expiry = cached["expiresOn"]
+        return cached["uuid"]
+
+    def login(self, username):
+        """
+        Attempts to login the user with that username
+
+        If it passes, generates a session UUID and stores it. A cached session
+        for the same user is reused until it is close to expiring.
+
+        Args:
+            username (String): the username of the user currently accessing ICN
+
+        Returns:
+            Boolean: True if successful
+        """
+        self._print_received("login", {"username": username})
+        # Reset info
+        self.UUID = 0
+        self.UUID_expiry = 0
+        self.user = None
+
+        cached = self._fresh_session(username)
+
+        if cached:
+            self.UUID = cached["uuid"]
+            self.UUID_expiry = cached["expiresOn"]
             self.user = username
             result = {"expiresOn": self.UUID_expiry}
             self._print_executed("login", result)
@@ -154,6 +462,8 @@ class ServerController:
             Boolean: True if successful
         """
         self._print_received("logout")
+        with self._session_lock:
+            self._sessions.pop(self.user, None)
         self.UUID = 0
         self.UUID_expiry = 0
         self.user = None
@@ -204,61 +514,169 @@ class ServerController:
         if not self.UUID_expiry:
             self._print_executed("validate", False)
             return False
-        try:
-            exp = datetime.fromisoformat(self.UUID_expiry.replace("Z", "+00:00"))
-            valid = datetime.now(timezone.utc) < exp
-            self._print_executed("validate", valid)
-            return valid
-        except Exception:
+        with self._session_lock:
+            cached = self._sessions.get(self.user)
+        if cached and cached["expiresOn"] == self.UUID_expiry:
+            # already parsed when the session was cached
+            exp = cached["expiry"]
+        else:
+            exp = self._parse_expiry(self.UUID_expiry)
+        if exp is None:
             self._print_executed("validate", False)
             return False
+        valid = datetime.now(timezone.utc) < exp
+        self._print_executed("validate", valid)
+        return valid
+
+    @staticmethod
+    def _split_staged_name(samplePath):
+        """
+        Splits a staged filename into its (owner, data_key, status) parts
 
-    def send_all_data(self):
+        Args:
+            samplePath (String): path named like username_datetime_unsent.json
+
+        Returns:
+            tuple: (owner, data_key, status), or None if the name does not match
+        """
+        parts = Path(samplePath).stem.rsplit("_", 2)
+        if len(parts) != 3:
+            return None
+        return tuple(parts)
+
+    def _staging_index(self):
+        """
+        Returns the StagingIndex for the current file_dir, opening it (and
+        importing any files already staged there) on first use
+
+        Returns:
+            StagingIndex: the index, or None if file_dir does not exist
+        """
+        directory = Path(self.file_dir)
+        with self._index_lock:
+            if self._index is None or self._index.directory != directory:
+                if not directory.exists():
+                    return None
+                if self._index is not None:
+                    self._index.close()
+                self._index = StagingIndex(directory, debug=self.debug)
+            return self._index
+
+    def _pending_uploads(self):
+        """
+        Collects the unsent (or previously failed) staged files in file_dir
+        grouped by owner, from the staging index
+
+        Returns:
+            dict: owner -> list of Paths, oldest first
+        """
+        groups = {}
+        index = self._staging_index()
+        if index is None:
+            self._debug(f"_pending_uploads() skipped missing dir: {self.file_dir}")
+            return groups
+
+        for row in index.pending():
+            filepath = Path(self.file_dir) / row["filename"]
+            if not filepath.is_file():
+                # removed by hand since it was staged
+                index.forget(row["filename"])
+                continue
+            groups.setdefault(row["owner"], []).append(filepath)
+
+        return groups
+
+    def send_all_data(self, max_workers: int = 1, batch: bool = False):
         """
         Attempts to send all unsent data to ICN
 
+        Files are grouped by owner and share that owner's cached session. With
+        max_workers > 1 the uploads run on a bounded thread pool sharing the
+        pooled HTTP session. With batch=True each owner's files are packed into
+        size-capped multi-sample requests (see `send_batch`). Per-file upload
+        times (seconds) are kept in `last_upload_timings` as (filename, seconds)
+        pairs; batched files report the time of the request that carried them.
+
+        Args:
+            max_workers (int): number of concurrent uploads, 1 uploads in order
+            batch (bool): use the multi-sample upload route when ICN has one
+
         Returns:
             list of filenames and boolean indicating if sent
         """
 
-        self._print_received("send_all_data", {"file_dir": self.file_dir})
+        self._print_received(
+            "send_all_data",
+            {"file_dir": self.file_dir, "max_workers": max_workers, "batch": batch},
+        )
         successes = []
+        self.last_upload_timings = []
 
-        p = Path(self.file_dir)
-        if not p.exists():
-            self._debug(f"send_all_data() skipped missing dir: {p}")
+        groups = self._pending_uploads()
+        if not groups:
             self._print_executed("send_all_data", successes)
             return successes
 
-        for filepath in p.iterdir():
-            if not filepath.is_file():
-                continue
-            if filepath.suffix.lower() != ".json":
-                continue
+        workers = max(1, min(int(max_workers), self.pool_size))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = []
+            for owner, files in groups.items():
+                # one cached session per owner, logs in only when missing/expiring
+                session_uuid = self._session_for(owner)
+                if not session_uuid:
+                    self._debug(f"send_all_data() login failed for owner={owner}")
+                    for filepath in files:
+                        successes.append((filepath.name, False))
+                        self.last_upload_timings.append((filepath.name, 0.0))
+                    continue
 
-            stem = filepath.stem
-            parts = stem.rsplit("_", 2)
-            if len(parts) != 3:
-                continue
-            owner, dt_str, flag = parts
-            if flag.lower() != "unsent":
-                continue
+                if batch and self.batch_supported is not False:
+                    for chunk in self._batch_chunks(files):
+                        futures.append(
+                            pool.submit(self._timed_batch, chunk, session_uuid)
+                        )
+                    continue
 
-            sent = False
-            if self.user != owner or not self.is_logged_in():
-                # attempt to login as that owner
-                self.login(owner)
+                for filepath in files:
+                    futures.append(
+                        pool.submit(self._timed_batch, [filepath], session_uuid, False)
+                    )
 
-            if self.send_data(str(filepath)):
-                sent = True
+            for future in futures:
+                for filepath, sent, elapsed in future.result():
+                    successes.append((filepath.name, sent))
+                    self.last_upload_timings.append((filepath.name, elapsed))
 
-            successes.append((filepath.name, sent))
+        index = self._staging_index()
+        if index is not None:
+            for filename, sent in successes:
+                if not sent:
+                    index.mark_failed(filename, "upload failed")
 
         self._debug(f"send_all_data() processed {len(successes)} files")
         self._print_executed("send_all_data", successes)
 
         return successes
 
+    def _timed_batch(self, paths, session_uuid, batch=True):
+        """
+        Uploads paths (as one batch, or one post per file) on a worker thread
+
+        Returns:
+            list: (path, sent, seconds) for each path
+        """
+        started = time.perf_counter()
+        try:
+            if batch:
+                results = self.send_batch(paths, session_uuid)
+            else:
+                results = [(p, self._upload_staged(p, session_uuid)) for p in paths]
+        except Exception as exc:
+            self._debug(f"_timed_batch() upload error {[p.name for p in paths]}: {exc}")
+            results = [(p, False) for p in paths]
+        elapsed = time.perf_counter() - started
+        return [(Path(p), sent, elapsed) for p, sent in results]
+
     def send_data(self, samplePath):
         """
         Converts a sample to a file and sends all the unsent data to ICN
@@ -270,9 +688,8 @@ class ServerController:
             Boolean: True if it successful send all unsent data
         """
 
-        stem = Path(samplePath).stem
-        parts = stem.rsplit("_", 2)
-        if len(parts) != 3:
+        parts = self._split_staged_name(samplePath)
+        if parts is None:
             self._debug(f"send_data() invalid filename format: {samplePath}")
             self._print_executed("send_data", False)
             return False
@@ -283,38 +700,58 @@ class ServerController:
             self._print_executed("send_data", False)
             return False
 
+        self._print_received("send_data", {"samplePath": str(samplePath)})
+        # ensure a valid session for the file owner
+        session_uuid = self._session_for(username)
+        if not session_uuid:
+            self._debug(f"send_data() login failed for owner={username}")
+            self._print_executed("send_data", False)
+            return False
+
+        return self._upload_staged(samplePath, session_uuid)
+
+    def _load_staged(self, samplePath):
+        """
+        Reads a staged file into the fields of an upload
+
+        Args:
+            samplePath (String): staged file named like username_datetime_unsent.json
+
+        Returns:
+            dict: {"dataKey", "instrument-type", "dataArray"} ("dataColumns"
+            when columnar_uploads is on and the data is large, see
+            _use_columnar), or None if the staged file has no valid
+            instrument-type
+        """
+        _, data_key, _ = self._split_staged_name(samplePath)
+
         data_key_for_upload = data_key
         if "T" in data_key:
             date_part, time_part = data_key.split("T", 1)
             data_key_for_upload = f"{date_part}T{time_part.replace('-', ':')}"
 
-        self._print_received("send_data", {"samplePath": str(samplePath)})
-        # ensure logged in as file owner and session valid
-        if self.user != username or not self.is_logged_in():
-            if not self.login(username):
-                self._debug(f"send_data() login failed for owner={username}")
-                self._print_executed("send_data", False)
-                return False
-
-        if not self.is_logged_in():
-            self._debug("send_data() rejected: not logged in")
-            self._print_executed("send_data", False)
-            return False
-
-        url_input = self.api_url.format(
-            link_end="instrument-data-upload", api_key=self.api_key
-        )
+        columns = read_sidecar(samplePath)
+        if columns is not None:
+            instrument_type, nm, absorbance = columns
+            if self._use_columnar(len(nm)):
+                data = {"dataColumns": {"nm": nm.tolist(), "abs": absorbance.tolist()}}
+            else:
+                data = {
+                    "dataArray": [
+                        {"nm": wave, "abs": value}
+                        for wave, value in zip(nm, absorbance)
+                    ]
+                }
+            return {
+                "dataKey": data_key_for_upload,
+                "instrument-type": instrument_type,
+                **data,
+            }
 
         with open(samplePath, "r") as f:
             dataArray = []
             instrument_type = None
-            for line in f:
-                stripped = line.strip()
-                if not stripped or stripped in {"[", "]"}:
-                    continue
-                if stripped.endswith(","):
-                    stripped = stripped[:-1]
-                row = json.loads(stripped)
+            for row in staged_rows(f):
                 if "instrument-type" in row:
                     instrument_type = str(row["instrument-type"]).strip().lower()
                     continue
@@ -324,22 +761,87 @@ class ServerController:
             self._debug(
                 f"send_data() invalid or missing instrument-type in staged file: {samplePath}"
             )
-            self._print_executed("send_data", False)
-            return False
-
-        json_input = {
-            "sessionUUID": self.UUID,
+            return None
+
+        if self._use_columnar(len(dataArray)):
+            data = {
+                "dataColumns": {
+                    "nm": [row.get("nm") for row in dataArray],
+                    "abs": [row.get("abs") for row in dataArray],
+                }
+            }
+        else:
+            data = {"dataArray": dataArray}
+        return {
             "dataKey": data_key_for_upload,
             "instrument-type": instrument_type,
-            "dataArray": dataArray,
+            **data,
         }
 
-        with open("debug_payload.json", "w") as debug_file:
-            json.dump(json_input, debug_file)
+    def _use_columnar(self, points: int) -> bool:
+        """
+        Whether a sample of this many points goes up as columns: only when
+        columnar_uploads is on and the row payload would reach the
+        compression threshold
+
+        Returns:
+            bool: True to send "dataColumns"
+        """
+        return (
+            self.columnar_uploads
+            and points * self.ROW_JSON_BYTES >= self.compress_threshold_bytes
+        )
+
+    def _mark_sent(self, samplePath):
+        """
+        Moves an uploaded file into the SENT_DIR subfolder as username_datetime_sent.json
+        so the staging folder only holds pending samples, and updates the index
+        """
+        username, data_key, _ = self._split_staged_name(samplePath)
+        sent_dir = Path(samplePath).parent / self.SENT_DIR
+        sent_dir.mkdir(exist_ok=True)
+        rename_to_sent = sent_dir / f"{username}_{data_key}_sent{Path(samplePath).suffix}"
+        Path(samplePath).replace(rename_to_sent)
+        # the packed columns are only needed until the upload succeeds
+        sidecar_path(samplePath).unlink(missing_ok=True)
+
+        index = self._staging_index()
+        if index is not None:
+            index.mark_sent(Path(samplePath).name)
+
+    def _upload_staged(self, samplePath, session_uuid):
+        """
+        Posts one staged file with an already established session UUID.
+        Does not touch the controller's login state, so it is safe to call
+        from upload worker threads.
+
+        Args:
+            samplePath (String): staged file named like username_datetime_unsent.json
+            session_uuid (String): session UUID of the file owner
+
+        Returns:
+            Boolean: True if ICN accepted the upload
+        """
+        username = self._split_staged_name(samplePath)[0]
+
+        url_input = self.api_url.format(
+            link_end="instrument-data-upload", api_key=self.api_key
+        )
+
+        sample = self._load_staged(samplePath)
+        if sample is None:
+            self._print_executed("send_data", False)
+            return False
+
+        json_input = {"sessionUUID": session_uuid, **sample}
+
+        if self.debug:
+            with open("debug_payload.json", "w") as debug_file:
+                json.dump(json_input, debug_file)
             print(url_input)
             print(json_input)
 
-        response = requests.post(url_input, json=json_input, timeout=10)
+        response = self._post_json(url_input, json_input)
         payload = response.json()
         self._debug(f"TX POST {url_input} payload={json_input}")
         self._debug(
@@ -348,33 +850,180 @@ class ServerController:
 
         if payload.get("success"):
             print(payload)
-            rename_to_sent = Path(samplePath).with_name(
-                f"{username}_{data_key}_sent{Path(samplePath).suffix}"
-            )
-            Path(samplePath).rename(rename_to_sent)
+            self._mark_sent(samplePath)
             return True
 
         self._print_executed("send_data", False)
         return False
 
-    def parse_csv(self, filepath):
+    def _batch_chunks(self, paths):
+        """
+        Splits staged files into chunks of at most BATCH_MAX_SAMPLES files whose
+        combined size on disk stays under BATCH_MAX_BYTES. A single file larger
+        than the cap still gets a chunk of its own.
+        """
+        chunk, chunk_bytes = [], 0
+        for path in paths:
+            size = Path(path).stat().st_size
+            if chunk and (
+                chunk_bytes + size > self.BATCH_MAX_BYTES
+                or len(chunk) >= self.BATCH_MAX_SAMPLES
+            ):
+                yield chunk
+                chunk, chunk_bytes = [], 0
+            chunk.append(path)
+            chunk_bytes += size
+        if chunk:
+            yield chunk
+
+    def send_batch(self, paths, session_uuid):
+        """
+        Uploads several staged samples of one owner in a single request to the
+        multi-sample route. Only that route answers with a per-sample
+        "results" list; if the reply has none (404/405/501, or an older ICN
+        answering unknown routes with a generic 200) the samples are posted
+        one by one instead, and batching is switched off for this controller
+        unless the route has already been seen working.
+
+        Args:
+            paths (list): staged files of one owner
+            session_uuid (String): session UUID of that owner
+
+        Returns:
+            list: (path, sent) for each staged file
+        """
+        self._print_received("send_batch", {"count": len(paths)})
+        if self.batch_supported is False:
+            results = [(p, self._upload_staged(p, session_uuid)) for p in paths]
+            self._print_executed("send_batch", results)
+            return results
+
+        samples, loaded = [], []
+        results = []
+        for path in paths:
+            sample = self._load_staged(path)
+            if sample is None:
+                results.append((path, False))
+                continue
+            samples.append(sample)
+            loaded.append(path)
+
+        if not samples:
+            self._print_executed("send_batch", results)
+            return results
+
+        url_input = self.api_url.format(
+            link_end=self.BATCH_LINK_END, api_key=self.api_key
+        )
+        json_input = {"sessionUUID": session_uuid, "samples": samples}
+        self._print_tx("POST", url_input, {"samples": len(samples)})
+
+        response = self._post_json(url_input, json_input)
+        try:
+            payload = response.json()
+        except ValueError:
+            payload = None
+        self._debug(
+            f"RX status_code={response.status_code}, batch payload={payload}"
+        )
+
+        per_sample = payload.get("results") if isinstance(payload, dict) else None
+        if response.status_code in self.BATCH_UNSUPPORTED_STATUS or not isinstance(
+            per_sample, list
+        ):
+            self._debug("send_batch() no batch reply, falling back to per-file posts")
+            # a route already seen working is kept, this may be a one-off bad reply
+            if self.batch_supported is None:
+                self.batch_supported = False
+            results.extend((p, self._upload_staged(p, session_uuid)) for p in loaded)
+            self._print_executed("send_batch", results)
+            return results
+
+        self.batch_supported = True
+        # per-sample results, in the order the samples were sent; a sample
+        # the reply does not account for is left staged
+        for index, path in enumerate(loaded):
+            entry = per_sample[index] if index < len(per_sample) else None
+            sent = isinstance(entry, dict) and bool(entry.get("success"))
+            if sent:
+                self._mark_sent(path)
+            results.append((path, sent))
+
+        self._print_executed("send_batch", results)
+        return results
+
+    @staticmethod
+    def _iter_csv_points(lines):
+        """
+        Streams (nm, abs) float pairs out of the data rows of an instrument CSV,
+        skipping blank and malformed rows
+
+        Args:
+            lines (iterable): the CSV lines after the two header rows
+
+        Yields:
+            tuple: (nm, abs)
+        """
+        for line in lines:
+            parts = line.split(",", 2)
+            if len(parts) < 2:
+                continue
+            try:
+                yield float(parts[0]), float(parts[1])
+            except ValueError:
+                continue
+
+    def _stage_points(self, out_path, instrument_type, points):
+        """
+        Writes the staged JSON for a sample and returns its points as packed columns
+
+        Args:
+            out_path (Path): the username_datetime_unsent.json file
+            instrument_type (String): "uv-vis" or "ir"
+            points (iterable): (nm, abs) float pairs
+
+        Returns:
+            tuple: (nm array, abs array)
+        """
+        nm, absorbance = array("d"), array("d")
+        with open(out_path, "w", buffering=self.STAGING_WRITE_BUFFER) as out:
+            out.write('[\n{"instrument-type": "' + instrument_type + '"}')
+            for wave, value in points:
+                nm.append(wave)
+                absorbance.append(value)
+                out.write(f',\n{{"nm": {wave!r}, "abs": {value!r}}}')
+            out.write("\n]")
+        return nm, absorbance
+
+    def parse_csv(self, filepath, username=None):
         """
         Takes in a csv file, then converts it into a JSON file.
-        username_datetime_unsent.json is the ouputted file in the to be sent folder
+        username_datetime_unsent.json is the ouputted file in the to be sent folder.
+        The CSV is streamed row by row, and the points are also kept as packed
+        float64 columns in a sidecar file that `send_data` reads instead of the JSON.
         Args:
-            filepath (String): The path to the csv file that is being converted to JSON
+            filepath (String or Sample): The path to the csv file that is being
+                converted to JSON, or a Sample whose points are used instead of
+                reading its file again
+            username (String): who took the sample, the logged-in user by default
         Returns:
             boolean: True if the file was successfully parsed, False if not
         """
+        username = username or self.user
 
-        self._print_received("parse_csv", {"filepath": str(filepath), "user": self.user})
+        self._print_received("parse_csv", {"filepath": str(filepath), "user": username})
 
-        if not self.user:
+        if not username:
             self._debug("parse_csv() rejected: no logged-in user")
             self._print_executed("parse_csv", False)
             return False
 
-        filename_username = self.user
+        if isinstance(filepath, Sample) and filepath.path is None:
+            self._debug(f"parse_csv() sample has no file name: {filepath}")
+            self._print_executed("parse_csv", False)
+            return False
+
+        filename_username = username
         filename_stem = Path(filepath).stem
         username_prefix = f"{filename_username}"
         if filename_stem.startswith(username_prefix):
@@ -388,44 +1037,53 @@ class ServerController:
             / f"{filename_username}_{filename_datetime}{filename_suffix}"
         )
 
-        with open(filepath, "r") as f:
-            lines = f.readlines()
-
-        if len(lines) < 2:
-            self._debug(f"parse_csv() invalid csv: {filepath}")
-            self._print_executed("parse_csv", False)
-            return False
-
-        scan_type_token = lines[0].split("-", 1)[0].strip()
-        normalized = scan_type_token.replace("_", "-").lower()
-        if normalized == "uv-vis" or normalized == "uvvis":
-            instrument_type = "uv-vis"
-        elif normalized == "ir":
-            instrument_type = "ir"
+        if isinstance(filepath, Sample):
+            try:
+                waves, values = filepath.x, filepath.y
+            except (OSError, ValueError) as exc:
+                self._debug(f"parse_csv() could not load {filepath.path}: {exc}")
+                self._print_executed("parse_csv", False)
+                return False
+            instrument_type = _instrument_type(filepath.type)
+            if instrument_type is None:
+                self._debug(f"parse_csv() unsupported scan type: {filepath.type}")
+                self._print_executed("parse_csv", False)
+                return False
+            nm, absorbance = self._stage_points(
+                out_path, instrument_type, zip(waves.tolist(), values.tolist())
+            )
         else:
-            self._debug(f"parse_csv() unsupported scan type token: {scan_type_token}")
-            self._print_executed("parse_csv", False)
-            return False
-
-        with open(out_path, "w+") as f:
-            f.write("[\n")
-            f.write('{"instrument-type": "' + instrument_type + '"},\n')
-            for line in lines[2:]:
-                if not line.strip():
-                    continue
-                parts = line.split(",")
-                if len(parts) < 2:
-                    continue
-                f.write(
-                    '{"nm": '
-                    + parts[0]
-                    + ', "abs": '
-                    + parts[1]
-                    + "}\n"
+            with open(filepath, "r") as f:
+                first_line = f.readline()
+                header_line = f.readline()
+
+                if not header_line:
+                    self._debug(f"parse_csv() invalid csv: {filepath}")
+                    self._print_executed("parse_csv", False)
+                    return False
+
+                scan_type_token = first_line.split("-", 1)[0].strip()
+                instrument_type = _instrument_type(scan_type_token)
+                if instrument_type is None:
+                    self._debug(
+                        f"parse_csv() unsupported scan type token: {scan_type_token}"
+                    )
+                    self._print_executed("parse_csv", False)
+                    return False
+
+                nm, absorbance = self._stage_points(
+                    out_path, instrument_type, self._iter_csv_points(f)
                 )
-            f.write("]")
 
-        self._print_executed("parse_csv", {"out_path": str(out_path)})
+        write_sidecar(out_path, instrument_type, nm, absorbance)
+
+        index = self._staging_index()
+        if index is not None:
+            index.add(out_path.name, size=out_path.stat().st_size)
+
+        self._print_executed(
+            "parse_csv", {"out_path": str(out_path), "points": len(nm)}
+        )
         return True
 
 
@@ -0,0 +1,315 @@
+# This is a stand-in for the ADL bridge (MailboxCheck.adl) for use off the lab PC
+
+import math
+import os
+import threading
+import time
+from pathlib import Path
+
+try:
+    from InstrumentController import InstrumentController
+except ImportError:
+    from components.InstrumentController import InstrumentController
+
+print("SimulatedBridge module loaded")
+
+
+class SimulatedBridge:
+    """
+    Answers InstrumentController commands the way MailboxCheck.adl does
+
+    Runs on a thread against any MailboxTransport: consumes Queue\\Command,
+    marks the State BUSY, bumps FileCounter, waits the configured delay for
+    the command, writes a synthetic spectrum CSV for SCAN and BLANK (and
+    AppliedParams for SETUP), clears the Param key and finally writes Status
+    and ReplyId. Between commands it bumps State\\Heartbeat like the ADL
+    loop. Lets the command protocol be tested and benchmarked on Linux.
+
+    With stream=True a SCAN or BLANK is acquired row by row instead, the way
+    a streaming bridge would: each row is appended to the result path plus
+    PARTIAL_SUFFIX as the delay runs, Queue\\Abort is checked between rows
+    and the scan ends with Status ABORTED (and no file) if it is set.
+
+    Args:
+        mailbox (MailboxTransport): the mailbox shared with the controller
+        folder (str): where scans are written, replaced by a SETUP Filename
+        delays (dict): seconds per command, e.g. {"SCAN": 2.0}
+        online (bool): what PING reports
+        stream (bool): write SCAN and BLANK progressively and honour Abort
+    """
+
+    DEFAULT_DELAYS = {
+        "PING": 0.0,
+        "SETUP": 0.0,
+        "RESET": 0.0,
+        "SCAN": 0.0,
+        "BLANK": 0.0,
+    }
+    IDLE_POLL_S = 0.001
+    HEARTBEAT_S = 0.1
+    PARAM_NAMES = (
+        "Json",
+        "Filename",
+        "WavelengthStart",
+        "WavelengthStop",
+        "Saturation",
+        "Bandwidth",
+    )
+
+    def __init__(
+        self,
+        mailbox,
+        folder="",
+        delays=None,
+        online: bool = True,
+        stream: bool = False,
+        debug: bool = False,
+    ):
+        self.mailbox = mailbox
+        self.folder = str(folder)
+        self.delays = dict(self.DEFAULT_DELAYS)
+        self.delays.update(delays or {})
+        self.online = bool(online)
+        self.debug = bool(debug)
+        self.stream = stream
+
+        self.wave_start = 600.0
+        self.wave_stop = 500.0
+        self.saturation = 0.1
+        self.bandwidth = 2.0
+        self.handled = []
+        self.beats = 0
+
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def _debug(self, message: str) -> None:
+        if self.debug:
+            print(f"[SimulatedBridge] {message}")
+
+    @property
+    def stream(self) -> bool:
+        return self._stream
+
+    @stream.setter
+    def stream(self, value) -> None:
+        # advertised in State\Streaming, the controller only offers Abort when it is set
+        self._stream = bool(value)
+        self._write(
+            InstrumentController.STATE_KEY,
+            InstrumentController.REG_S_STREAMING,
+            "1" if self._stream else "",
+        )
+
+    # mailbox helpers, named after the ADL functions
+    def _read(self, key: str, name: str) -> str:
+        return self.mailbox.get(key, name, "")
+
+    def _write(self, key: str, name: str, value) -> None:
+        self.mailbox.set(key, name, str(value))
+
+    def _reset_state(self, status: str) -> None:
+        self._write(InstrumentController.STATE_KEY, "Status", status)
+        self._write(InstrumentController.STATE_KEY, "Error", "")
+        self._write(InstrumentController.STATE_KEY, "ReplyId", "")
+        self._write(InstrumentController.STATE_KEY, "ResultPath", "")
+
+    def _reset_param(self) -> None:
+        for name in self.PARAM_NAMES:
+            self._write(InstrumentController.PARAM_KEY, name, "")
+
+    def _status_write(self, cmd_id: str, status: str) -> None:
+        self._write(InstrumentController.STATE_KEY, "Status", status)
+        self._write(InstrumentController.STATE_KEY, "ReplyId", cmd_id)
+
+    def _applied_write(self) -> None:
+        applied = (
+            ("Filename", self.folder),
+            ("WavelengthStart", f"{self.wave_start:g}"),
+            ("WavelengthStop", f"{self.wave_stop:g}"),
+            ("Saturation", f"{self.saturation:g}"),
+            ("Bandwidth", f"{self.bandwidth:g}"),
+        )
+        self._write(
+            InstrumentController.STATE_KEY,
+            InstrumentController.REG_S_APPLIED_PARAMS,
+            "|".join(f"{name}={value}" for name, value in applied),
+        )
+
+    def start(self) -> "SimulatedBridge":
+        self.mailbox.ensure_key(InstrumentController.QUEUE_KEY)
+        self._reset_state("RUNNING")
+        self._applied_write()
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="SimulatedBridge", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _beat(self) -> None:
+        self.beats += 1
+        self._write(
+            InstrumentController.STATE_KEY,
+            InstrumentController.REG_S_HEARTBEAT,
+            self.beats,
+        )
+
+    def _run(self) -> None:
+        queue = InstrumentController.QUEUE_KEY
+        notified = self.mailbox.watch(queue)
+        next_beat = 0.0
+        try:
+            while not self._stopping.is_set():
+                # like the ADL loop, no beats while a command runs
+                if time.monotonic() >= next_beat:
+                    self._beat()
+                    next_beat = time.monotonic() + self.HEARTBEAT_S
+                command = self._read(queue, "Command")
+                if not command:
+                    if notified:
+                        self.mailbox.wait_for_change(queue, self.HEARTBEAT_S)
+                    else:
+                        time.sleep(self.IDLE_POLL_S)
+                    continue
+                if not self.handle(command):
+                    break
+        finally:
+            self.mailbox.unwatch(queue)
+        self._write(
+            InstrumentController.STATE_KEY, InstrumentController.REG_S_HEARTBEAT, ""
+        )
+        self._write(InstrumentController.STATE_KEY, "Status", "STOPPED")
+
+    def handle(self, command: str) -> bool:
+        """
+        Processes one command found in the queue
+
+        Returns:
+            bool: False once SHUTDOWN was received
+        """
+        queue = InstrumentController.QUEUE_KEY
+        param = InstrumentController.PARAM_KEY
+        state = InstrumentController.STATE_KEY
+
+        # consume the command immediately to avoid double processing
+        self._write(queue, "Command", "")
+        cmd_id = self._read(queue, "CommandId")
+        # an abort meant for an earlier command does not carry over
+        self._write(queue, InstrumentController.REG_Q_ABORT, "")
+        # how long the controller will wait, so it can tell a dead bridge from a busy one
+        self._write(
+            state,
+            InstrumentController.REG_S_BUSY_UNTIL,
+            self._read(queue, InstrumentController.REG_Q_DEADLINE),
+        )
+        self._reset_state("BUSY")
+
+        counter = self._read(state, "FileCounter")
+        self._write(state, "FileCounter", int(counter or 0) + 1)
+        self._debug(f"handle() {command} cmd_id={cmd_id}")
+        self.handled.append(command)
+
+        streamed = self.stream and command in ("SCAN", "BLANK")
+        if not streamed:
+            time.sleep(self.delays.get(command, 0.0))
+
+        status = ""
+        if command == "SETUP":
+            folder = self._read(param, "Filename")
+            if folder:
+                self.folder = folder
+            for name, attr in (
+                ("WavelengthStart", "wave_start"),
+                ("WavelengthStop", "wave_stop"),
+                ("Saturation", "saturation"),
+                ("Bandwidth", "bandwidth"),
+            ):
+                value = self._read(param, name)
+                if value:
+                    setattr(self, attr, float(value))
+            self._applied_write()
+            status = "IDLE"
+        elif command == "RESET":
+            status = "IDLE"
+        elif command == "PING":
+            status = "ONLINE" if self.online else "OFFLINE"
+        elif command in ("SCAN", "BLANK"):
+            path = self.folder + self._read(param, "Filename")
+            if command == "SCAN":
+                lines = self._spectrum_lines("UVVis", self.wave_start, self.wave_stop)
+            else:
+                lines = self._spectrum_lines("UVVis_Blank", 1100, 190)
+            if streamed and not self._acquire(
+                path, lines, self.delays.get(command, 0.0)
+            ):
+                status = "ABORTED"
+            else:
+                self._write_lines(path, lines)
+                self._write(state, "ResultPath", path)
+                status = "DONE"
+        elif command == "SHUTDOWN":
+            self._reset_param()
+            self._write(state, InstrumentController.REG_S_HEARTBEAT, "")
+            self._status_write(cmd_id, "STOPPED")
+            return False
+
+        self._reset_param()
+        self._status_write(cmd_id, status)
+        return True
+
+    def _spectrum_lines(self, name: str, start: float, stop: float) -> list:
+        """The lines of a Cary-style CSV with one smooth absorbance band, 1 nm apart."""
+        lines = [
+            f"{name}-{start:g}-{stop:g}-{self.saturation:g},{self.bandwidth:g},\n",
+            "Wavelength (nm),Abs,\n",
+        ]
+        centre = (start + stop) / 2
+        wave = start
+        while wave >= stop:
+            absorbance = 0.05 + math.exp(-(((wave - centre) / 40.0) ** 2))
+            lines.append(f"{wave:g},{absorbance:.6f},\n")
+            wave -= 1
+        return lines
+
+    @staticmethod
+    def _write_lines(path, lines: list) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as scanFile:
+            scanFile.writelines(lines)
+
+    def _acquire(self, path, lines: list, delay_s: float) -> bool:
+        """
+        Appends the rows to the partial file one at a time over delay_s
+
+        Returns:
+            bool: False if Queue\\Abort was set before the last row
+        """
+        partial = path + InstrumentController.PARTIAL_SUFFIX
+        Path(partial).parent.mkdir(parents=True, exist_ok=True)
+        row_s = delay_s / max(1, len(lines) - 2)
+        aborted = False
+        with open(partial, "w") as partialFile:
+            for index, line in enumerate(lines):
+                if index >= 2:
+                    if self._read(
+                        InstrumentController.QUEUE_KEY, InstrumentController.REG_Q_ABORT
+                    ):
+                        aborted = True
+                        break
+                    time.sleep(row_s)
+                partialFile.write(line)
+                partialFile.flush()
+        os.remove(partial)
+        self._write(
+            InstrumentController.QUEUE_KEY, InstrumentController.REG_Q_ABORT, ""
+        )
+        if aborted:
+            self._debug(f"_acquire() aborted {path}")
+        return not aborted
@@ -0,0 +1,317 @@
+# This is the spectrum file loader shared by the controllers and the UI
+
+import os
+import threading
+import warnings
+from collections import OrderedDict
+
+import numpy as np
+
+print("Spectrum module loaded")
+
+WAVE_MIN = 190
+WAVE_MAX = 1100
+SAT_MIN = 0.0125
+SAT_MAX = 1000
+
+
+class SpectrumFormatError(ValueError):
+    """Raised when a file is not a scan in the format the Cary exports."""
+
+
+class Spectrum:
+    """
+    A scan or blank read from a Cary CSV
+
+    Attributes:
+        path (str): the file it was read from
+        name (str): the method name from the header, e.g. "UVVis" or "UVVis_Blank"
+        wave_start (float), wave_stop (float), saturation (float): from the header
+        header (list): the raw header lines, kept to write corrected files back
+        data (np.ndarray): read-only (n, 2) float64 wavelength/absorbance rows
+        validated (bool): True if the header and wavelength spacing were checked
+    """
+
+    def __init__(
+        self,
+        path,
+        data,
+        header=None,
+        name="",
+        wave_start=None,
+        wave_stop=None,
+        saturation=None,
+        validated=False,
+    ):
+        self.path = str(path)
+        self.data = data
+        self.data.setflags(write=False)  # shared through the caches
+        self.header = list(header or [])
+        self.name = name
+        self.wave_start = wave_start
+        self.wave_stop = wave_stop
+        self.saturation = saturation
+        self.validated = bool(validated)
+
+    @property
+    def waves(self) -> np.ndarray:
+        return self.data[:, 0]
+
+    @property
+    def absorbance(self) -> np.ndarray:
+        return self.data[:, 1]
+
+    def with_data(self, data) -> "Spectrum":
+        """
+        Returns:
+            Spectrum: a copy with the same file and header but new rows, e.g. after blank correction
+        """
+        return Spectrum(
+            self.path,
+            np.array(data, dtype=np.float64),
+            header=self.header,
+            name=self.name,
+            wave_start=self.wave_start,
+            wave_stop=self.wave_stop,
+            saturation=self.saturation,
+            validated=self.validated,
+        )
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __repr__(self) -> str:
+        return (
+            f"Spectrum({self.path!r}, {self.name!r}, "
+            f"{self.wave_start}-{self.wave_stop} nm, {len(self)} points)"
+        )
+
+
+class SpectrumCache:
+    """
+    LRU cache of parsed spectra keyed by resolved path, mtime and size
+
+    A file that is rewritten gets a new key and is parsed again; otherwise
+    asking for the same file only costs a stat() call.
+    """
+
+    MAX_ENTRIES = 4
+
+    def __init__(self, max_entries: int = None, debug: bool = False):
+        self.max_entries = max_entries or self.MAX_ENTRIES
+        self.debug = bool(debug)
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _debug(self, message: str) -> None:
+        if self.debug:
+            print(f"[{type(self).__name__}] {message}")
+
+    @staticmethod
+    def _key(filename):
+        """
+        Returns:
+            tuple: (path, mtime_ns, size), or None if the file is missing
+        """
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            return None
+        return (os.path.realpath(filename), stat.st_mtime_ns, stat.st_size)
+
+    def get(self, filename, validated: bool = False):
+        """
+        Returns:
+            Spectrum: the cached spectrum, or None if it is not cached, the
+            file changed since, or validated is asked for and it was not
+        """
+        key = self._key(filename)
+        with self._lock:
+            entry = self._entries.get(key) if key else None
+            if entry is None or (validated and not entry.validated):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        self._debug(f"get() hit {filename}")
+        return entry
+
+    def put(self, filename, spectrum: Spectrum) -> Spectrum:
+        """Stores a spectrum, evicting the least recently used one if full."""
+        key = self._key(filename)
+        if key is None:
+            return spectrum
+        with self._lock:
+            # drop older versions of the same file
+            for stale in [k for k in self._entries if k[0] == key[0]]:
+                del self._entries[stale]
+            self._entries[key] = spectrum
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._debug(f"put() evicted {evicted[0]}")
+        return spectrum
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# the last few scans, so the file the controller just wrote is not parsed again for the plot
+RECENT = SpectrumCache()
+
+
+def _parse_header(first: str, second: str) -> dict:
+    """Checks the two Cary header lines and returns their settings."""
+    settings = first.split("-")
+    if len(settings) < 4:
+        raise SpectrumFormatError("Header has no method settings")
+
+    name = settings[0].split("_")
+    satSettings = settings[3].split(",")
+    if len(satSettings) < 3 or len(name) < 1 or name[0] != "UVVis":
+        raise SpectrumFormatError("Header is not a UVVis method")
+
+    fields = second.split(",")
+    if len(fields) < 2 or fields[0] != "Wavelength (nm)" or fields[1] != "Abs":
+        raise SpectrumFormatError("Missing 'Wavelength (nm),Abs' column header")
+
+    return {
+        "name": settings[0],
+        "wave_start": float(settings[1]),
+        "wave_stop": float(settings[2]),
+        "saturation": float(satSettings[0]),
+    }
+
+
+def _load_rows(lines) -> np.ndarray:
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")  # a header-only file is an empty scan
+        data = np.loadtxt(lines, delimiter=",", usecols=(0, 1), ndmin=2)
+    return data.astype(np.float64, copy=False)
+
+
+def _load_rows_lenient(lines) -> np.ndarray:
+    try:
+        return _load_rows(lines)
+    except (ValueError, IndexError):
+        pass
+    rows = []
+    for line in lines:
+        fields = line.split(",")
+        try:
+            rows.append((float(fields[0]), float(fields[1])))
+        except (ValueError, IndexError):
+            continue
+    return np.array(rows, dtype=np.float64).reshape(-1, 2)
+
+
+def load_spectrum(
+    path,
+    validate: bool = True,
+    wave_limits=(WAVE_MIN, WAVE_MAX),
+    sat_limits=(SAT_MIN, SAT_MAX),
+    cache: SpectrumCache = RECENT,
+) -> Spectrum:
+    """
+    Reads a spectrum file in one pass, validating it while it parses
+
+    Args:
+        path (str): the CSV file
+        validate (bool): require the Cary header, wavelength and saturation
+            limits and 1 nm steps from the header start; False accepts any
+            two-column CSV and skips rows that are not numbers
+        wave_limits (tuple): (min, max) wavelength the instrument covers
+        sat_limits (tuple): (min, max) saturation setting
+        cache (SpectrumCache): where recently read files are kept, None to skip
+
+    Returns:
+        Spectrum: the parsed spectrum
+
+    Raises:
+        SpectrumFormatError: the file is not a valid scan
+        FileNotFoundError: the file does not exist
+    """
+    if cache is not None:
+        cached = cache.get(path, validated=validate)
+        if cached is not None:
+            return cached
+
+    with open(path) as scanFile:
+        lines = scanFile.read().splitlines()
+
+    if validate:
+        if len(lines) < 2:
+            raise SpectrumFormatError("File is shorter than the header")
+        try:
+            meta = _parse_header(lines[0], lines[1])
+            data = _load_rows(lines[2:])
+        except SpectrumFormatError:
+            raise
+        except (ValueError, IndexError) as exc:
+            raise SpectrumFormatError(f"Unreadable value: {exc}") from exc
+
+        waveMin, waveMax = wave_limits
+        satMin, satMax = sat_limits
+        if (
+            meta["wave_start"] > waveMax
+            or meta["wave_stop"] < waveMin
+            or meta["wave_start"] <= meta["wave_stop"]
+        ):
+            raise SpectrumFormatError("Wavelength range outside the instrument")
+        if meta["saturation"] < satMin or meta["saturation"] > satMax:
+            raise SpectrumFormatError("Saturation outside the instrument")
+
+        # rows step down by about 1 nm, starting 1 nm below start + 1
+        steps = -np.diff(data[:, 0], prepend=meta["wave_start"] + 1)
+        if np.any((steps > 1.5) | (steps < 0.5)):
+            raise SpectrumFormatError("Wavelengths are not 1 nm apart")
+        header = [line + "\n" for line in lines[:2]]
+    else:
+        meta = {}
+        header = []
+        # skip leading text rows, such as the Cary header
+        for line in lines[:2]:
+            try:
+                float(line.split(",")[0])
+                break
+            except ValueError:
+                header.append(line + "\n")
+        if header:
+            try:
+                meta = _parse_header(*(lines[:2]))
+            except (ValueError, IndexError):
+                meta = {}
+        data = _load_rows_lenient(lines[len(header) :])
+        if not len(data):
+            raise SpectrumFormatError("No numeric data found in file.")
+
+    spectrum = Spectrum(path, data, header=header, validated=validate, **meta)
+    if cache is not None:
+        cache.put(path, spectrum)
+    return spectrum
+
+
+def write_spectrum(spectrum: Spectrum, cache: SpectrumCache = RECENT) -> Spectrum:
+    """
+    Writes a spectrum to its path: the header lines then "wave,abs," rows,
+    the layout the Cary exports. The spectrum also goes in the cache, so the
+    file is not parsed again when it is plotted.
+
+    Returns:
+        Spectrum: the spectrum written
+    """
+    data = spectrum.data
+    # one format call for the whole table, np.savetxt formats row by row
+    rows = ("%.15g,%.15g,\n" * len(data)) % tuple(data.ravel().tolist())
+    with open(spectrum.path, "w") as scanFile:
+        scanFile.writelines(spectrum.header)
+        scanFile.write(rows)
+
+    if cache is not None:
+        cache.put(spectrum.path, spectrum)
+    return spectrum
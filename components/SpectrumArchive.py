@@ -0,0 +1,192 @@
+# This is the binary spectrum archive, a scan that can be reopened without parsing text
+#
+# Layout, all little-endian:
+#   64 byte header  magic b"ICSA", version, flags, point count, wave start,
+#                   wave stop, saturation, method name, header text length
+#   float64 x[n]    wavelengths
+#   float64 y[n]    absorbance
+#   header text     the Cary header lines, so the CSV can be written back
+#
+# The columns start on a 64 byte boundary, so reading maps the file and
+# views them in place.
+
+import mmap
+import os
+import struct
+import sys
+from pathlib import Path
+
+import numpy as np
+
+try:
+    from Spectrum import Spectrum, load_spectrum, write_spectrum
+except ImportError:
+    from components.Spectrum import Spectrum, load_spectrum, write_spectrum
+
+print("SpectrumArchive module loaded")
+
+ARCHIVE_SUFFIX = ".spec"
+MAGIC = b"ICSA"
+VERSION = 1
+FLAG_VALIDATED = 0x1
+
+_HEADER = struct.Struct("<4sHHQddd16sI4x")
+HEADER_SIZE = _HEADER.size  # 64
+_COLUMN = np.dtype("<f8")
+
+
+class ArchiveFormatError(ValueError):
+    """Raised when a file is not a spectrum archive this version can read."""
+
+
+def archive_path(path) -> Path:
+    """The archive that goes with a scan CSV, e.g. scans/x.csv -> scans/x.spec"""
+    return Path(path).with_suffix(ARCHIVE_SUFFIX)
+
+
+def _meta(value) -> float:
+    return float("nan") if value is None else float(value)
+
+
+def _unmeta(value: float):
+    return None if value != value else value  # NaN marks a missing setting
+
+
+def write_archive(spectrum: Spectrum, path=None) -> Path:
+    """
+    Writes a spectrum as an archive
+
+    The file is written next to it and renamed into place, so a reader never
+    maps half a file.
+
+    Args:
+        spectrum (Spectrum): the scan to store
+        path (str): where to write it, by default the spectrum path with the archive suffix
+
+    Returns:
+        Path: the archive written
+    """
+    path = Path(path) if path is not None else archive_path(spectrum.path)
+    text = "".join(spectrum.header).encode("utf-8")
+    header = _HEADER.pack(
+        MAGIC,
+        VERSION,
+        FLAG_VALIDATED if spectrum.validated else 0,
+        len(spectrum),
+        _meta(spectrum.wave_start),
+        _meta(spectrum.wave_stop),
+        _meta(spectrum.saturation),
+        spectrum.name.encode("utf-8")[:16],
+        len(text),
+    )
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(header)
+        f.write(np.ascontiguousarray(spectrum.waves, dtype=_COLUMN).tobytes())
+        f.write(np.ascontiguousarray(spectrum.absorbance, dtype=_COLUMN).tobytes())
+        f.write(text)
+    os.replace(tmp, path)
+    return path
+
+
+def read_archive(path) -> Spectrum:
+    """
+    Maps an archive and returns a spectrum whose rows are a read-only view
+    of the mapping, nothing is copied or parsed
+
+    The mapping stays open while the returned arrays are referenced. On
+    Windows that also means the archive cannot be replaced until they are
+    released.
+
+    Raises:
+        ArchiveFormatError: the file is not a spectrum archive
+        FileNotFoundError: the file does not exist
+    """
+    with open(path, "rb") as f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError as exc:  # an empty file cannot be mapped
+            raise ArchiveFormatError(f"{path} is empty") from exc
+
+    try:
+        if len(mapped) < HEADER_SIZE:
+            raise ArchiveFormatError(f"{path} is shorter than the archive header")
+        (
+            magic,
+            version,
+            flags,
+            count,
+            start,
+            stop,
+            saturation,
+            name,
+            text_len,
+        ) = _HEADER.unpack_from(mapped)
+        if magic != MAGIC:
+            raise ArchiveFormatError(f"{path} is not a spectrum archive")
+        if version != VERSION:
+            raise ArchiveFormatError(
+                f"{path} is archive version {version}, expected {VERSION}"
+            )
+        columns_end = HEADER_SIZE + 2 * count * _COLUMN.itemsize
+        if len(mapped) < columns_end + text_len:
+            raise ArchiveFormatError(f"{path} is truncated")
+    except ArchiveFormatError:
+        # nothing references the mapping yet, release it so the file can be removed
+        mapped.close()
+        raise
+
+    # x then y, viewed as (n, 2) rows like every other Spectrum
+    columns = np.frombuffer(mapped, dtype=_COLUMN, count=2 * count, offset=HEADER_SIZE)
+    text = mapped[columns_end : columns_end + text_len].decode("utf-8")
+    return Spectrum(
+        path,
+        columns.reshape(2, count).T,
+        header=text.splitlines(keepends=True),
+        name=name.rstrip(b"\0").decode("utf-8"),
+        wave_start=_unmeta(start),
+        wave_stop=_unmeta(stop),
+        saturation=_unmeta(saturation),
+        validated=bool(flags & FLAG_VALIDATED),
+    )
+
+
+def csv_to_archive(csv_path, path=None, validate: bool = True) -> Path:
+    """
+    Converts a scan CSV (the "UVVis-start-stop-sat,bw" layout) to an archive
+
+    Args:
+        csv_path (str): the scan
+        path (str): the archive to write, by default next to the CSV
+        validate (bool): passed to load_spectrum, False also converts plain two-column CSVs
+
+    Returns:
+        Path: the archive written
+    """
+    return write_archive(load_spectrum(csv_path, validate=validate), path)
+
+
+def archive_to_csv(path, csv_path=None) -> Path:
+    """
+    Writes an archive back out in the CSV layout the Cary exports
+
+    The rows are copied out of the mapping first, since the written spectrum
+    is kept in the cache and would otherwise hold the archive open.
+
+    Returns:
+        Path: the CSV written
+    """
+    mapped = read_archive(path)
+    spectrum = mapped.with_data(mapped.data)
+    csv_path = (
+        Path(csv_path) if csv_path is not None else Path(path).with_suffix(".csv")
+    )
+    spectrum.path = str(csv_path)
+    write_spectrum(spectrum)
+    return csv_path
+
+
+if __name__ == "__main__":
+    # python SpectrumArchive.py scans/*.csv
+    for name in sys.argv[1:]:
+        print(csv_to_archive(name, validate=False))
@@ -0,0 +1,94 @@
+# This is the on-disk format of staged samples, shared by the uploader and Sample
+#
+# A staged sample is username_datetime_unsent.json, one object per line:
+# {"instrument-type": ...} then {"nm": ..., "abs": ...} for each point. Next
+# to it a sidecar (SIDECAR_SUFFIX) keeps the same points as packed float64
+# columns, so they can be read back without parsing the JSON.
+#
+# Sidecar layout, all little-endian: header (magic, instrument type code,
+# point count), then every nm value, then every abs value.
+
+import json
+import struct
+import sys
+from array import array
+from pathlib import Path
+
+print("StagedSample module loaded")
+
+SIDECAR_SUFFIX = ".cols"
+_SIDECAR_MAGIC = b"ICNC"
+_SIDECAR_HEADER = struct.Struct("<4sBI")
+_SIDECAR_TYPES = ("uv-vis", "ir")
+
+
+def sidecar_path(samplePath) -> Path:
+    return Path(samplePath).with_suffix(SIDECAR_SUFFIX)
+
+
+def write_sidecar(samplePath, instrument_type, nm, absorbance) -> None:
+    """
+    Writes the packed float64 columns of a staged sample next to its JSON so
+    uploads can skip re-parsing the per-row JSON
+
+    Args:
+        samplePath (String): the staged JSON file
+        instrument_type (String): "uv-vis" or "ir"
+        nm (array): wavelengths, array("d")
+        absorbance (array): absorbance values, array("d")
+    """
+    if sys.byteorder != "little":
+        nm, absorbance = array("d", nm), array("d", absorbance)
+        nm.byteswap()
+        absorbance.byteswap()
+    header = _SIDECAR_HEADER.pack(
+        _SIDECAR_MAGIC,
+        _SIDECAR_TYPES.index(instrument_type),
+        len(nm),
+    )
+    with open(sidecar_path(samplePath), "wb") as f:
+        f.write(header)
+        nm.tofile(f)
+        absorbance.tofile(f)
+
+
+def read_sidecar(samplePath):
+    """
+    Reads a staged sample's packed columns
+
+    Returns:
+        tuple: (instrument_type, nm array, abs array), or None if there is no
+        usable sidecar
+    """
+    sidecar = sidecar_path(samplePath)
+    try:
+        with open(sidecar, "rb") as f:
+            magic, type_code, count = _SIDECAR_HEADER.unpack(
+                f.read(_SIDECAR_HEADER.size)
+            )
+            if magic != _SIDECAR_MAGIC or type_code >= len(_SIDECAR_TYPES):
+                return None
+            nm, absorbance = array("d"), array("d")
+            nm.fromfile(f, count)
+            absorbance.fromfile(f, count)
+    except (OSError, EOFError, struct.error):
+        return None
+    if sys.byteorder != "little":
+        nm.byteswap()
+        absorbance.byteswap()
+    return _SIDECAR_TYPES[type_code], nm, absorbance
+
+
+def staged_rows(lines):
+    """
+    Yields the row objects of a staged file one line at a time. Also reads
+    files staged before the rows were comma separated, which are not
+    valid JSON as a whole.
+    """
+    for line in lines:
+        stripped = line.strip()
+        if not stripped or stripped in {"[", "]"}:
+            continue
+        if stripped.endswith(","):
+            stripped = stripped[:-1]
+        yield json.loads(stripped)
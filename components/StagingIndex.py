@@ -0,0 +1,205 @@
+# This is the staging index for samples waiting to be uploaded
+
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+print("StagingIndex module loaded")
+
+
+class StagingIndex:
+    """
+    SQLite index of the samples staged for upload in a ServerController file_dir
+
+    Keeps one row per staged file with its state (unsent/sent/failed), owner,
+    dataKey, size and retry bookkeeping, so picking the files to upload is a
+    query over the pending rows instead of a listing of every file ever staged.
+    """
+
+    INDEX_FILE = "staging_index.sqlite3"
+    STATE_UNSENT = "unsent"
+    STATE_SENT = "sent"
+    STATE_FAILED = "failed"
+    PENDING_STATES = (STATE_UNSENT, STATE_FAILED)
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS samples (
+            filename TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            data_key TEXT NOT NULL,
+            state TEXT NOT NULL,
+            size INTEGER NOT NULL DEFAULT 0,
+            staged_at REAL NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt REAL NOT NULL DEFAULT 0,
+            last_error TEXT NOT NULL DEFAULT ''
+        );
+        CREATE INDEX IF NOT EXISTS samples_pending ON samples (state, next_attempt);
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+    """
+
+    def __init__(self, directory, debug: bool = False):
+        self.directory = Path(directory)
+        self.debug = bool(debug)
+        self.path = self.directory / self.INDEX_FILE
+
+        # one connection shared by the upload worker threads, guarded by a lock
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._lock, self._db:
+            self._db.executescript(self._SCHEMA)
+
+        self.migrate()
+
+    def _debug(self, message: str) -> None:
+        if self.debug:
+            print(f"[StagingIndex] {message}")
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    @staticmethod
+    def split_name(filename):
+        """
+        Splits a staged filename into (owner, data_key, flag)
+
+        Returns:
+            tuple: the three parts, or None if the name is not a staged sample
+        """
+        path = Path(filename)
+        if path.suffix.lower() != ".json":
+            return None
+        parts = path.stem.rsplit("_", 2)
+        if len(parts) != 3:
+            return None
+        return tuple(parts)
+
+    def migrate(self, force: bool = False) -> int:
+        """
+        Imports staged files already on disk into the index. Runs once per
+        staging directory (or again with force=True) and leaves rows that are
+        already indexed untouched.
+
+        Returns:
+            int: the number of files imported
+        """
+        with self._lock:
+            done = self._db.execute(
+                "SELECT value FROM meta WHERE key = 'migrated'"
+            ).fetchone()
+        if done and not force:
+            return 0
+
+        rows = []
+        for filepath in self.directory.iterdir():
+            if not filepath.is_file():
+                continue
+            parts = self.split_name(filepath.name)
+            if parts is None:
+                continue
+            owner, data_key, flag = parts
+            flag = flag.lower()
+            if flag not in (self.STATE_UNSENT, self.STATE_SENT):
+                continue
+            stat = filepath.stat()
+            rows.append(
+                (filepath.name, owner, data_key, flag, stat.st_size, stat.st_mtime)
+            )
+
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO samples "
+                "(filename, owner, data_key, state, size, staged_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated', ?)",
+                (str(time.time()),),
+            )
+        self._debug(f"migrate() imported {len(rows)} staged files")
+        return len(rows)
+
+    def add(self, filename, size: int = 0) -> None:
+        """Registers a newly staged (unsent) file, resetting any earlier row of the same name."""
+        owner, data_key, _ = self.split_name(filename)
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO samples "
+                "(filename, owner, data_key, state, size, staged_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    Path(filename).name,
+                    owner,
+                    data_key,
+                    self.STATE_UNSENT,
+                    size,
+                    time.time(),
+                ),
+            )
+
+    def mark_sent(self, filename) -> None:
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE samples SET state = ?, last_error = '' WHERE filename = ?",
+                (self.STATE_SENT, Path(filename).name),
+            )
+
+    def mark_failed(self, filename, error: str = "", retry_at: float = 0.0) -> int:
+        """
+        Records a failed upload attempt
+
+        Returns:
+            int: the number of attempts made so far
+        """
+        name = Path(filename).name
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE samples SET state = ?, attempts = attempts + 1, "
+                "last_error = ?, next_attempt = ? WHERE filename = ?",
+                (self.STATE_FAILED, error, retry_at, name),
+            )
+            row = self._db.execute(
+                "SELECT attempts FROM samples WHERE filename = ?", (name,)
+            ).fetchone()
+        return row["attempts"] if row else 0
+
+    def forget(self, filename) -> None:
+        with self._lock, self._db:
+            self._db.execute(
+                "DELETE FROM samples WHERE filename = ?", (Path(filename).name,)
+            )
+
+    def pending(self, due_before: float = None) -> list:
+        """
+        Lists the staged files still waiting to be uploaded, oldest first
+
+        Args:
+            due_before (float): only rows whose next retry time is at or before this
+
+        Returns:
+            list: dict rows with filename, owner, data_key, state, size, attempts,
+            next_attempt and last_error
+        """
+        query = "SELECT * FROM samples WHERE state IN (?, ?)"
+        params = list(self.PENDING_STATES)
+        if due_before is not None:
+            query += " AND next_attempt <= ?"
+            params.append(due_before)
+        query += " ORDER BY staged_at"
+        with self._lock:
+            return [dict(row) for row in self._db.execute(query, params)]
+
+    def counts(self) -> dict:
+        """
+        Returns:
+            dict: number of indexed files per state
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT state, COUNT(*) AS n FROM samples GROUP BY state"
+            ).fetchall()
+        return {row["state"]: row["n"] for row in rows}
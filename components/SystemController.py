@@ -1,14 +1,21 @@
 # This is the system controller
 
+import threading
 from pathlib import Path
 from datetime import datetime
 
 try:
     from InstrumentController import InstrumentController
     from ServerController import ServerController
+    from UploadDaemon import UploadDaemon
+    from HealthMonitor import HealthMonitor
+    from Sample import Sample
 except ImportError:
     from components.InstrumentController import InstrumentController
     from components.ServerController import ServerController
+    from components.UploadDaemon import UploadDaemon
+    from components.HealthMonitor import HealthMonitor
+    from components.Sample import Sample
 
 print("SystemController imported")
 
@@ -17,6 +24,8 @@ print("SystemController imported")
 class SystemController:
 
     # I need variables
+    INSTRUMENT_TTL_S = 30.0
+    SERVER_TTL_S = 15.0
 
     # ------------------------------------------------------------------------------------------------------------------------------------------
     def __init__(
@@ -26,6 +35,7 @@ class SystemController:
         instrument_controller_cls=InstrumentController,
         file_dir=None,
         debug: bool = True,
+        background_upload: bool = False,
     ):
         print(
             "[SystemController][RECEIVED] __init__ "
@@ -51,10 +61,27 @@ class SystemController:
             330: "User not logged in",
             300: "No active session",
             400: "No data",
+            410: "Scan aborted",
             550: "No blank to set",
         }
         self.offline = False  # not self.ServController.ping()
         self.offlineUsername = None
+        # set by abortScan, the sample of an aborted scan is neither staged nor uploaded
+        self._scan_aborted = False
+        # token of the capture scanning now, abortScan(token) only stops that one
+        self._capture_token = None
+        self._abort_lock = threading.Lock()
+
+        # optional background uploader, scans then only stage their data
+        self.Uploader = None
+        if background_upload:
+            self.Uploader = UploadDaemon(self.ServController, debug=self.debug)
+            self.Uploader.start()
+
+        # cached liveness of the instrument bridge and ICN, refreshed in the background
+        self.Health = HealthMonitor(debug=self.debug)
+        self.Health.add_target("instrument", self._probe_instrument, self.INSTRUMENT_TTL_S)
+        self.Health.add_target("server", self._probe_server, self.SERVER_TTL_S)
         print("[SystemController][EXECUTED] __init__ controllers initialized")
 
     def _print_received(self, command: str, payload=None) -> None:
@@ -69,33 +96,44 @@ class SystemController:
 
     def _instrument_ready(self) -> bool:
         self._print_received("_instrument_ready")
+        ready = self.Health.is_ready("instrument")
+        self._print_executed("_instrument_ready", ready)
+        return ready
+
+    def _server_ready(self) -> bool:
+        self._print_received("_server_ready")
+        ready = self.Health.is_ready("server")
+        self._print_executed("_server_ready", ready)
+        return ready
+
+    def _probe_instrument(self) -> bool:
+        # only looks, a dead bridge is relaunched by startUp / setup(), not here
         ping = getattr(self.InstController, "ping", None)
         if callable(ping):
+            busy = getattr(self.InstController, "is_busy", None)
+            if callable(busy) and busy():
+                # a command is running on the bridge, so it is alive
+                self._debug("_probe_instrument() bridge busy -> True")
+                return True
             ready = bool(ping())
-            self._debug(f"_instrument_ready() via ping -> {ready}")
-            self._print_executed("_instrument_ready", ready)
+            self._debug(f"_probe_instrument() via ping -> {ready}")
             return ready
         ready = bool(self.InstController)
-        self._debug(f"_instrument_ready() fallback -> {ready}")
-        self._print_executed("_instrument_ready", ready)
+        self._debug(f"_probe_instrument() fallback -> {ready}")
         return ready
 
-    def _server_ready(self) -> bool:
-        self._print_received("_server_ready")
+    def _probe_server(self) -> bool:
         connect = getattr(self.ServController, "connect", None)
         if callable(connect):
             ready = bool(connect())
-            self._debug(f"_server_ready() via connect -> {ready}")
-            self._print_executed("_server_ready", ready)
+            self._debug(f"_probe_server() via connect -> {ready}")
             return ready
         try:
             ready = bool(self.ServController.ping())
-            self._debug(f"_server_ready() via ping -> {ready}")
-            self._print_executed("_server_ready", ready)
+            self._debug(f"_probe_server() via ping -> {ready}")
             return ready
         except Exception as exc:
-            self._debug(f"_server_ready() ping exception: {exc}")
-            self._print_executed("_server_ready", False)
+            self._debug(f"_probe_server() ping exception: {exc}")
             return False
 
     # ------------------------------------------------------------------------------------------------------------------------------------------
@@ -107,7 +145,9 @@ class SystemController:
         InstConn = self.InstController.setup()
         self._print_executed("InstrumentController.setup", InstConn)
         self._debug(f"startUp() instrument setup -> {InstConn}")
+        self.Health.mark("instrument", InstConn)
         if InstConn:
+            self.Health.start()
             # verify server connection
             ServConn = self._server_ready()
             self._debug(f"startUp() server connect -> {ServConn}")
@@ -151,9 +191,16 @@ class SystemController:
         self._debug("signOut() invoked")
         if self._server_ready():
             # send all data to the server controller after taking samples
-            self._print_received("ServerController.send_all_data")
-            upload_result = self.ServController.send_all_data()
-            self._print_executed("ServerController.send_all_data", upload_result)
+            if self.Uploader is not None:
+                self._print_received("UploadDaemon.run_once", {"force": True})
+                upload_result = self.Uploader.run_once(force=True)
+                self._print_executed("UploadDaemon.run_once", upload_result)
+            else:
+                self._print_received("ServerController.send_all_data")
+                upload_result = self.ServController.send_all_data(
+                    max_workers=getattr(self.ServController, "UPLOAD_WORKERS", 1)
+                )
+                self._print_executed("ServerController.send_all_data", upload_result)
             self._debug(f"signOut() send_all_data -> {upload_result}")
             # check to see if anyone is logged in already
             if self.ServController.is_logged_in():
@@ -174,66 +221,169 @@ class SystemController:
             return 110
 
     # ------------------------------------------------------------------------------------------------------------------------------------------
-    def runLabMachine(self):
+    def runLabMachine(self, progress=None):
+        """
+        Args:
+            progress (callable): if given, called with each (k, 2) chunk of
+                points while the instrument is still acquiring them
+        """
         self._print_received("runLabMachine")
         # verify instrument connection
         self._debug("runLabMachine() invoked")
 
+        code, sample, owner = self._capture_sample(progress)
+        if code == 000:
+            code = self._upload_sample(sample, owner)
+
+        self._print_executed("runLabMachine", (code, sample))
+        return code, sample  # Sample is returned for graphing, os.fspath() gives its CSV
+
+    def _capture_sample(self, progress=None, token=None):
+        """
+        Instrument half of runLabMachine: takes the sample for the active user
+
+        Args:
+            progress (callable): see runLabMachine
+            token (object): identifies this capture to abortScan
+
+        Returns:
+            tuple: (error code, Sample for the scan CSV or None, user the
+            sample belongs to)
+        """
         activeUser = self.ServController.user
         if not activeUser:
             if not self.offline:
-                self._print_executed("runLabMachine", (300, None))
-                return 300, None
+                return 300, None, None
             else:
                 activeUser = self.offlineUsername
 
-        if self._instrument_ready():
-            # sends instructions to machine to run test
-            self._print_received("InstrumentController.take_sample")
-            targetFilename = activeUser + datetime.now().strftime("%Y-%m-%dT%H-%M-%S") + ".csv"
-            csv_path = self.InstController.take_sample(targetFilename)
-            self._print_executed("InstrumentController.take_sample", csv_path)
-            self._debug(f"runLabMachine() sample received={bool(csv_path)}")
-            if csv_path:
-                self.ServController.parse_csv(csv_path)
-                #verify server connection
-                if self._server_ready():
-                    # sends data to UI somehow and send data to server controller to send to the ICN
-                    self._print_received("ServerController.send_all_data")
-                    sent = self.ServController.send_all_data()
-                    self._print_executed("ServerController.send_all_data", sent)
-                    self._debug(f"runLabMachine() send_all_data -> {sent}")
-                    expected_name = None
-                    if self.ServController.user and csv_path:
-                        csv_stem = Path(csv_path).stem
-                        if csv_stem.startswith(self.ServController.user):
-                            csv_key = csv_stem[len(self.ServController.user) :]
-                        else:
-                            csv_key = csv_stem
-                        expected_name = (
-                            f"{self.ServController.user}_{csv_key}_unsent.json"
-                        )
-
-                    for fileSent in sent:
-                        if fileSent[1] is False:
-                            self._debug(f"runLabMachine() failed to send {fileSent[0]}")
-
-                    if expected_name and any(
-                        filename == expected_name and ok for filename, ok in sent
-                    ):
-                        self._print_executed("runLabMachine", (0, csv_path))
-                        return 000, csv_path  # CSV is returned for graphing
-                    self._print_executed("runLabMachine", (110, csv_path))
-                    return 110, csv_path
-                else:
-                    self._print_executed("runLabMachine", (110, csv_path))
-                    return 110, csv_path
+        if not self._instrument_ready():
+            return 100, None, activeUser
+
+        # sends instructions to machine to run test
+        self._print_received("InstrumentController.take_sample")
+        targetFilename = activeUser + datetime.now().strftime("%Y-%m-%dT%H-%M-%S") + ".csv"
+        with self._abort_lock:
+            self._capture_token = token
+            self._scan_aborted = False
+        try:
+            stream = getattr(self.InstController, "stream_sample", None)
+            if progress is not None and stream is not None:
+                csv_path = self._stream_sample(stream(targetFilename), progress)
             else:
-                self._print_executed("runLabMachine", (400, None))
-                return 400, None
-        else:
-            self._print_executed("runLabMachine", (100, None))
-            return 100, None
+                csv_path = self.InstController.take_sample(targetFilename)
+        finally:
+            with self._abort_lock:
+                self._capture_token = None
+                aborted = self._scan_aborted
+        self._print_executed("InstrumentController.take_sample", csv_path)
+        self._debug(f"runLabMachine() sample received={bool(csv_path)}")
+        if aborted:
+            # the bridge may still have finished the scan, the user asked to discard it
+            self._debug("runLabMachine() scan aborted, discarding the sample")
+            return 410, None, activeUser
+        if not csv_path:
+            # may be a bad scan or a dead bridge, check again next time
+            self.Health.invalidate("instrument")
+            return 400, None, activeUser
+        self.Health.mark("instrument", True)
+        # nothing is read yet, the first layer that needs the points loads them
+        return 000, Sample.from_file(csv_path), activeUser
+
+    @staticmethod
+    def _stream_sample(points, progress):
+        """Passes each chunk of a stream_sample generator on, returning the sample path."""
+        while True:
+            try:
+                progress(next(points))
+            except StopIteration as done:
+                return done.value
+
+    def abortScan(self, token=None):
+        """
+        Stops the scan runLabMachine is streaming, its sample is then discarded
+        even if the instrument finishes the scan anyway
+
+        Args:
+            token (object): only stop the scan if it belongs to the capture
+                given this token, not one started since
+
+        Returns:
+            bool: True if there was a scan to stop
+        """
+        self._print_received("abortScan")
+        with self._abort_lock:
+            if token is not None and token is not self._capture_token:
+                self._debug("abortScan() that capture is no longer scanning")
+                aborted = False
+            else:
+                self._scan_aborted = True
+                abort = getattr(self.InstController, "abort_scan", None)
+                aborted = bool(abort()) if abort is not None else False
+        self._print_executed("abortScan", aborted)
+        return aborted
+
+    def canAbortScan(self):
+        """
+        Whether a running scan can be stopped part way, to offer Abort
+
+        Returns:
+            bool: False if the instrument can only finish the scan
+        """
+        can_abort = getattr(self.InstController, "can_abort", None)
+        return bool(can_abort()) if can_abort is not None else False
+
+    def _upload_sample(self, sample, owner=None):
+        """
+        Server half of runLabMachine: stages the sample and uploads it to ICN
+
+        Args:
+            sample (Sample): the scan to stage
+            owner (String): who took it, staged under the logged-in user if not
+                given; a different user may have signed in since the scan
+
+        Returns:
+            int: 0 if the sample was uploaded (or handed to the background
+            uploader), 110 if it is staged but not uploaded
+        """
+        owner = owner or self.ServController.user
+        staged = self.ServController.parse_csv(sample, owner)
+        if self.Uploader is not None:
+            # hand the staged file to the background uploader, don't wait on ICN
+            self.Uploader.notify()
+            return 000 if staged else 110
+
+        #verify server connection
+        if not self._server_ready():
+            return 110
+
+        # sends data to UI somehow and send data to server controller to send to the ICN
+        self._print_received("ServerController.send_all_data")
+        sent = self.ServController.send_all_data()
+        self._print_executed("ServerController.send_all_data", sent)
+        self._debug(f"runLabMachine() send_all_data -> {sent}")
+        if any(ok for _, ok in sent):
+            self.Health.mark("server", True)
+        elif sent:
+            self.Health.invalidate("server")
+        expected_name = None
+        if owner and sample:
+            csv_stem = Path(sample).stem
+            if csv_stem.startswith(owner):
+                csv_key = csv_stem[len(owner) :]
+            else:
+                csv_key = csv_stem
+            expected_name = f"{owner}_{csv_key}_unsent.json"
+
+        for fileSent in sent:
+            if fileSent[1] is False:
+                self._debug(f"runLabMachine() failed to send {fileSent[0]}")
+
+        if expected_name and any(
+            filename == expected_name and ok for filename, ok in sent
+        ):
+            return 000
+        return 110
 
     # ------------------------------------------------------------------------------------------------------------------------------------------
     def takeBlank(self, filename=None):
@@ -311,6 +461,26 @@ class SystemController:
             self._print_executed("takeSample", (100, None))
             return 100, None
 
+    # ------------------------------------------------------------------------------------------------------------------------------------------
+    def estimateTime(self, command="SCAN"):
+        """
+        How long a capture is expected to take, for the progress dialog
+
+        Args:
+            command (String): "SCAN" for a sample, "BLANK" for a blank
+
+        Returns:
+            float: seconds, or None if the instrument cannot estimate it
+        """
+        estimate = getattr(self.InstController, "estimateTime", None)
+        if estimate is None:
+            return None
+        try:
+            return estimate(command)
+        except Exception as exc:
+            self._debug(f"estimateTime() failed: {exc}")
+            return None
+
     # ------------------------------------------------------------------------------------------------------------------------------------------
     def stopProgram(self):
         self._print_received("stopProgram")
@@ -319,7 +489,17 @@ class SystemController:
 
         # sends instructions for the Instrument Controller to shut down the machine
         self._print_received("InstrumentController.shutdown")
+        self.Health.stop()
         shut_ok = self.InstController.shutdown()
+
+        if self.Uploader is not None:
+            self.Uploader.stop()
+
+        # drop pooled keep-alive connections to ICN
+        close = getattr(self.ServController, "close", None)
+        if callable(close):
+            close()
+
         result = 000 if shut_ok else 100
         self._print_executed("stopProgram", result)
         return result
@@ -0,0 +1,142 @@
+# This is the background upload service
+
+import threading
+import time
+from pathlib import Path
+
+print("UploadDaemon module loaded")
+
+
+class UploadDaemon:
+    """
+    Uploads staged samples to ICN on a background thread
+
+    Works through the pending samples of the ServerController staging index
+    (see StagingIndex), which durably keeps the retry count and next retry
+    time of every pending file. Failed uploads back off exponentially, so an
+    offline lab PC does not hammer the server, and scans never wait on the
+    network.
+    """
+
+    POLL_INTERVAL_S = 5.0
+    BACKOFF_BASE_S = 5.0
+    BACKOFF_MAX_S = 600.0
+
+    def __init__(self, server_controller, debug: bool = False, poll_interval_s=None):
+        print(
+            f"[UploadDaemon][RECEIVED] __init__ payload={{'file_dir': {server_controller.file_dir}, 'debug': {debug}}}"
+        )
+        self.server = server_controller
+        self.debug = bool(debug)
+        self.poll_interval_s = poll_interval_s or self.POLL_INTERVAL_S
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        print("[UploadDaemon][EXECUTED] __init__ result=initialized")
+
+    def _debug(self, message: str) -> None:
+        if self.debug:
+            print(f"[UploadDaemon] {message}")
+
+    def _print_received(self, command: str, payload=None) -> None:
+        print(f"[UploadDaemon][RECEIVED] {command} payload={payload}")
+
+    def _print_executed(self, command: str, result=None) -> None:
+        print(f"[UploadDaemon][EXECUTED] {command} result={result}")
+
+    def _backoff_s(self, attempts: int) -> float:
+        return min(
+            self.BACKOFF_BASE_S * (2 ** max(attempts - 1, 0)), self.BACKOFF_MAX_S
+        )
+
+    def start(self) -> None:
+        """Starts the background upload thread (no-op if already running)."""
+        self._print_received("start")
+        if self._thread is not None and self._thread.is_alive():
+            self._print_executed("start", "already running")
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="UploadDaemon", daemon=True
+        )
+        self._thread.start()
+        self._print_executed("start", True)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stops the background thread after the upload in progress finishes."""
+        self._print_received("stop")
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+        self._print_executed("stop", True)
+
+    def notify(self) -> None:
+        """Wakes the uploader now, e.g. right after a sample was staged."""
+        self._wake.set()
+
+    def pending(self) -> dict:
+        """
+        Returns:
+            dict: filename -> retry state of every sample waiting to upload
+        """
+        index = self.server._staging_index()
+        if index is None:
+            return {}
+        return {row["filename"]: row for row in index.pending()}
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                self.run_once()
+            except Exception as exc:
+                self._debug(f"_run() upload pass failed: {exc}")
+            self._wake.wait(self.poll_interval_s)
+            self._wake.clear()
+
+    def run_once(self, force: bool = False):
+        """
+        Makes one upload pass over the pending samples
+
+        Args:
+            force (bool): ignore backoff and try every pending file now
+
+        Returns:
+            list of filenames and boolean indicating if sent
+        """
+        results = []
+        with self._lock:
+            index = self.server._staging_index()
+            if index is None:
+                return results
+
+            due = index.pending(due_before=None if force else time.time())
+            for row in due:
+                if self._stopping.is_set() and not force:
+                    break
+                name = row["filename"]
+                path = Path(self.server.file_dir) / name
+                if not path.is_file():
+                    index.forget(name)
+                    continue
+                try:
+                    sent = bool(self.server.send_data(str(path)))
+                    error = "" if sent else "upload rejected"
+                except Exception as exc:
+                    sent, error = False, str(exc)
+
+                results.append((name, sent))
+                if sent:
+                    continue
+                delay = self._backoff_s(row["attempts"] + 1)
+                attempts = index.mark_failed(name, error, time.time() + delay)
+                self._debug(
+                    f"run_once() {name} failed attempt={attempts}, retry in {delay}s"
+                )
+
+        if results:
+            self._print_executed("run_once", results)
+        return results
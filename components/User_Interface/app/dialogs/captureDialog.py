@@ -1,5 +1,5 @@
-from PyQt6.QtWidgets import QDialog, QVBoxLayout, QLabel, QMessageBox
-from PyQt6.QtCore import Qt, QThread, pyqtSignal
+from PyQt6.QtWidgets import QDialog, QVBoxLayout, QLabel, QMessageBox, QPushButton
+from PyQt6.QtCore import Qt, QThread, QTimer, QElapsedTimer, pyqtSignal
 from PyQt6.QtGui import QFont
 
 # ── Palette ─────────────────────
@@ -9,14 +9,22 @@ TEXT_MUTED = "#909090"
 
 
 class CaptureWorker(QThread):
-    """Runs a blocking capture function on a background thread."""
+    """
+    Runs a blocking capture function on a background thread.
+    With `with_progress=True` the function is also given `progress=`, a
+    callable that re-emits each chunk of points on `progress` so the plot
+    can be updated from the GUI thread while the scan runs.
+    """
     finished = pyqtSignal(object)
+    progress = pyqtSignal(object)
 
-    def __init__(self, func, *args, **kwargs):
+    def __init__(self, func, *args, with_progress=False, **kwargs):
         super().__init__()
         self._func = func
         self._args = args
         self._kwargs = kwargs
+        if with_progress:
+            self._kwargs["progress"] = self.progress.emit
 
     def run(self):
         result = self._func(*self._args, **self._kwargs)
@@ -29,14 +37,20 @@ class CaptureDialog(QDialog):
     Includes a Cancel button; clicking it shows a confirmation prompt.
     If confirmed, emits `cancelled` and closes — the caller is responsible
     for discarding any in-progress data.
+    Given `estimate_s` (from the controller's learned command durations) it
+    also shows the time elapsed against the expected time.
+    With `abortable=True` it shows an Abort button; the caller connects
+    `cancelled` to whatever stops the scan on the instrument.
     """
     cancelled = pyqtSignal()
 
-    def __init__(self, title="Capturing", message="Please wait...", parent=None):
+    def __init__(
+        self, title="Capturing", message="Please wait...", parent=None, estimate_s=None, abortable=False
+    ):
         super().__init__(parent)
         self.setWindowTitle(title)
         self.setModal(True)
-        self.setFixedSize(340, 110)
+        self.setFixedSize(340, (110 if not estimate_s else 135) + (40 if abortable else 0))
         self.setWindowFlags(
             Qt.WindowType.Dialog |
             Qt.WindowType.CustomizeWindowHint |
@@ -58,6 +72,54 @@ class CaptureDialog(QDialog):
         )
         layout.addWidget(msg)
 
+        self._estimate_s = estimate_s
+        self._progress = None
+        if estimate_s:
+            self._progress = QLabel()
+            self._progress.setFont(QFont("Helvetica Neue", 9))
+            self._progress.setAlignment(Qt.AlignmentFlag.AlignCenter)
+            self._progress.setStyleSheet(
+                f"color: {TEXT_MUTED}; background: transparent; border: none;"
+            )
+            layout.addWidget(self._progress)
+
+            self._elapsed = QElapsedTimer()
+            self._elapsed.start()
+            self._timer = QTimer(self)
+            self._timer.timeout.connect(self._update_progress)
+            self._timer.start(1000)
+            self._update_progress()
+
+        if abortable:
+            abort_btn = QPushButton("Abort")
+            abort_btn.setFont(QFont("Helvetica Neue", 9))
+            abort_btn.setStyleSheet(
+                f"color: {TEXT_MAIN}; background: transparent; border: 1px solid {TEXT_MUTED};"
+                " border-radius: 4px; padding: 4px 16px;"
+            )
+            abort_btn.clicked.connect(self._on_abort)
+            layout.addWidget(abort_btn, alignment=Qt.AlignmentFlag.AlignCenter)
+
+    def _on_abort(self):
+        answer = QMessageBox.question(
+            self,
+            "Abort Capture",
+            "Stop this scan? The points acquired so far will be discarded.",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+            QMessageBox.StandardButton.No,
+        )
+        if answer == QMessageBox.StandardButton.Yes:
+            self.cancelled.emit()
+            self.done(0)
+
+    def _update_progress(self):
+        elapsed = self._elapsed.elapsed() // 1000
+        expected = round(self._estimate_s)
+        if elapsed <= expected:
+            self._progress.setText(f"{elapsed} s of about {expected} s")
+        else:
+            self._progress.setText(f"{elapsed} s — taking longer than the usual {expected} s")
+
     def closeEvent(self, event):
         """Prevent the user from closing the dialog manually."""
         event.ignore()
@@ -6,7 +6,7 @@ Simply — Jack of all Spades
 from app.widgets.plot import SamplePlot
 from app.dialogs.loginErrorDialogs import InvalidUsernameDialog, ServerOfflineDialog
 from app.dialogs.sampleSuccessDialog import SampleSuccessDialog
-from pathlib import Path
+import os
 from PyQt6.QtWidgets import (
     QWidget,
     QVBoxLayout,
@@ -382,28 +382,34 @@ class ActionPanel(Panel):
         dialog = CaptureDialog(
             title="Capturing Sample",
             message="Please wait while the sample is being captured...",
+            estimate_s=self.app.controller.estimateTime("SCAN"),
+            abortable=self.app.controller.canAbortScan(),
             parent=self,
         )
-        self._sample_worker = CaptureWorker(self.app.controller.runLabMachine)
+        self._sample_worker = CaptureWorker(self.app.controller.runLabMachine, with_progress=True)
+        data_viewer = self.main_window.pages["session"].data_viewer if self.main_window else None
+        if data_viewer is not None:
+            # the spectrum is drawn as it is acquired, replaced by the sample when done
+            self._sample_worker.progress.connect(data_viewer.extend_partial)
 
         def on_done(result):
+            if data_viewer is not None:
+                data_viewer.clear_partial()
             if self._sample_cancelled:
                 return
             dialog.done(0)
-            code, csv_path = result
-            if code == 0 and csv_path:
-                sample_name = Path(csv_path).name
-                self.app.state.sample_files.append(csv_path)
+            code, sample = result
+            if code == 0 and sample:
+                sample_name = sample.name
+                self.app.state.sample_files.append(os.fspath(sample))
                 SampleSuccessDialog(sample_name, parent=self).exec()
-                if self.main_window:
-                    data_viewer = self.main_window.pages["session"].data_viewer
-                    data_viewer.add_sample_csv(sample_name, csv_path)
+                if data_viewer is not None:
+                    data_viewer.add_sample_csv(sample_name, sample)
             else:
-                if code == 110 and csv_path:
-                    sample_name = Path(csv_path).name
-                    if self.main_window:
-                        data_viewer = self.main_window.pages["session"].data_viewer
-                        data_viewer.add_sample_csv(sample_name, csv_path)
+                if code == 110 and sample:
+                    sample_name = sample.name
+                    if data_viewer is not None:
+                        data_viewer.add_sample_csv(sample_name, sample)
 
                 QMessageBox.critical(
                     self,
@@ -413,6 +419,9 @@ class ActionPanel(Panel):
 
         def on_cancel():
             self._sample_cancelled = True
+            self.app.controller.abortScan()
+            if data_viewer is not None:
+                data_viewer.clear_partial()
 
         self._sample_worker.finished.connect(on_done)
         dialog.cancelled.connect(on_cancel)
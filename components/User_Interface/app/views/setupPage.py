@@ -351,6 +351,7 @@ class ActionPanel(Panel):
         dialog = CaptureDialog(
             title="Capturing Blank",
             message="Please wait while the blank is being captured...",
+            estimate_s=self.app.controller.estimateTime("BLANK"),
             parent=self,
         )
         self._blank_worker = CaptureWorker(self.app.controller.takeBlank, filename)
@@ -9,13 +9,14 @@ Two modes:
 Both share the same SpectrumPlotWidget base.
 """
 
-import csv
-
+import numpy as np
 import pyqtgraph as pg
 from PyQt6.QtWidgets import QVBoxLayout, QFrame, QSizePolicy, QMessageBox
 from PyQt6.QtCore import Qt, QRectF
 from PyQt6.QtGui import QPainterPath, QRegion, QTransform
 
+from components.Sample import Sample
+
 # ── Palette (mirrors the rest of the UI) ─────────────────────────────────────
 BG = "#E4E4E4"
 BG_INSET = "#DCDCDC"
@@ -140,32 +141,16 @@ class SpectrumPlotWidget(QFrame):
             self._placeholder_visible = True
 
     @staticmethod
-    def _read_csv(filepath: str):
+    def _read_csv(filepath):
         """
-        Parse a two-column CSV (wavelength, absorbance).
+        Parse a two-column CSV (wavelength, absorbance) or a spectrum archive,
+        or take the points of a Sample, which loads its file only if nothing
+        has yet.
         Returns (x, y, header_row).  Raises ValueError on bad files.
         """
-        x, y, header = [], [], []
-        with open(filepath, newline="") as f:
-            reader = csv.reader(f)
-            first = next(reader, None)
-            if first:
-                try:
-                    x.append(float(first[0]))
-                    y.append(float(first[1]))
-                except (ValueError, IndexError):
-                    header = first  # first row is a text header
-            for row in reader:
-                if len(row) < 2:
-                    continue
-                try:
-                    x.append(float(row[0]))
-                    y.append(float(row[1]))
-                except ValueError:
-                    continue
-        if not x:
-            raise ValueError("No numeric data found in file.")
-        return x, y, header
+        # scans the controller just wrote come straight from its cache
+        sample = filepath if isinstance(filepath, Sample) else Sample.from_file(filepath)
+        return sample.x, sample.y, sample.header_row
 
 
 # ── Setup-page variant: single blank curve ────────────────────────────────────
@@ -221,6 +206,8 @@ class SamplePlot(SpectrumPlotWidget):
     ----------
     load_blank(filepath)          — load reference curve from CSV
     add_sample(name, x, y)        — add a named sample curve from data lists
+    extend_partial(points)        — grow the curve of the scan being acquired
+    clear_partial()               — drop that curve, e.g. when the scan ends
     clear_samples()               — remove sample curves; blank is kept
     clear_all()                   — remove everything including blank
     """
@@ -234,6 +221,8 @@ class SamplePlot(SpectrumPlotWidget):
         self._blank_curve = None
         self._sample_curves: dict = {}
         self._colour_index = 0
+        self._partial_curve = None
+        self._partial_points = np.empty((0, 2))
 
         # Legend appears automatically once curves are named
         self._legend = self.plot_widget.addLegend(offset=(10, 10))
@@ -273,11 +262,11 @@ class SamplePlot(SpectrumPlotWidget):
             ),
         )
 
-    def add_sample_csv(self, name: str, filepath: str):
+    def add_sample_csv(self, name: str, filepath):
         """
-        Load a sample curve directly from a CSV file path.
+        Load a sample curve directly from a CSV file path or a Sample.
         Convenience wrapper around add_sample() for data coming
-        straight off the instrument (as returned by runLabMachine()).
+        straight off the instrument (the Sample returned by runLabMachine()).
         """
         try:
             x, y, _ = self._read_csv(filepath)
@@ -304,6 +293,34 @@ class SamplePlot(SpectrumPlotWidget):
         )
         self._sample_curves[name] = curve
 
+    def extend_partial(self, points):
+        """
+        Append (k, 2) wavelength/absorbance rows to the scan being acquired.
+        Drawn as a dashed curve in the colour the finished sample will get;
+        connect it to the stream from runLabMachine(progress=...).
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        if not len(points):
+            return
+        self._hide_placeholder()
+        self._partial_points = np.concatenate((self._partial_points, points))
+        if self._partial_curve is None:
+            colour = COLOUR_CYCLE[self._colour_index % len(COLOUR_CYCLE)]
+            self._partial_curve = self.plot_widget.plot(
+                name="Acquiring…",
+                pen=pg.mkPen(color=colour, width=1.5, style=Qt.PenStyle.DashLine),
+            )
+        self._partial_curve.setData(self._partial_points[:, 0], self._partial_points[:, 1])
+
+    def clear_partial(self):
+        """Remove the curve of the scan being acquired, if there is one."""
+        if self._partial_curve is not None:
+            self.plot_widget.removeItem(self._partial_curve)
+            self._partial_curve = None
+        self._partial_points = np.empty((0, 2))
+        if not self._sample_curves and self._blank_curve is None:
+            self._show_placeholder()
+
     def clear_samples(self):
         """Remove all sample curves; blank reference is kept."""
         for curve in self._sample_curves.values():
@@ -323,6 +340,7 @@ class SamplePlot(SpectrumPlotWidget):
 
     def clear_all(self):
         """Remove all curves including the blank."""
+        self.clear_partial()
         self.clear_samples()
         if self._blank_curve is not None:
             self.plot_widget.removeItem(self._blank_curve)
@@ -5,7 +5,15 @@ from pathlib import Path
 import shutil
 import subprocess
 import time
-import csv
+
+import numpy as np
+
+try:
+    from Spectrum import Spectrum, write_spectrum
+    from SpectrumArchive import write_archive
+except ImportError:
+    from components.Spectrum import Spectrum, write_spectrum
+    from components.SpectrumArchive import write_archive
 
 # import os
 
@@ -56,19 +64,48 @@ class InstrumentControllerOpus:
 
     # this is a test!!!!
 
+    @staticmethod
+    def _first_data_block(ofile):
+        """
+        Returns:
+            tuple: (x, y) float64 arrays of the first OPUS data block with
+            points, or None if there is none
+        """
+        for value in ofile.iter_data():
+            x_values = getattr(value, "x", None)
+            y_values = getattr(value, "y", None)
+
+            if x_values is None or y_values is None:
+                continue
+
+            # brukeropus already gives NumPy arrays, this does not copy them
+            x_values = np.asarray(x_values, dtype=np.float64)
+            y_values = np.asarray(y_values, dtype=np.float64)
+            points = min(len(x_values), len(y_values))
+            if points:
+                return x_values[:points], y_values[:points]
+        return None
+
     def opus_to_csv(
-    self,
-    opus_filename,
-    csv_filename,
-    wave_start,
-    wave_stop,
-    saturation,
-    bandwidth
+        self,
+        opus_filename,
+        csv_filename,
+        wave_start,
+        wave_stop,
+        saturation,
+        bandwidth,
+        archive=False,
     ):
         """
         Read a native OPUS .0 file and convert it into a CSV file shaped like the
         UV-Vis controller output.
 
+        The data blocks stay NumPy arrays and every row is formatted in one
+        call, IR files have far too many points to box each one.
+
+        Args:
+            archive (bool): also write the binary spectrum archive next to the CSV
+
         Returns:
             str | None: path to the CSV file on success, None on failure
         """
@@ -83,41 +120,28 @@ class InstrumentControllerOpus:
 
             csv_path.parent.mkdir(parents=True, exist_ok=True)
 
-            ofile = OPUSFile(str(opus_path))
-            data_iter = ofile.iter_data()
-
-            output_data = None
-
-            for value in data_iter:
-                x_values = getattr(value, "x", None)
-                y_values = getattr(value, "y", None)
-
-                if x_values is None or y_values is None:
-                    continue
-
-                output_data = [
-                    [float(x), float(y)]
-                    for x, y in zip(x_values, y_values)
-                ]
-
-                if output_data:
-                    break
-
-            if not output_data:
+            block = self._first_data_block(OPUSFile(str(opus_path)))
+            if block is None:
                 print("ERROR: No usable data blocks found in:", opus_path)
                 return None
 
-            with open(csv_path, "w", newline="", encoding="utf-8") as csv_file:
-                writer = csv.writer(csv_file)
-
+            x_values, y_values = block
+            spectrum = Spectrum(
+                csv_path,
+                np.column_stack((x_values, y_values)),
                 # Match the general format expected by the other instrument controller
-                csv_file.write(f"UVVis-{wave_start}-{wave_stop}-{saturation},{bandwidth},\n")
-
-                # Header line
-                writer.writerow(["Wavelength (nm)", "Abs"])
-
-                # Data rows
-                writer.writerows(output_data)
+                header=[
+                    f"UVVis-{wave_start}-{wave_stop}-{saturation},{bandwidth},\n",
+                    "Wavelength (nm),Abs,\n",
+                ],
+                name="UVVis",
+                wave_start=float(wave_start),
+                wave_stop=float(wave_stop),
+                saturation=float(saturation),
+            )
+            write_spectrum(spectrum)
+            if archive:
+                write_archive(spectrum)
 
             return str(csv_path)
 
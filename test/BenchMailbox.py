@@ -0,0 +1,94 @@
+# This benchmarks the instrument command protocol against the simulated ADL bridge
+#
+#   python test/BenchMailbox.py [commands] [scan_delay_s]
+#
+# Runs PING and SCAN commands through InstrumentController over each stand-in
+# mailbox, then the same scans through the command queue (QSCAN), and prints
+# per-command latency and throughput.
+import contextlib
+import io
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from components.InstrumentController import InstrumentController  # noqa: E402
+from components.Mailbox import InMemoryMailbox, MappedFileMailbox  # noqa: E402
+from components.SimulatedBridge import SimulatedBridge  # noqa: E402
+
+
+def _bench(name, mailbox, folder, commands, scan_delay_s):
+    bridge = SimulatedBridge(
+        mailbox, folder=folder, delays={"SCAN": scan_delay_s}
+    ).start()
+    results = {}
+    with patch.object(InstrumentController, "MAILBOX", mailbox):
+        controller = InstrumentController(PROJECT_ROOT=folder)
+        for command in ("PING", "SCAN"):
+            latencies = []
+            for i in range(commands):
+                started = time.perf_counter()
+                # the controller traces every command, keep the report readable
+                with contextlib.redirect_stdout(io.StringIO()):
+                    if command == "PING":
+                        ok = controller.ping()
+                    else:
+                        ok = bool(controller.take_sample(f"bench_{i}.csv"))
+                latencies.append(time.perf_counter() - started)
+                assert ok, f"{name} {command} failed"
+            results[command] = latencies
+
+        # the same scans through the pipelined queue, latency is per command
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            futures = controller.queue_scans(
+                [f"queued_{i}.csv" for i in range(commands)]
+            )
+            assert all(
+                future.result() for future in futures
+            ), f"{name} queued SCAN failed"
+            elapsed = time.perf_counter() - started
+            controller.stop_queue()
+        results["QSCAN"] = [elapsed / commands] * commands
+    bridge.stop()
+    mailbox.close()
+
+    for command, latencies in results.items():
+        total = sum(latencies)
+        p95 = sorted(latencies)[int(len(latencies) * 0.95) - 1]
+        print(
+            f"{name:<22} {command:<5} "
+            f"mean={statistics.mean(latencies) * 1000:8.2f} ms  "
+            f"p95={p95 * 1000:8.2f} ms  "
+            f"{len(latencies) / total:8.1f} cmd/s"
+        )
+
+
+def main():
+    commands = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    scan_delay_s = float(sys.argv[2]) if len(sys.argv) > 2 else 0.0
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = tmp + "/"
+        _bench("memory (notify)", InMemoryMailbox(), folder, commands, scan_delay_s)
+        _bench(
+            "memory (polling)",
+            InMemoryMailbox(notify=False),
+            folder,
+            commands,
+            scan_delay_s,
+        )
+        _bench(
+            "mapped file",
+            MappedFileMailbox(Path(tmp) / "mailbox.bin"),
+            folder,
+            commands,
+            scan_delay_s,
+        )
+
+
+if __name__ == "__main__":
+    main()
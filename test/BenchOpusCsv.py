@@ -0,0 +1,106 @@
+# This benchmarks InstrumentControllerOpus.opus_to_csv on a synthetic IR spectrum
+#
+#   python test/BenchOpusCsv.py [points] [repeats]
+#
+# Feeds the converter a high-resolution spectrum in place of a real OPUS
+# file (4000-400 cm-1, 120k points by default) and compares the row by row
+# conversion it used to do with the NumPy path, with and without the binary
+# archive.
+import contextlib
+import csv
+import io
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import components.instrumentControllerOpus as opus_module  # noqa: E402
+from components.instrumentControllerOpus import InstrumentControllerOpus  # noqa: E402
+from components.Spectrum import load_spectrum  # noqa: E402
+
+
+def _synthetic_ir(points):
+    x = np.linspace(4000.0, 400.0, points)
+    y = 0.02 + sum(
+        depth * np.exp(-(((x - centre) / width) ** 2))
+        for centre, width, depth in ((2950, 30, 0.8), (1715, 12, 1.2), (1100, 40, 0.5))
+    )
+    return x, y
+
+
+class _SyntheticOPUSFile:
+    """Stands in for brukeropus.OPUSFile with one absorbance block."""
+
+    block = None
+
+    def __init__(self, filename):
+        pass
+
+    def iter_data(self):
+        yield self.block
+
+
+def _legacy_opus_to_csv(block, csv_path):
+    # what opus_to_csv did before: box every point, then csv.writer
+    output_data = [[float(x), float(y)] for x, y in zip(block.x, block.y)]
+    with open(csv_path, "w", newline="", encoding="utf-8") as csv_file:
+        writer = csv.writer(csv_file)
+        csv_file.write("UVVis-4000-400-0.1,2,\n")
+        writer.writerow(["Wavelength (nm)", "Abs"])
+        writer.writerows(output_data)
+
+
+def _time(label, repeats, run):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    print(
+        f"{label:<22} mean={statistics.mean(timings) * 1000:9.2f} ms  min={min(timings) * 1000:9.2f} ms"
+    )
+    return statistics.mean(timings)
+
+
+def main():
+    points = int(sys.argv[1]) if len(sys.argv) > 1 else 120_000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    x, y = _synthetic_ir(points)
+    _SyntheticOPUSFile.block = SimpleNamespace(x=x, y=y)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        opus_path = Path(tmp) / "sample.0"
+        opus_path.write_bytes(b"")
+        csv_path = Path(tmp) / "sample.csv"
+        controller = InstrumentControllerOpus(PROJECT_ROOT=tmp)
+
+        def convert(archive=False):
+            with contextlib.redirect_stdout(io.StringIO()):
+                assert controller.opus_to_csv(
+                    opus_path, csv_path, 4000, 400, 0.1, 2, archive=archive
+                )
+
+        print(f"{points} points, {repeats} runs")
+        with patch.object(opus_module, "OPUSFile", _SyntheticOPUSFile):
+            legacy = _time(
+                "row by row (before)",
+                repeats,
+                lambda: _legacy_opus_to_csv(_SyntheticOPUSFile.block, csv_path),
+            )
+            vectorized = _time("numpy csv", repeats, convert)
+            _time("numpy csv + archive", repeats, lambda: convert(archive=True))
+        print(f"speed-up {legacy / vectorized:.1f}x")
+
+        written = load_spectrum(csv_path, validate=False, cache=None)
+        assert np.allclose(written.waves, x) and np.allclose(written.absorbance, y)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,29 @@
 import json
-from unittest.mock import call, patch
+import os
+import threading
+import time
+from pathlib import Path
+from unittest.mock import ANY, MagicMock, patch
+
+import numpy as np
+import pytest
 
 import components.InstrumentController as instrument_module
+import components.SpectrumArchive as archive_module
 from components.InstrumentController import InstrumentController
+from components import BlankCorrection
+from components.LatencyModel import LatencyModel
+from components.Mailbox import InMemoryMailbox, MappedFileMailbox
+from components.OutputWatcher import OutputWatcher
+from components.SimulatedBridge import SimulatedBridge
+from components.Sample import Sample
+from components.Spectrum import RECENT, SpectrumFormatError, load_spectrum
+from components.SpectrumArchive import (
+    ArchiveFormatError,
+    archive_to_csv,
+    csv_to_archive,
+    read_archive,
+)
 
 
 class _RegistryKeyContext:
@@ -57,21 +78,61 @@ def test_reg_get_returns_default_when_key_missing():
     assert value == "fallback"
 
 
+class _RecordingMailbox(InMemoryMailbox):
+    """In-memory mailbox that logs every key open and value write."""
+
+    def __init__(self):
+        super().__init__()
+        self.opens = []
+        self.writes = []
+
+    def set(self, subkey, name, value):
+        self.write_batch(subkey, {name: value})
+
+    def write_batch(self, subkey, values):
+        self.opens.append(subkey)
+        self.writes += [(subkey, name, str(value)) for name, value in values.items()]
+        super().write_batch(subkey, values)
+
+
 def test_send_command_commits_in_correct_order():
+    mailbox = _RecordingMailbox()
     with (
         patch("components.InstrumentController.uuid.uuid4", return_value="cmd-123"),
-        patch.object(InstrumentController, "_reg_set") as reg_set,
+        patch.object(InstrumentController, "MAILBOX", mailbox),
     ):
-        command_id = InstrumentController._send_command("READ", {"wavelength_nm": 260})
+        command_id = InstrumentController._send_command(
+            "READ", {"Json": json.dumps({"wavelength_nm": 260}), "wavelength_nm": 260}
+        )
 
     assert command_id == "cmd-123"
-    assert reg_set.call_args_list == [
-        call(
-            InstrumentController.PARAM_KEY, "Json", json.dumps({"wavelength_nm": 260})
-        ),
-        call(InstrumentController.QUEUE_KEY, "CommandId", "cmd-123"),
-        call(InstrumentController.QUEUE_KEY, "Command", "READ"),
+    # every parameter, the Json one included, lands in the one Param batch
+    # before CommandId and Command are committed
+    assert mailbox.writes == [
+        (InstrumentController.PARAM_KEY, "Json", json.dumps({"wavelength_nm": 260})),
+        (InstrumentController.PARAM_KEY, "wavelength_nm", "260"),
+        (InstrumentController.QUEUE_KEY, "CommandId", "cmd-123"),
+        (InstrumentController.QUEUE_KEY, "Deadline", ANY),
+        (InstrumentController.QUEUE_KEY, "Command", "READ"),
+    ]
+    assert mailbox.opens == [
+        InstrumentController.PARAM_KEY,
+        InstrumentController.QUEUE_KEY,
+    ]
+
+
+def test_clear_mailbox_opens_each_subkey_once():
+    mailbox = _RecordingMailbox()
+    with patch.object(InstrumentController, "MAILBOX", mailbox):
+        InstrumentController._clear_mailbox(reset_file_counter=True)
+
+    assert mailbox.opens == [
+        InstrumentController.QUEUE_KEY,
+        InstrumentController.PARAM_KEY,
+        InstrumentController.STATE_KEY,
     ]
+    assert mailbox.get(InstrumentController.STATE_KEY, "Status") == "IDLE"
+    assert mailbox.get(InstrumentController.STATE_KEY, "FileCounter") == "0"
 
 
 def test_wait_for_reply_returns_reply_after_polling():
@@ -81,6 +142,7 @@ def test_wait_for_reply_returns_reply_after_polling():
         return reg_get_values.pop(0)
 
     with (
+        patch.object(InstrumentController, "MAILBOX", InMemoryMailbox(notify=False)),
         patch.object(InstrumentController, "_reg_get", side_effect=reg_get_side_effect),
         patch(
             "components.InstrumentController.time.time",
@@ -100,6 +162,7 @@ def test_wait_for_reply_returns_reply_after_polling():
 
 def test_wait_for_reply_times_out_when_reply_never_arrives():
     with (
+        patch.object(InstrumentController, "MAILBOX", InMemoryMailbox(notify=False)),
         patch.object(InstrumentController, "_reg_get", return_value=""),
         patch("components.InstrumentController.time.time", side_effect=[0.0, 0.5, 1.1]),
         patch("components.InstrumentController.time.sleep"),
@@ -110,6 +173,46 @@ def test_wait_for_reply_times_out_when_reply_never_arrives():
     assert "Timed out" in reply["error"]
 
 
+def test_wait_for_reply_wakes_on_state_change():
+    mailbox = InMemoryMailbox()
+
+    def reply_later():
+        time.sleep(0.05)
+        mailbox.set(InstrumentController.STATE_KEY, "Status", "OK")
+        mailbox.set(InstrumentController.STATE_KEY, "ReplyId", "cmd-123")
+
+    with (
+        patch.object(InstrumentController, "MAILBOX", mailbox),
+        patch.object(InstrumentController, "POLL_MIN_S", 60.0),
+    ):
+        bridge = threading.Thread(target=reply_later)
+        bridge.start()
+        started = time.monotonic()
+        reply = InstrumentController._wait_for_reply("cmd-123", timeout_s=5.0)
+        bridge.join()
+
+    assert reply["status"] == "OK"
+    # woken by the write, not by a poll interval
+    assert time.monotonic() - started < 1.0
+
+
+def test_wait_for_reply_polls_with_backoff_without_notifications():
+    reg_get_values = ["", "", "", "", "cmd-123", "OK", "", ""]
+    with (
+        patch.object(InstrumentController, "MAILBOX", InMemoryMailbox(notify=False)),
+        patch.object(
+            InstrumentController,
+            "_reg_get",
+            side_effect=lambda *_: reg_get_values.pop(0),
+        ),
+        patch("components.InstrumentController.time.sleep") as sleep,
+    ):
+        reply = InstrumentController._wait_for_reply("cmd-123", timeout_s=5.0)
+
+    assert reply["status"] == "OK"
+    assert [c.args[0] for c in sleep.call_args_list] == [0.01, 0.02, 0.04, 0.08]
+
+
 def test_change_params_creates_stored_params_file(tmp_path):
     fake_module_file = tmp_path / "InstrumentController.py"
     fake_module_file.write_text("# fake module path anchor", encoding="utf-8")
@@ -181,3 +284,446 @@ def test_shutdown_returns_false_on_timeout_reply():
         return_value={"status": "TIMEOUT", "result_path": "", "error": "Timed out"},
     ):
         assert controller.shutdown() is False
+
+
+@pytest.fixture(params=["memory", "mapped"])
+def simulated_instrument(request, tmp_path):
+    """An InstrumentController talking to SimulatedBridge through a stand-in mailbox."""
+    if request.param == "memory":
+        mailbox = InMemoryMailbox()
+    else:
+        mailbox = MappedFileMailbox(tmp_path / "mailbox.bin")
+    bridge = SimulatedBridge(mailbox, folder=f"{tmp_path}/scans/").start()
+    with patch.object(InstrumentController, "MAILBOX", mailbox):
+        controller = InstrumentController(PROJECT_ROOT=str(tmp_path))
+        controller.instrumentParams[
+            InstrumentController.REG_P_FILENAME
+        ] = f"{tmp_path}/scans/"
+        yield controller, bridge, mailbox
+    bridge.stop()
+    mailbox.close()
+
+
+def _relaunch(bridge):
+    """A Popen stand-in that brings the simulated bridge back once the old one has stopped."""
+
+    def popen(*args, **kwargs):
+        bridge.stop()
+        bridge.start()
+        return MagicMock(pid=1234, **{"poll.return_value": None})
+
+    return popen
+
+
+def test_commands_round_trip_through_simulated_bridge(simulated_instrument, tmp_path):
+    controller, bridge, mailbox = simulated_instrument
+
+    assert controller.ping() is True
+    assert controller.changeSettings(waveStart=700, waveStop=600) is True
+    sample = controller.take_sample("alice.csv")
+
+    assert sample == f"{tmp_path}/scans/alice.csv"
+    assert controller.validate_scan(sample)
+    assert bridge.handled == ["PING", "SETUP", "SCAN"]
+    assert mailbox.get(InstrumentController.STATE_KEY, "FileCounter") == "3"
+    assert mailbox.get(InstrumentController.QUEUE_KEY, "Command") == ""
+
+
+def test_mapped_file_mailbox_is_shared_between_instances(tmp_path):
+    writer = MappedFileMailbox(tmp_path / "mailbox.bin")
+    reader = MappedFileMailbox(tmp_path / "mailbox.bin")
+    assert reader.watch("State")
+
+    writer.set("State", "ReplyId", "cmd-1")
+
+    assert reader.wait_for_change("State", 1.0)
+    assert reader.get("State", "ReplyId") == "cmd-1"
+    assert not reader.wait_for_change("State", 0.01)
+
+    # a writer that died halfway through a write does not leave readers spinning
+    sequence = writer._sequence()
+    writer._HEADER.pack_into(writer._map, 0, writer._MAGIC, sequence + 1, 0)
+    started = time.monotonic()
+    with patch.object(reader, "READ_TIMEOUT_S", 0.2), pytest.raises(OSError):
+        reader.get("State", "ReplyId")
+    assert time.monotonic() - started < 1.0
+    writer.close()
+    reader.close()
+
+
+def test_queued_scans_run_back_to_back(simulated_instrument, tmp_path):
+    controller, bridge, mailbox = simulated_instrument
+
+    futures = controller.queue_scans(["a.csv", "b.csv", "c.csv"], setup=True)
+
+    assert futures[0].result(5) is True
+    assert [f.result(5) for f in futures[1:]] == [
+        f"{tmp_path}/scans/{name}" for name in ("a.csv", "b.csv", "c.csv")
+    ]
+    assert bridge.handled == ["SETUP", "SCAN", "SCAN", "SCAN"]
+    controller.stop_queue()
+
+
+def test_failed_command_cancels_rest_of_batch(simulated_instrument):
+    controller, bridge, mailbox = simulated_instrument
+    bridge.delays["PING"] = 0.2
+
+    first = controller.submit("PING")
+    failing, skipped = controller.submit_many([("BOGUS", {}), ("PING", {})])
+
+    assert first.result(5)["status"] == "ONLINE"
+    assert failing.result(5)["status"] == ""
+    assert skipped.cancelled()
+    assert bridge.handled == ["PING", "BOGUS"]
+    controller.stop_queue()
+
+
+def test_blank_alignment_nearest_and_linear():
+    blank_waves = np.array([903.0, 902.0, 901.0, 900.0])
+    blank_abs = np.array([0.3, 0.2, 0.1, 0.0])
+    waves = np.array([902.6, 901.5, 899.0])
+
+    nearest = BlankCorrection.align_blank(blank_waves, blank_abs, waves, "nearest")
+    linear = BlankCorrection.align_blank(blank_waves, blank_abs, waves, "linear")
+
+    assert nearest.tolist() == [0.3, 0.2, 0.0]
+    assert np.allclose(linear, [0.26, 0.15, 0.0])
+    with pytest.raises(ValueError):
+        BlankCorrection.align_blank(blank_waves, blank_abs, waves, "cubic")
+
+
+def test_scan_is_blank_corrected_in_place(simulated_instrument, tmp_path):
+    controller, bridge, mailbox = simulated_instrument
+    raw = load_spectrum(controller.take_sample("raw.csv"), cache=None).data
+    blank_path = controller.take_blank(str(tmp_path / "scans" / "blank.csv"))
+    blank = load_spectrum(blank_path, cache=None).data
+    assert controller.set_blank(blank_path)
+
+    sample = controller.take_sample("alice.csv")
+
+    lines = open(sample).read().splitlines()
+    assert lines[1] == "Wavelength (nm),Abs,"
+    assert lines[2].endswith(",")
+    corrected = load_spectrum(sample, cache=None).data
+    expected = raw[:, 1] - blank[np.searchsorted(-blank[:, 0], -raw[:, 0]), 1]
+    assert np.array_equal(corrected[:, 0], raw[:, 0])
+    assert np.allclose(corrected[:, 1], expected)
+
+
+def test_switching_blanks_reuses_parsed_arrays(simulated_instrument, tmp_path):
+    controller, bridge, mailbox = simulated_instrument
+    first = controller.take_blank(str(tmp_path / "scans" / "first.csv"))
+    second = controller.take_blank(str(tmp_path / "scans" / "second.csv"))
+    first_data = controller.blank_cache.get(first).data
+
+    with patch("builtins.open", side_effect=AssertionError("re-read")):
+        assert controller.set_blank(first)
+        assert controller.blank_data is first_data
+        assert controller.set_blank(second)
+    assert not controller.blank_data.flags.writeable
+
+    # rewriting a blank invalidates its entry
+    bridge._write_lines(second, bridge._spectrum_lines("UVVis_Blank", 1100, 190))
+    os.utime(second, ns=(0, 0))
+    assert controller.blank_cache.get(second) is None
+
+
+def test_load_spectrum_validates_while_parsing(tmp_path):
+    scan = tmp_path / "scan.csv"
+    scan.write_text(
+        "UVVis-900-898-0.1,2,\nWavelength (nm),Abs,\n900,0.5,\n\n899,0.25,\n898,0.125,\n"
+    )
+    spectrum = load_spectrum(scan, cache=None)
+    assert (spectrum.name, spectrum.wave_start, spectrum.wave_stop) == (
+        "UVVis",
+        900,
+        898,
+    )
+    assert spectrum.absorbance.tolist() == [0.5, 0.25, 0.125]
+
+    scan.write_text("UVVis-900-898-0.1,2,\nWavelength (nm),Abs,\n900,0.5,\n896,0.25,\n")
+    with pytest.raises(SpectrumFormatError):
+        load_spectrum(scan, cache=None)
+    # the plot accepts any two-column file
+    assert load_spectrum(scan, validate=False, cache=None).waves.tolist() == [900, 896]
+
+
+def test_spectrum_archive_round_trips_and_maps_without_copying(tmp_path):
+    scan = tmp_path / "scan.csv"
+    scan.write_text(
+        "UVVis-900-898-0.1,2,\nWavelength (nm),Abs,\n900,0.5,\n899,0.25,\n898,0.125,\n"
+    )
+    original = load_spectrum(scan, cache=None)
+
+    archive = csv_to_archive(scan)
+    assert archive == tmp_path / "scan.spec"
+    spectrum = read_archive(archive)
+    assert np.array_equal(spectrum.data, original.data)
+    assert (spectrum.name, spectrum.wave_start, spectrum.saturation) == (
+        "UVVis",
+        900,
+        0.1,
+    )
+    assert spectrum.validated and not spectrum.data.flags.writeable
+    # the rows are a view of the mapped file
+    assert spectrum.data.base is not None and not spectrum.data.flags.owndata
+
+    assert Sample.from_file(archive).y.tolist() == [0.5, 0.25, 0.125]
+    back = archive_to_csv(archive, tmp_path / "back.csv")
+    assert (
+        back.read_text()
+        == "UVVis-900-898-0.1,2,\nWavelength (nm),Abs,\n900,0.5,\n899,0.25,\n898,0.125,\n"
+    )
+    # the cached copy does not keep the archive mapped
+    assert RECENT.get(back).data.flags.owndata
+
+    mappings = []
+    real_mmap = archive_module.mmap.mmap
+
+    def mapping(*args, **kwargs):
+        mappings.append(real_mmap(*args, **kwargs))
+        return mappings[-1]
+
+    with patch.object(archive_module.mmap, "mmap", side_effect=mapping):
+        with pytest.raises(ArchiveFormatError):
+            read_archive(scan)
+    # a rejected file is not left mapped
+    assert len(mappings) == 1 and mappings[0].closed
+
+
+def test_output_watcher_resolves_files_written_after_the_command(tmp_path):
+    (tmp_path / "old.csv").write_text("900,0.1,\n")
+    watcher = OutputWatcher(tmp_path).start()
+    try:
+        started = time.time()
+        writer = threading.Timer(
+            0.2, (tmp_path / "renamed_by_bridge.csv").write_text, ("900,0.1,\n",)
+        )
+        writer.start()
+        # the asked-for name never appears, the newest file since the command is taken
+        found = watcher.resolve([tmp_path / "asked.csv"], since=started, timeout_s=5)
+        assert found == str(tmp_path / "renamed_by_bridge.csv")
+        assert time.time() - started < 2
+
+        # files that were already there are not mistaken for new output
+        assert watcher.recent() == [str(tmp_path / "renamed_by_bridge.csv")]
+        assert watcher.resolve([tmp_path / "missing.csv"], timeout_s=0.1) == ""
+    finally:
+        watcher.stop()
+
+
+def test_output_written_before_the_watcher_started_is_found(
+    simulated_instrument, tmp_path
+):
+    controller, bridge, mailbox = simulated_instrument
+    folder = tmp_path / "scans"
+    folder.mkdir(exist_ok=True)
+    old = folder / "old.csv"
+    old.write_text("900,0.1,\n")
+    os.utime(old, (time.time() - 60, time.time() - 60))
+
+    started = time.time()
+    # the bridge wrote a name that matches no candidate before anything watched the folder
+    (folder / "renamed_by_bridge.csv").write_text("900,0.1,\n")
+    assert controller._output_watcher is None
+    found = controller._resolve_existing_output_path(
+        Path("asked.csv"), "", started, wait_s=5
+    )
+    assert found == str(folder / "renamed_by_bridge.csv")
+    assert time.time() - started < 2
+    controller._output_watcher.stop()
+
+
+def test_scan_timeouts_are_learned_from_past_durations(simulated_instrument, tmp_path):
+    controller, bridge, mailbox = simulated_instrument
+    nominal = (
+        controller.getScanTime() * controller.TIMEOUT_MULTIPLIER
+        + controller.TIMEOUT_CONTANT
+    )
+    assert controller._command_timeout("SCAN") == nominal
+
+    bridge.delays["SCAN"] = 0.05
+    for i in range(LatencyModel.MIN_SAMPLES):
+        assert controller.take_sample(f"s{i}.csv")
+
+    learned = controller._command_timeout("SCAN")
+    assert (
+        0.05 * LatencyModel.TIMEOUT_MARGIN + LatencyModel.TIMEOUT_SLACK_S < learned < 4
+    )
+    assert 0.05 <= controller.estimateTime("SCAN") < 1
+    # the history outlives the controller
+    params = controller._latency_params("SCAN")
+    assert LatencyModel(controller.state_dir).timeout("SCAN", params, 99.0) == learned
+
+    # other settings start from the nominal formula, corrected by what was learned
+    controller.instrumentParams[controller.REG_P_WAVE_STOP] = 200
+    assert controller.estimateTime("SCAN") < controller.getScanTime()
+
+
+def test_quick_setups_do_not_shorten_the_launch_timeout(simulated_instrument, tmp_path):
+    controller, bridge, mailbox = simulated_instrument
+    for wave_start in (700, 710, 720):
+        assert controller.changeSettings(waveStart=wave_start) is True
+
+    assert controller._command_timeout("SETUP") < controller.SETUP_TIMEOUT_S
+    assert controller._command_timeout("LAUNCH") == controller.SETUP_TIMEOUT_S
+
+    with patch.object(
+        instrument_module.subprocess, "Popen", side_effect=_relaunch(bridge)
+    ):
+        assert controller.setup(reuse_bridge=False) is True
+    assert bridge.handled[-2:] == ["SHUTDOWN", "SETUP"]
+    history = LatencyModel(controller.state_dir)
+    assert history.estimate("LAUNCH", {}) is not None
+    assert controller._command_timeout("LAUNCH") == controller.SETUP_TIMEOUT_S
+
+
+def test_timed_out_commands_loosen_the_learned_timeout(simulated_instrument):
+    controller, bridge, mailbox = simulated_instrument
+    model = controller.latency
+    for seconds in (0.4, 0.5, 0.6):
+        model.record("SETUP", {}, seconds)
+    tight = controller._command_timeout("SETUP")
+    assert tight < 4
+
+    # the bridge took longer than that once, the next wait is longer
+    with patch.object(
+        controller, "_wait_for_reply", return_value={"status": "TIMEOUT"}
+    ):
+        assert controller.changeSettings(waveStart=650) is False
+    assert controller._command_timeout("SETUP") >= tight * LatencyModel.CENSORED_BACKOFF
+
+
+def test_setup_only_sends_settings_not_in_effect(simulated_instrument):
+    controller, bridge, mailbox = simulated_instrument
+    with patch.object(
+        controller, "_send_and_wait", wraps=controller._send_and_wait
+    ) as sent:
+        assert controller.changeSettings(waveStart=700, waveStop=600) is True
+        assert controller.changeSettings(waveStart="700", waveStop="600") is True
+        assert controller.resetSettings() is True
+        assert controller.changeSettings(force=True) is True
+
+    setups = [c.args[1] for c in sent.call_args_list]
+    assert setups[0] == {
+        controller.REG_P_WAVE_START: 700,
+        controller.REG_P_WAVE_STOP: 600,
+    }
+    # the second apply was already in effect, the reset only moved the range
+    assert setups[1] == {
+        controller.REG_P_WAVE_START: 900,
+        controller.REG_P_WAVE_STOP: 300,
+    }
+    assert setups[2] == controller.instrumentParams
+    assert bridge.handled == ["SETUP", "SETUP", "SETUP"]
+    assert (bridge.wave_start, bridge.wave_stop) == (900, 300)
+
+
+def test_queued_setup_sends_only_changed_settings(simulated_instrument):
+    controller, bridge, mailbox = simulated_instrument
+    assert controller.changeSettings(waveStart=700, waveStop=600) is True
+    controller.instrumentParams[controller.REG_P_SATURATION] = 0.2
+
+    with patch.object(
+        controller, "_send_and_wait", wraps=controller._send_and_wait
+    ) as sent:
+        # the second SETUP is worked out after the first is in effect
+        futures = [controller.queue_setup(), controller.queue_setup()]
+        assert [f.result(5) for f in futures] == [True, True]
+
+    assert [c.args[1] for c in sent.call_args_list] == [
+        {controller.REG_P_SATURATION: 0.2}
+    ]
+    assert sent.call_args.kwargs["timeout_s"] == controller._command_timeout("SETUP")
+    assert bridge.handled == ["SETUP", "SETUP"]
+    assert bridge.saturation == 0.2
+    controller.stop_queue()
+
+
+def test_setup_reattaches_to_a_live_bridge_and_shutdown_stops_it(simulated_instrument):
+    controller, bridge, mailbox = simulated_instrument
+    with patch.object(instrument_module.subprocess, "Popen") as popen:
+        assert controller.setup() is True
+        # an app restart finds the same bridge with the settings in effect
+        restarted = InstrumentController(PROJECT_ROOT=controller.PROJECT_ROOT)
+        restarted.instrumentParams = dict(controller.instrumentParams)
+        assert restarted.setup() is True
+    popen.assert_not_called()
+    assert bridge.handled == ["SETUP"]
+
+    assert restarted.shutdown() is True
+    assert bridge.handled[-1] == "SHUTDOWN"
+    assert restarted._bridge_alive(wait_s=0.3) is False
+
+
+def test_bridge_that_died_mid_scan_is_killed_and_relaunched(simulated_instrument):
+    controller, bridge, mailbox = simulated_instrument
+    state = controller.STATE_KEY
+    assert controller.setup() is True
+    bridge.stop()
+    # the bridge died while BUSY, leaving its last heartbeat behind
+    mailbox.write_batch(
+        state,
+        {"Status": "BUSY", "Heartbeat": "41", "BusyUntil": f"{time.time() + 60:.3f}"},
+    )
+    assert controller._bridge_alive(wait_s=0.3) is True
+    mailbox.write_batch(state, {"BusyUntil": f"{time.time() - 60:.3f}"})
+    assert controller._bridge_alive(wait_s=0.3) is False
+
+    hung = MagicMock(pid=4321, **{"poll.return_value": None})
+    controller._adl_process = hung
+    with (
+        patch.object(controller, "SHUTDOWN_TIMEOUT_S", 0.3),
+        patch.object(instrument_module.subprocess, "run") as run,
+        patch.object(
+            instrument_module.subprocess, "Popen", side_effect=_relaunch(bridge)
+        ),
+    ):
+        assert controller.ensure_bridge() is True
+    run.assert_called_once()
+    assert run.call_args.args[0] == ["taskkill", "/T", "/F", "/PID", "4321"]
+    assert controller._adl_process is not hung
+    assert controller._bridge_alive(wait_s=2) is True
+
+
+def test_stream_sample_yields_points_while_scanning_and_aborts_on_close(
+    simulated_instrument, tmp_path
+):
+    controller, bridge, mailbox = simulated_instrument
+    assert controller.can_abort() is False
+    bridge.stream = True
+    assert controller.can_abort() is True
+    bridge.delays["SCAN"] = 0.5
+
+    stream = controller.stream_sample("live.csv", poll_s=0.02)
+    chunks = []
+    while True:
+        try:
+            chunks.append(next(stream))
+        except StopIteration as done:
+            sample = done.value
+            break
+
+    assert sample == f"{tmp_path}/scans/live.csv"
+    assert len(chunks) > 1
+    streamed = np.concatenate(chunks)
+    final = load_spectrum(sample, validate=False, cache=None).data
+    assert np.allclose(streamed, final[: len(streamed)])
+    assert not Path(sample + InstrumentController.PARTIAL_SUFFIX).exists()
+
+    # closing the stream part way stops the scan on the bridge
+    bridge.delays["SCAN"] = 5.0
+    stream = controller.stream_sample("bad.csv", poll_s=0.02)
+    first = next(stream)
+    started = time.monotonic()
+    stream.close()
+    assert len(first) < 101
+    assert controller.abort_scan() is False
+    # the next command only runs once the bridge has given up the scan
+    assert controller.submit("PING").result(3)["status"] == "ONLINE"
+    assert time.monotonic() - started < 2.0
+    assert not Path(f"{tmp_path}/scans/bad.csv").exists()
+    assert not Path(
+        f"{tmp_path}/scans/bad.csv" + InstrumentController.PARTIAL_SUFFIX
+    ).exists()
+    controller.stop_queue()
@@ -1 +1,436 @@
 # This code tests the server components
+import gzip
+import json
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import pytest
+
+from components.Sample import Sample
+from components.ServerController import ServerController
+from components.StagedSample import sidecar_path
+from components.StagingIndex import StagingIndex
+from components.UploadDaemon import UploadDaemon
+
+
+class _StandInICN:
+    """
+    Local stand-in for the ICN REST API so uploads can be exercised and
+    benchmarked offline. Records every request it receives.
+    """
+
+    def __init__(self, batch_route: bool = True):
+        self.batch_route = batch_route
+        self.requests = []
+        self.wire_bytes = 0
+        # client (host, port) of each request, one port per kept-alive connection
+        self.clients = []
+        # route -> status to fail it with, e.g. {"connection-check": 503}
+        self.failing = {}
+        self.expires_on = "2099-01-01T00:00:00Z"
+        # username -> Event the user-session reply waits on, to stall a login
+        self.login_gates = {}
+        # answer unknown routes with a generic 200 like older ICN builds
+        self.generic_ok = False
+        # False answers gzipped bodies with 415 like a server without gzip support
+        self.gzip_ok = True
+        self._lock = threading.Lock()
+
+    def handle(self, path: str, body: dict, client=None):
+        route = urlparse(path).path.rsplit("/", 1)[-1]
+        with self._lock:
+            self.requests.append((route, body))
+            self.clients.append(client)
+
+        if route in self.failing:
+            return self.failing[route], {"error": "unavailable"}
+        if route == "connection-check":
+            return 200, {"STATUS": "alive"}
+        if route == "user-session":
+            gate = self.login_gates.get(body["studentUserName"])
+            if gate is not None:
+                gate.wait(5)
+            return 200, {
+                "success": True,
+                "sessionUUID": f"uuid-{body['studentUserName']}",
+                "expiresOn": self.expires_on,
+            }
+        if route == "instrument-data-upload":
+            return 200, {"success": True}
+        if route == ServerController.BATCH_LINK_END and self.batch_route:
+            return 200, {
+                "success": True,
+                "results": [{"success": True} for _ in body["samples"]],
+            }
+        if self.generic_ok:
+            return 200, {"success": False, "message": "unknown request"}
+        return 404, {"error": "not found"}
+
+    def count(self, route: str) -> int:
+        return sum(1 for r, _ in self.requests if r == route)
+
+
+def _make_handler(icn):
+    class _Handler(BaseHTTPRequestHandler):
+        # keep connections open like ICN does, so pooling can be observed
+        protocol_version = "HTTP/1.1"
+
+        def _reply(self, body, status=None):
+            if status is None:
+                status, payload = icn.handle(self.path, body, self.client_address)
+            else:
+                payload = {"error": "unsupported"}
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self._reply({})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            raw = self.rfile.read(length)
+            icn.wire_bytes += len(raw)
+            if self.headers.get("Content-Encoding") == "gzip":
+                if not icn.gzip_ok:
+                    self._reply({}, status=415)
+                    return
+                raw = gzip.decompress(raw)
+            self._reply(json.loads(raw or b"{}"))
+
+        def log_message(self, *_args):
+            pass
+
+    return _Handler
+
+
+@pytest.fixture
+def icn_server(request):
+    """Runs a stand-in ICN on localhost; parametrize with batch_route=False to drop the batch route."""
+    icn = _StandInICN(batch_route=getattr(request, "param", True))
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _make_handler(icn))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    icn.url = (
+        f"http://127.0.0.1:{httpd.server_address[1]}/spectra/api/"
+        "{link_end}?key={api_key}"
+    )
+    yield icn
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def controller(icn_server, tmp_path):
+    server = ServerController(PROJECT_ROOT=str(tmp_path))
+    server.api_key = "test-key"
+    server.api_url = icn_server.url
+    server.file_dir = str(tmp_path)
+    yield server
+    server.close()
+
+
+def test_pooled_session_reuses_one_connection(controller, icn_server):
+    session = controller.session
+
+    assert controller.ping() is True
+    assert controller.login("alice")
+    assert controller.ping() is True
+
+    assert controller.session is session
+    assert len(icn_server.clients) == 3
+    assert len(set(icn_server.clients)) == 1
+
+
+def test_only_get_and_head_requests_are_retried(icn_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(ServerController, "RETRY_BACKOFF_S", 0)
+    server = ServerController(PROJECT_ROOT=str(tmp_path), max_retries=2)
+    icn_server.failing = {"connection-check": 503, "user-session": 503}
+    url = icn_server.url.format(link_end="{}", api_key="test-key")
+
+    assert server.session.get(url.format("connection-check")).status_code == 503
+    assert server.session.post(url.format("user-session"), json={}).status_code == 503
+    server.close()
+
+    # the GET is tried once plus twice more, the POST only once
+    assert icn_server.count("connection-check") == 3
+    assert icn_server.count("user-session") == 1
+
+
+def test_session_is_refreshed_before_it_expires(controller, icn_server):
+    margin = ServerController.SESSION_REFRESH_MARGIN_S
+    soon = datetime.now(timezone.utc) + timedelta(seconds=margin / 2)
+    icn_server.expires_on = soon.isoformat()
+
+    assert controller._session_for("alice") == "uuid-alice"
+    # inside the refresh margin, so the next upload logs in again
+    icn_server.expires_on = "2099-01-01T00:00:00Z"
+    assert controller._session_for("alice") == "uuid-alice"
+    assert icn_server.count("user-session") == 2
+
+    # a session well clear of expiry is reused
+    assert controller._session_for("alice") == "uuid-alice"
+    assert icn_server.count("user-session") == 2
+    assert controller._sessions["alice"]["expiresOn"] == "2099-01-01T00:00:00Z"
+
+
+def test_slow_login_does_not_block_other_owners(controller, icn_server):
+    gate = icn_server.login_gates["alice"] = threading.Event()
+    slow = threading.Thread(target=controller._session_for, args=("alice",))
+    slow.start()
+    try:
+        while icn_server.count("user-session") == 0:
+            threading.Event().wait(0.01)
+        # alice's login is still in flight, bob logs in alongside it
+        assert controller._session_for("bob") == "uuid-bob"
+        assert slow.is_alive()
+    finally:
+        gate.set()
+        slow.join(5)
+    assert controller._cached_session("alice")["uuid"] == "uuid-alice"
+
+
+def _stage(directory, owner, count, points=10):
+    for i in range(count):
+        rows = [json.dumps({"instrument-type": "uv-vis"})]
+        rows += [json.dumps({"nm": 900 - n, "abs": 0.1 * n}) for n in range(points)]
+        staged = directory / f"{owner}_2025-01-01T12-00-{i:02d}_unsent.json"
+        staged.write_text("[\n" + ",\n".join(rows) + "\n]", encoding="utf-8")
+
+
+def test_send_all_data_batches_each_owner_into_one_request(
+    controller, icn_server, tmp_path
+):
+    _stage(tmp_path, "alice", 5)
+    _stage(tmp_path, "bob", 3)
+
+    results = controller.send_all_data(batch=True)
+
+    assert len(results) == 8
+    assert all(ok for _, ok in results)
+    assert icn_server.count(ServerController.BATCH_LINK_END) == 2
+    assert icn_server.count("instrument-data-upload") == 0
+    assert icn_server.count("user-session") == 2
+    assert len(list(tmp_path.glob("sent/*_sent.json"))) == 8
+    assert not list(tmp_path.glob("*_unsent.json"))
+
+
+def test_concurrent_send_all_data_uploads_each_file_once(
+    controller, icn_server, tmp_path
+):
+    _stage(tmp_path, "alice", 4)
+    _stage(tmp_path, "bob", 3)
+    staged = sorted(p.name for p in tmp_path.glob("*_unsent.json"))
+
+    results = controller.send_all_data(max_workers=2)
+
+    assert sorted(name for name, _ in results) == staged
+    assert all(ok for _, ok in results)
+    uploads = [
+        body for route, body in icn_server.requests if route == "instrument-data-upload"
+    ]
+    assert len(uploads) == 7
+    assert sum(1 for body in uploads if body["sessionUUID"] == "uuid-alice") == 4
+    assert sum(1 for body in uploads if body["sessionUUID"] == "uuid-bob") == 3
+    assert icn_server.count("user-session") == 2
+    assert (
+        sorted(
+            p.name.replace("_sent", "_unsent")
+            for p in tmp_path.glob("sent/*_sent.json")
+        )
+        == staged
+    )
+    assert not list(tmp_path.glob("*_unsent.json"))
+    assert controller.send_all_data(max_workers=2) == []
+
+
+def test_send_batch_splits_chunks_at_size_cap(controller, icn_server, tmp_path):
+    _stage(tmp_path, "alice", 6)
+    controller.BATCH_MAX_SAMPLES = 2
+
+    results = controller.send_all_data(batch=True)
+
+    assert all(ok for _, ok in results)
+    assert icn_server.count(ServerController.BATCH_LINK_END) == 3
+
+
+@pytest.mark.parametrize("icn_server", [False], indirect=True)
+def test_send_batch_falls_back_to_per_file_posts(controller, icn_server, tmp_path):
+    _stage(tmp_path, "alice", 4)
+
+    results = controller.send_all_data(batch=True)
+
+    assert all(ok for _, ok in results)
+    assert controller.batch_supported is False
+    assert icn_server.count(ServerController.BATCH_LINK_END) == 1
+    assert icn_server.count("instrument-data-upload") == 4
+
+
+@pytest.mark.parametrize("icn_server", [False], indirect=True)
+def test_generic_reply_to_batch_route_falls_back_to_per_file_posts(
+    controller, icn_server, tmp_path
+):
+    icn_server.generic_ok = True
+    _stage(tmp_path, "alice", 3)
+
+    results = controller.send_all_data(batch=True)
+
+    assert all(ok for _, ok in results)
+    assert controller.batch_supported is False
+    assert icn_server.count(ServerController.BATCH_LINK_END) == 1
+    assert icn_server.count("instrument-data-upload") == 3
+
+
+def test_parse_csv_stages_json_and_sidecar_with_same_points(controller, tmp_path):
+    csv_path = tmp_path / "alice2025-01-01T12-00-00.csv"
+    csv_path.write_text(
+        "UVVis-900-300-0.1,2,\nWavelength (nm),Abs,\n900,0.5,\n899,0.25,\n\n898,0.125,\n",
+        encoding="utf-8",
+    )
+    controller.user = "alice"
+
+    assert controller.parse_csv(str(csv_path)) is True
+
+    staged = tmp_path / "alice_2025-01-01T12-00-00_unsent.json"
+    from_json = json.loads(staged.read_text(encoding="utf-8"))
+    assert from_json[0] == {"instrument-type": "uv-vis"}
+    assert from_json[1:] == [
+        {"nm": 900.0, "abs": 0.5},
+        {"nm": 899.0, "abs": 0.25},
+        {"nm": 898.0, "abs": 0.125},
+    ]
+
+    sample = controller._load_staged(staged)
+    assert sample["instrument-type"] == "uv-vis"
+    assert sample["dataArray"] == from_json[1:]
+
+
+def test_sample_is_loaded_once_and_staged_from_memory(controller, tmp_path):
+    csv_path = tmp_path / "alice2025-01-01T12-00-01.csv"
+    csv_path.write_text(
+        "UVVis-900-898-0.1,2,\nWavelength (nm),Abs,\n900,0.5,\n899,0.25,\n898,0.125,\n",
+        encoding="utf-8",
+    )
+    controller.user = "alice"
+
+    sample = Sample.from_file(csv_path)
+    assert not sample.loaded
+    assert sample.y.tolist() == [0.5, 0.25, 0.125]
+    assert sample.type == "uv-vis" and sample.interval == 1.0
+
+    # staging uses the loaded points, not the file
+    csv_path.unlink()
+    assert controller.parse_csv(sample) is True
+    staged = Sample.from_file(tmp_path / "alice_2025-01-01T12-00-01_unsent.json")
+    assert staged.x.tolist() == [900.0, 899.0, 898.0]
+    assert staged.type == "uv-vis"
+
+    # without the sidecar the staged JSON itself is read
+    sidecar_path(staged.path).unlink()
+    from_json = Sample.from_file(staged.path)
+    assert from_json.y.tolist() == sample.y.tolist()
+    assert not hasattr(sample, "__dict__")
+
+    # files staged by older versions have no commas between the rows
+    legacy = tmp_path / "bob_2024-12-31T09-00-00_unsent.json"
+    legacy.write_text(
+        '[\n{"instrument-type": "uv-vis"},\n{"nm": 900, "abs": 0.5}\n{"nm": 899, "abs": 0.25}\n]',
+        encoding="utf-8",
+    )
+    old = Sample.from_file(legacy)
+    assert old.x.tolist() == [900.0, 899.0] and old.y.tolist() == [0.5, 0.25]
+    assert old.type == "uv-vis"
+
+
+def test_large_upload_is_gzipped_and_counted(controller, icn_server, tmp_path):
+    _stage(tmp_path, "alice", 1, points=900)
+    controller.compress_uploads = True
+    controller.columnar_uploads = True
+
+    results = controller.send_all_data()
+
+    assert results == [("alice_2025-01-01T12-00-00_unsent.json", True)]
+    _, body = next(r for r in icn_server.requests if r[0] == "instrument-data-upload")
+    assert len(body["dataColumns"]["nm"]) == 900
+    assert "dataArray" not in body
+
+    metrics = controller.transfer_metrics()
+    assert metrics["compressed"] == 1
+    assert metrics["wire_bytes"] < metrics["raw_bytes"]
+    assert icn_server.wire_bytes >= metrics["wire_bytes"]
+
+
+def test_only_large_uploads_go_columnar_and_gzip_is_opt_in(
+    controller, icn_server, tmp_path
+):
+    assert controller.compress_uploads is False
+    controller.columnar_uploads = True
+    _stage(tmp_path, "alice", 1, points=900)
+    _stage(tmp_path, "bob", 1, points=10)
+
+    controller.send_all_data()
+
+    bodies = [
+        body for route, body in icn_server.requests if route == "instrument-data-upload"
+    ]
+    assert [
+        len(body["dataColumns"]["nm"]) for body in bodies if "dataColumns" in body
+    ] == [900]
+    assert [len(body["dataArray"]) for body in bodies if "dataArray" in body] == [10]
+    assert controller.transfer_metrics()["compressed"] == 0
+
+
+def test_refused_gzip_is_resent_uncompressed(controller, icn_server, tmp_path):
+    icn_server.gzip_ok = False
+    controller.compress_uploads = True
+    _stage(tmp_path, "alice", 2, points=900)
+
+    results = controller.send_all_data(batch=False)
+
+    assert all(ok for _, ok in results) and len(results) == 2
+    assert controller.compress_uploads is False
+    # only the first upload tried gzip
+    metrics = controller.transfer_metrics()
+    assert metrics["compressed"] == 1
+    assert metrics["requests"] == 3
+
+
+def test_upload_daemon_backs_off_and_persists_queue(controller, icn_server, tmp_path):
+    _stage(tmp_path, "alice", 1)
+    daemon = UploadDaemon(controller)
+    icn_url = controller.api_url
+    controller.api_url = "http://127.0.0.1:9/spectra/api/{link_end}?key={api_key}"
+
+    assert daemon.run_once() == [("alice_2025-01-01T12-00-00_unsent.json", False)]
+    controller.close()
+    reopened = StagingIndex(tmp_path)
+    [row] = reopened.pending()
+    assert row["state"] == StagingIndex.STATE_FAILED
+    assert row["attempts"] == 1
+    reopened.close()
+    # still backing off, nothing is due yet
+    assert daemon.run_once() == []
+
+    controller.api_url = icn_url
+    assert daemon.run_once(force=True) == [
+        ("alice_2025-01-01T12-00-00_unsent.json", True)
+    ]
+    assert daemon.pending() == {}
+
+
+def test_staging_index_migrates_existing_files_once(tmp_path):
+    _stage(tmp_path, "alice", 2)
+    (tmp_path / "bob_2024-12-31T09-00-00_sent.json").write_text("[]")
+    (tmp_path / "notes.txt").write_text("not staged")
+
+    index = StagingIndex(tmp_path)
+
+    assert index.counts() == {"unsent": 2, "sent": 1}
+    assert [row["owner"] for row in index.pending()] == ["alice", "alice"]
+    assert index.migrate() == 0
+    index.close()
@@ -1,2 +1,251 @@
 # This tests the system controller
 # Integration Testing
+import threading
+import time
+
+from components.AsyncSystemController import AsyncSystemController
+from components.HealthMonitor import HealthMonitor
+from components.SystemController import SystemController
+
+
+class _FakeServer:
+    def __init__(self, PROJECT_ROOT, file_dir=None, debug=False):
+        self.user = "alice"
+        self.file_dir = file_dir
+        self.events = []
+        self.upload_started = threading.Event()
+        self.release_upload = threading.Event()
+
+    def connect(self):
+        return True
+
+    def parse_csv(self, csv_path, username=None):
+        return True
+
+    def login(self, username):
+        self.events.append(("login", username))
+        self.user = username
+        return True
+
+    def is_logged_in(self):
+        return bool(self.user)
+
+    def logout(self):
+        self.events.append(("logout", self.user))
+        self.user = None
+        return True
+
+    def send_all_data(self, max_workers=1):
+        self.events.append("upload")
+        self.upload_started.set()
+        self.release_upload.wait(5)
+        return []
+
+    def close(self):
+        pass
+
+
+class _FakeInstrument:
+    def __init__(self, PROJECT_ROOT=None, debug=False):
+        self.scans = []
+
+    def setup(self):
+        return True
+
+    def ping(self):
+        return True
+
+    def take_sample(self, filename=None):
+        self.scans.append(filename)
+        return filename or "sample.csv"
+
+    def shutdown(self):
+        return True
+
+
+def _async_controller(tmp_path):
+    system = SystemController(
+        str(tmp_path),
+        server_controller_cls=_FakeServer,
+        instrument_controller_cls=_FakeInstrument,
+        file_dir=str(tmp_path),
+        debug=False,
+    )
+    return AsyncSystemController(system_controller=system)
+
+
+def test_scan_runs_while_previous_sample_uploads(tmp_path):
+    controller = _async_controller(tmp_path)
+    server = controller.system.ServController
+
+    first = controller.runLabMachine()
+    assert server.upload_started.wait(5)
+    # the first upload is still blocked, the second scan and a health check still finish
+    scans = controller.system.InstController.scans
+    second = controller.runLabMachine()
+    assert controller.checkServer().result(5) is True
+    assert controller.takeSample().result(5)[0] == 0
+    assert len(scans) == 3
+
+    server.release_upload.set()
+    assert first.result(5)[0] == 110
+    assert second.result(5)[0] == 110
+    assert controller.stopProgram().result(5) == 0
+
+
+def test_cancelled_run_skips_its_upload(tmp_path):
+    controller = _async_controller(tmp_path)
+    server = controller.system.ServController
+
+    first = controller.runLabMachine()
+    assert server.upload_started.wait(5)
+    second = controller.runLabMachine()
+    assert controller.cancel(second) is True
+
+    server.release_upload.set()
+    first.result(5)
+    assert second.cancelled()
+    controller.stopProgram().result(5)
+    assert server.events == ["upload"]
+
+
+def test_aborted_scan_is_neither_staged_nor_uploaded(tmp_path):
+    system = _async_controller(tmp_path).system
+    server = system.ServController
+    staged = []
+    server.parse_csv = lambda sample, username=None: staged.append(sample)
+    server.release_upload.set()
+    assert system.canAbortScan() is False
+
+    # a bridge that cannot stop Collect still finishes the scan after the abort
+    instrument = system.InstController
+    take_sample = instrument.take_sample
+    instrument.take_sample = lambda filename: system.abortScan() or take_sample(
+        filename
+    )
+    assert system.runLabMachine() == (410, None)
+    assert len(instrument.scans) == 1
+    assert staged == [] and server.events == []
+
+    # the next scan is not affected
+    instrument.take_sample = take_sample
+    assert system.runLabMachine()[0] == 110
+    assert len(staged) == 1
+
+
+def test_cancelling_an_uploading_run_does_not_abort_the_next_scan(tmp_path):
+    controller = _async_controller(tmp_path)
+    server = controller.system.ServController
+    instrument = controller.system.InstController
+    aborts = []
+    instrument.abort_scan = lambda: aborts.append(True) or True
+    scanning = threading.Event()
+    release_scan = threading.Event()
+    take_sample = instrument.take_sample
+
+    def slow_take_sample(filename):
+        scanning.set()
+        release_scan.wait(5)
+        return take_sample(filename)
+
+    first = controller.runLabMachine()
+    assert server.upload_started.wait(5)
+    instrument.take_sample = slow_take_sample
+    second = controller.runLabMachine()
+    assert scanning.wait(5)
+    # the first run is past its scan, cancelling it only drops its upload
+    assert controller.cancel(first) is True
+    assert aborts == []
+
+    third = controller.runLabMachine()
+    release_scan.set()
+    server.release_upload.set()
+    assert second.result(5)[0] == 110
+
+    # cancelling a run while it scans does stop its scan
+    scanning.clear()
+    release_scan.clear()
+    fourth = controller.runLabMachine()
+    assert third.result(5)[0] == 110
+    assert scanning.wait(5)
+    assert controller.cancel(fourth) is True
+    release_scan.set()
+    controller.stopProgram().result(5)
+    assert aborts == [True]
+
+
+def test_sample_is_staged_for_its_user_when_another_signs_in(tmp_path):
+    controller = _async_controller(tmp_path)
+    server = controller.system.ServController
+    staged = []
+    server.parse_csv = lambda sample, username=None: staged.append(username) or True
+
+    first = controller.runLabMachine()
+    assert server.upload_started.wait(5)
+    # alice signs out behind her upload, bob signs in straight after
+    signed_out = controller.signOut()
+    signed_in = controller.signIn("bob")
+    server.release_upload.set()
+
+    assert first.result(5)[0] == 110
+    assert signed_out.result(5) == 0
+    assert signed_in.result(5) == 0
+    assert staged == ["alice"]
+    assert [event for event in server.events if event != "upload"] == [
+        ("logout", "alice"),
+        ("login", "bob"),
+    ]
+    assert server.user == "bob"
+    controller.stopProgram().result(5)
+
+
+def test_health_checks_are_cached_between_commands(tmp_path):
+    controller = _async_controller(tmp_path)
+    system = controller.system
+    pings = []
+    system.InstController.ping = lambda: pings.append("ping") or True
+
+    assert controller.takeSample().result(5)[0] == 0
+    assert controller.takeSample().result(5)[0] == 0
+    assert system._server_ready() and system._server_ready()
+
+    assert pings == ["ping"]
+    assert system.Health.status()["server"]["ok"] is True
+    system.Health.invalidate("instrument")
+    assert system._instrument_ready()
+    assert pings == ["ping", "ping"]
+    controller.stopProgram().result(5)
+
+
+def test_instrument_probe_does_not_relaunch_the_bridge(tmp_path):
+    system = _async_controller(tmp_path).system
+    instrument = system.InstController
+    relaunched = []
+    instrument.ping = lambda: False
+    instrument.ensure_bridge = lambda: relaunched.append(True) or True
+
+    assert system._probe_instrument() is False
+    assert relaunched == []
+
+
+def test_health_monitor_only_refreshes_when_asked():
+    probes = []
+    probed = threading.Event()
+    monitor = HealthMonitor()
+    monitor.add_target(
+        "instrument", lambda: probes.append(1) or probed.set() or True, 0.05
+    )
+    monitor.mark("instrument", True)
+    monitor.start()
+
+    # stale, but nobody is asking
+    assert not probed.wait(0.3)
+    assert probes == []
+
+    # a stale "up" is answered at once and refreshed once behind the caller
+    assert monitor.is_ready("instrument") is True
+    assert probed.wait(2)
+    time.sleep(0.2)
+    assert probes == [1]
+    monitor.stop()
+    assert not monitor.running()